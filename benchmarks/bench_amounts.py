@@ -0,0 +1,107 @@
+"""
+Benchmark and check: exact totals in integer minor units. Builds a synthetic
+ledger, computes the expected per-currency totals with exact decimal arithmetic
+from the generator, and compares them with the integer SQL sum, the
+trigger-maintained ledger_totals and the int64 LedgerColumns sums. It also
+shows how far float sums (SUM(amount), a Python float loop) drift from the
+exact totals. Exits with status 1 if any integer total is off.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_amounts --rows 10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import SyntheticLedger, cached_ledger
+from utils.currencies import currency_exponent
+from utils.ledger_columns import LedgerColumns
+
+
+def expected_totals(ledger):
+    """{(currency, type): (count, total_minor)} computed with Decimal from the generated amounts."""
+    quanta = {}
+    totals = {}
+    for amount, _, currency, t_type, _, _ in ledger.iter_rows():
+        quantum = quanta.get(currency)
+        if quantum is None:
+            quantum = quanta[currency] = Decimal(1).scaleb(-currency_exponent(currency))
+        minor = int(Decimal(repr(amount)).quantize(quantum, rounding=ROUND_HALF_UP) / quantum)
+        count, total = totals.get((currency, t_type), (0, 0))
+        totals[(currency, t_type)] = (count + 1, total + minor)
+    return totals
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<44}{(time.perf_counter() - start) * 1000:>10.1f} ms")
+    return result
+
+
+def run(rows):
+    ledger = SyntheticLedger(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Preparing a {rows}-row ledger...")
+        database.DB_FILE = cached_ledger(ledger, os.path.join(tmp, "bench.db"))
+        conn = database.get_connection()
+        print("Computing the expected totals with Decimal...")
+        expected = expected_totals(ledger)
+
+        print("\nTimings:")
+        integer_sql = timed("SUM(amount_minor) over every row", lambda: {
+            (currency, t_type): (count, total) for currency, t_type, count, total in conn.execute(
+                "SELECT currency, transaction_type, COUNT(*), SUM(amount_minor) FROM transactions GROUP BY 1, 2")
+        })
+        float_sql = timed("SUM(amount) over every row (float)", lambda: {
+            (currency, t_type): total for currency, t_type, total in conn.execute(
+                "SELECT currency, transaction_type, SUM(amount) FROM transactions GROUP BY 1, 2")
+        })
+        maintained = timed("ledger_totals (trigger-maintained)", lambda: {
+            (currency, t_type): (count, total) for currency, t_type, count, total in conn.execute(
+                "SELECT currency, transaction_type, tx_count, total_minor FROM ledger_totals")
+        })
+
+        def float_loop():
+            totals = {}
+            for currency, t_type, amount in conn.execute("SELECT currency, transaction_type, amount FROM transactions"):
+                totals[(currency, t_type)] = totals.get((currency, t_type), 0.0) + float(amount)
+            return totals
+        python_floats = timed("Python float loop (the old per-row sum)", float_loop)
+
+        def int64_totals(columns):
+            currencies, credits, debits = columns.totals_minor()
+            totals = {}
+            for currency, credit, debit in zip(currencies, credits.tolist(), debits.tolist()):
+                totals[(currency, "credit")], totals[(currency, "debit")] = credit, debit
+            return totals
+        daily = timed("int64 vectors from ledger_daily", lambda: int64_totals(LedgerColumns.from_daily_totals()))
+        raw = timed("int64 vectors from every row", lambda: int64_totals(LedgerColumns.from_transactions()))
+
+        print(f"\n{'currency/type':<16}{'expected (minor)':>20}{'float SUM drift':>18}{'float loop drift':>18}  integer sums")
+        failures = 0
+        for key in sorted(expected):
+            count, total = expected[key]
+            scale = 10 ** currency_exponent(key[0])
+            checks = {"SQL": integer_sql.get(key), "ledger_totals": maintained.get(key),
+                      "ledger_daily": (count, daily.get(key)), "rows": (count, raw.get(key))}
+            wrong = [name for name, value in checks.items() if value != (count, total)]
+            failures += len(wrong)
+            print(f"{'/'.join(key):<16}{total:>20}{float_sql[key] * scale - total:>18.4f}"
+                  f"{python_floats[key] * scale - total:>18.4f}  {'exact' if not wrong else 'WRONG: ' + ', '.join(wrong)}")
+        database.close_connections()
+    print("\nAll integer totals are exact." if not failures else f"\n{failures} integer totals differ from the expected ones.")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Ledger size")
+    args = parser.parse_args()
+    raise SystemExit(1 if run(args.rows) else 0)
@@ -0,0 +1,89 @@
+"""
+Benchmark: the vectorized LedgerColumns engine against the per-row Python loop
+that generate_analysis_plot used before it.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_analysis --rows 1000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import populate
+from database import DEFAULT_EXCHANGE_RATES as EXCHANGE_RATES_TO_INR
+from utils.ledger_columns import LedgerColumns
+from utils.rates import RateTable
+
+
+def convert_to_base_currency(amount, currency):
+    """convert_to_base_currency as it was before dated rates: one flat dict lookup."""
+    rate = EXCHANGE_RATES_TO_INR.get(currency.upper(), None)
+    if rate is None:
+        return amount
+    return amount * rate
+
+
+def legacy_loop(transactions):
+    """The per-row loop generate_analysis_plot ran before the columnar engine, plus per-tag totals."""
+    credits_in_base = 0
+    debits_in_base = 0
+    credit_transactions = []
+    debit_transactions = []
+    by_tag = {}
+    for transaction in transactions:
+        _, amount, _, currency, t_type, date, tag = transaction
+        amount_in_base = convert_to_base_currency(float(amount), currency)
+        if t_type == 'credit':
+            credits_in_base += amount_in_base
+            credit_transactions.append(transaction)
+        elif t_type == 'debit':
+            debits_in_base += amount_in_base
+            debit_transactions.append(transaction)
+            by_tag[tag] = by_tag.get(tag, 0) + amount_in_base
+    return credits_in_base, debits_in_base, len(credit_transactions), len(debit_transactions), by_tag
+
+
+def engine(columns, rates):
+    return columns.summary(rates), columns.by_tag(rates), columns.by_month(rates)
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<45}{(time.perf_counter() - start) * 1000:>12.1f} ms")
+    return result
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            populate(os.path.join(tmp, "bench.db"), rows)
+        print(f"{rows} transactions\n")
+
+        transactions = timed("fetch rows (get_transactions)", database.get_transactions)
+        legacy = timed("per-row loop", legacy_loop, transactions)
+        raw = timed("load columns (LedgerColumns.from_transactions)", LedgerColumns.from_transactions)
+        rates = RateTable.from_database()  # The seeded defaults, so totals match the flat dict
+        vectorized = timed("vectorized summary + by_tag + by_month", engine, raw, rates)
+        daily = timed("load columns (LedgerColumns.from_daily_totals)", LedgerColumns.from_daily_totals)
+        timed("vectorized over daily aggregates", engine, daily, rates)
+
+        summary = vectorized[0]
+        assert abs(summary["credits"] - legacy[0]) <= 1e-6 * max(1.0, legacy[0])
+        assert abs(summary["debits"] - legacy[1]) <= 1e-6 * max(1.0, legacy[1])
+        assert (summary["num_credits"], summary["num_debits"]) == legacy[2:4]
+        print("\nEngine totals match the per-row loop.")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size to benchmark against")
+    run(parser.parse_args().rows)
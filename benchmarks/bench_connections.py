@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: per-operation latency of the pooled connection layer in
+database.py against the old connect-per-call behaviour.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_connections --rows 1000000 --ops 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import populate
+
+# --- Connect-per-call versions, as database.py behaved before pooling ---
+
+def legacy_add_transaction(amount, description, currency, transaction_type, date, tag):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.execute(database.INSERT_TRANSACTION_SQL, (amount, description, currency, transaction_type, date, tag))
+        conn.commit()
+
+
+def legacy_get_transactions():
+    with sqlite3.connect(database.DB_FILE) as conn:
+        return conn.execute(database.SELECT_TRANSACTIONS_SQL).fetchall()
+
+
+def legacy_delete_transaction(transaction_id):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.execute(database.DELETE_TRANSACTION_SQL, (transaction_id,))
+        conn.commit()
+
+
+def legacy_get_unique_tags():
+    with sqlite3.connect(database.DB_FILE) as conn:
+        return [row[0] for row in conn.execute(database.SELECT_TAG_COUNTS_SQL)]
+
+
+def time_calls(func, args_list):
+    """Calls func once per args tuple and returns the latencies in milliseconds."""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return statistics.mean(latencies), statistics.median(latencies), p95
+
+
+def run(rows, ops, scan_ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        print(f"Populating {rows} rows...")
+        start = time.perf_counter()
+        populate(db_file, rows)
+        print(f"Populated in {time.perf_counter() - start:.1f}s\n")
+
+        new_row = (12.5, "Benchmark row", "INR", "debit", "2024-01-01 09:00:00", "Food")
+        modes = {
+            "connect-per-call": (legacy_add_transaction, legacy_delete_transaction,
+                                 legacy_get_unique_tags, legacy_get_transactions),
+            "pooled": (database.add_transaction, database.delete_transaction,
+                       database.get_unique_tags, database.get_transactions),
+        }
+        print(f"{'operation':<20}{'mode':<20}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode, (add, delete, unique_tags, get_all) in modes.items():
+            # Both modes print nothing during timing so only DB work is measured.
+            with contextlib.redirect_stdout(io.StringIO()):
+                max_id = sqlite3.connect(db_file).execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+                results = {
+                    "add_transaction": time_calls(add, [new_row] * ops),
+                    "delete_transaction": time_calls(delete, [(max_id + i + 1,) for i in range(ops)]),
+                    "get_unique_tags": time_calls(unique_tags, [()] * scan_ops),
+                    "get_transactions": time_calls(get_all, [()] * scan_ops),
+                }
+            for operation, latencies in results.items():
+                mean, p50, p95 = summarize(latencies)
+                print(f"{operation:<20}{mode:<20}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size to benchmark against")
+    parser.add_argument("--ops", type=int, default=500, help="Calls per point operation (add/delete)")
+    parser.add_argument("--scan-ops", type=int, default=3, help="Calls per full-scan operation")
+    args = parser.parse_args()
+    run(args.rows, args.ops, args.scan_ops)
@@ -0,0 +1,155 @@
+"""
+Benchmark: date ordering and date range latency with the text `date` column
+unindexed, with the old text date indexes, and with the integer date_ts column
+and its covering index. Also times the migration that backfills date_ts.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_dates --rows 1000000 --ops 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.bench_connections import time_calls, summarize
+from benchmarks.ledger import SyntheticLedger, cached_ledger
+
+COLUMNS = "id, amount, description, currency, transaction_type, date, tag"
+TS = database.DATE_TS_SQL.format("?")
+# (text date SQL, date_ts SQL) per query; both take the same parameters.
+QUERIES = {
+    "full list": (
+        f"SELECT {COLUMNS} FROM transactions ORDER BY date DESC, id DESC",
+        database.SELECT_TRANSACTIONS_SQL,
+    ),
+    "first page": (
+        f"SELECT {COLUMNS} FROM transactions ORDER BY date DESC, id DESC LIMIT 50",
+        f"SELECT {COLUMNS} FROM transactions ORDER BY date_ts DESC, id DESC LIMIT 50",
+    ),
+    "keyset page (middle)": (
+        f"SELECT {COLUMNS} FROM transactions WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 50",
+        f"SELECT {COLUMNS} FROM transactions WHERE (date_ts, id) < ({TS}, ?) ORDER BY date_ts DESC, id DESC LIMIT 50",
+    ),
+    "tag page": (
+        f"SELECT {COLUMNS} FROM transactions WHERE tag = ? ORDER BY date DESC, id DESC LIMIT 50",
+        f"SELECT {COLUMNS} FROM transactions WHERE tag_id = (SELECT id FROM tags WHERE name = ?) "
+        "ORDER BY date_ts DESC, id DESC LIMIT 50",
+    ),
+    "one month": (
+        f"SELECT {COLUMNS} FROM transactions WHERE date >= ? AND date < ? ORDER BY date, id",
+        database.SELECT_TRANSACTIONS_BETWEEN_SQL.format(order="ASC"),
+    ),
+    "one year": (
+        f"SELECT {COLUMNS} FROM transactions WHERE date >= ? AND date < ? ORDER BY date, id",
+        database.SELECT_TRANSACTIONS_BETWEEN_SQL.format(order="ASC"),
+    ),
+}
+# Each layout starts from a current database: which indexes to drop and create.
+DATE_TS_INDEXES = ("idx_transactions_date_ts", "idx_transactions_tag_id_date_ts")
+LAYOUTS = {
+    "text, no index": (DATE_TS_INDEXES, ()),
+    "text index": (DATE_TS_INDEXES, (
+        "CREATE INDEX idx_transactions_date ON transactions (date)",
+        "CREATE INDEX idx_transactions_tag_date ON transactions (tag, date)",
+    )),
+    "date_ts covering": ((), ()),
+}
+
+
+def make_layout(source, target, drop, create):
+    shutil.copyfile(source, target)
+    conn = sqlite3.connect(target)
+    for index in drop:
+        conn.execute(f"DROP INDEX {index}")
+    for statement in create:
+        conn.execute(statement)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(target)
+
+
+def query_params(conn):
+    rows = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    middle = conn.execute("SELECT date, id FROM transactions ORDER BY date, id LIMIT 1 OFFSET ?", (rows // 2,)).fetchone()
+    return {
+        "full list": (),
+        "first page": (),
+        "keyset page (middle)": tuple(middle),
+        "tag page": ("Travel",),
+        "one month": ("2020-03-01", "2020-04-01"),
+        "one year": ("2020-01-01", "2021-01-01"),
+    }
+
+
+def time_migration(source, target):
+    """Turns a copy back into a version 8 database (no date_ts) and times init_db migrating it."""
+    shutil.copyfile(source, target)
+    conn = sqlite3.connect(target)
+    for index in DATE_TS_INDEXES:
+        conn.execute(f"DROP INDEX {index}")
+    conn.execute("DROP TRIGGER trg_transactions_date_ts_insert")
+    conn.execute("DROP TRIGGER trg_transactions_date_ts_update")
+    conn.execute("ALTER TABLE transactions DROP COLUMN date_ts")
+    conn.execute("CREATE INDEX idx_transactions_date ON transactions (date)")
+    conn.execute("CREATE INDEX idx_transactions_tag_date ON transactions (tag, date)")
+    conn.execute("PRAGMA user_version = 8")
+    conn.commit()
+    conn.close()
+    database.DB_FILE = target
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+    elapsed = time.perf_counter() - start
+    database.close_connections()
+    return elapsed
+
+
+def run(rows, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Preparing a {rows}-row ledger...")
+        source = cached_ledger(SyntheticLedger(rows), os.path.join(tmp, "source.db"))
+
+        results = {}
+        sizes = {}
+        for layout, (drop, create) in LAYOUTS.items():
+            db_file = os.path.join(tmp, f"{layout}.db")
+            sizes[layout] = make_layout(source, db_file, drop, create)
+            conn = sqlite3.connect(db_file)
+            params = query_params(conn)
+            for name, (text_sql, ts_sql) in QUERIES.items():
+                sql = ts_sql if layout == "date_ts covering" else text_sql
+                latencies = time_calls(lambda: conn.execute(sql, params[name]).fetchall(), [()] * ops)
+                plan = " / ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params[name]))
+                results[(name, layout)] = (summarize(latencies)[1], plan)
+            conn.close()
+
+        print(f"\n{'median ms':<22}" + "".join(f"{layout:>18}" for layout in LAYOUTS))
+        for name in QUERIES:
+            print(f"{name:<22}" + "".join(f"{results[(name, layout)][0]:>18.3f}" for layout in LAYOUTS))
+        print(f"{'file size (MB)':<22}" + "".join(f"{sizes[layout] / 2 ** 20:>18.1f}" for layout in LAYOUTS))
+
+        print("\nQuery plans:")
+        for name in QUERIES:
+            for layout in LAYOUTS:
+                print(f"  {name} [{layout}]: {results[(name, layout)][1]}")
+
+        elapsed = time_migration(source, os.path.join(tmp, "migrate.db"))
+        print(f"\nMigration to date_ts (backfill and index build): {elapsed:.2f}s "
+              f"({rows / max(elapsed, 1e-9):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size")
+    parser.add_argument("--ops", type=int, default=20, help="Runs per query and layout")
+    args = parser.parse_args()
+    run(args.rows, args.ops)
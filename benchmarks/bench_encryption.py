@@ -0,0 +1,152 @@
+"""
+Benchmark: cost of the encrypted ledger. Times the master password's scrypt
+derivation against its unlock budget, encrypting a plaintext ledger (the
+first unlock after upgrading, then a later one), and the queries the app runs
+on a plaintext copy and a sealed copy of the same ledger.
+
+The overhead of the list pages, adds, balance and search (what the main
+screen runs) must stay within --max-overhead percent of plaintext, and
+unlocking within the budget (plus UNLOCK_TOLERANCE for calibration error); the
+exit status is 1 otherwise. Opening a description costs a couple of
+microseconds, which is most of the difference on a page that takes a fraction
+of a millisecond, hence the 100% default. Search on a sealed ledger looks rows
+up by keyed search token instead of the full-text index, and opens the
+candidates to match them. Reading a whole month is reported but not held to
+the budget: it opens every row it returns.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_encryption --rows 1000000 --ops 50
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.bench_connections import time_calls, summarize
+from benchmarks.ledger import SyntheticLedger, cached_ledger
+from utils import crypto
+
+UNLOCK_TOLERANCE = 1.25
+# Each query is timed in alternating blocks of the two modes, so drift in the
+# machine's speed affects both alike; the median over all blocks is reported.
+ROUNDS = 5
+
+
+def budgeted_queries(after):
+    """(name, function, args) run by the main screen, held to the overhead budget."""
+    page = database.TRANSACTIONS_PAGE_SIZE
+    return [
+        ("first page", database.get_transactions_page, (None, None, None, None, None, page)),
+        ("page 100 deep", database.get_transactions_page, (None, None, None, None, after, page)),
+        ("tag page", database.get_transactions_page, ("Travel", None, None, None, None, page)),
+        ("add_transaction", database.add_transaction,
+         (120.5, "Benchmark order", "INR", "debit", "2024-06-01 10:00:00", "Food")),
+        ("balance", database.get_balance_in_base, ()),
+        ("search 'amazon'", database.search_transactions, ("amazon",)),
+        ("search 'decathlon gift'", database.search_transactions, ("decathlon gift",)),
+        ("search 'decath' (typing)", database.search_transactions, ("decath",)),
+        ("search 'no such words'", database.search_transactions, ("no such words",)),
+    ]
+
+
+def reported_queries():
+    """(name, function, args) that are reported only."""
+    return [
+        ("one month (get_transactions_between)", database.get_transactions_between, ("2020-01-01", "2020-02-01")),
+    ]
+
+
+def use(db_file, cipher):
+    database.close_connections()
+    database.DB_FILE = db_file
+    database.set_ledger_cipher(cipher)
+
+
+def compare(queries, modes, ops):
+    """Times each query in each mode. Returns {name: {mode: p50 ms}}."""
+    results = {}
+    for name, func, args in queries:
+        latencies = {mode: [] for mode in modes}
+        for _ in range(ROUNDS):
+            for mode, (db_file, cipher) in modes.items():
+                use(db_file, cipher)
+                func(*args)  # Warm up the connection and page cache
+                latencies[mode].extend(time_calls(func, [args] * max(1, ops // ROUNDS)))
+        results[name] = {mode: summarize(times)[1] for mode, times in latencies.items()}
+    return results
+
+
+def print_results(title, results):
+    print(f"\n{title:<40}{'plain p50 ms':>14}{'sealed p50 ms':>15}{'overhead':>10}")
+    for name, times in results.items():
+        overhead = times["sealed"] / max(times["plain"], 1e-9) - 1
+        print(f"{name:<40}{times['plain']:>14.3f}{times['sealed']:>15.3f}{overhead * 100:>9.1f}%")
+
+
+def run(rows, ops, max_overhead, budget):
+    ok = True
+    params = crypto.calibrate_scrypt(budget)
+    start = time.perf_counter()
+    record, key = crypto.create_password_record("benchmark password", params)
+    create_s = time.perf_counter() - start
+    start = time.perf_counter()
+    assert crypto.unlock(record, "benchmark password") == key
+    unlock_s = time.perf_counter() - start
+    print(f"scrypt n={params['n']} r={params['r']} p={params['p']}: set password {create_s * 1000:.0f} ms, "
+          f"unlock {unlock_s * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+    if unlock_s > budget * UNLOCK_TOLERANCE:
+        ok = False
+        print("  unlock is over budget")
+    if not crypto.CIPHER_AVAILABLE:
+        print("The 'cryptography' package is not installed; the ledger can't be encrypted here.")
+        return 0 if ok else 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Preparing a {rows}-row ledger...")
+        plain = cached_ledger(SyntheticLedger(rows), os.path.join(tmp, "plain.db"))
+        sealed = os.path.join(tmp, "sealed.db")
+        shutil.copyfile(plain, sealed)
+        cipher = crypto.LedgerCipher(key)
+        use(sealed, None)
+        for label in ("first unlock (seals every row)", "later unlock"):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ok &= database.encrypt_ledger(cipher)
+            print(f"encrypt_ledger, {label}: {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"file size: plain {os.path.getsize(plain) / 2 ** 20:.1f} MiB, "
+              f"sealed {os.path.getsize(sealed) / 2 ** 20:.1f} MiB")
+
+        use(plain, None)
+        after = database.get_transactions_page(limit=database.TRANSACTIONS_PAGE_SIZE * 100)[-1]
+        modes = {"plain": (plain, None), "sealed": (sealed, cipher)}
+        budgeted = compare(budgeted_queries((after.date, after.id)), modes, ops)
+        print_results(f"within {max_overhead:.0f}% of plaintext", budgeted)
+        print_results("reported only", compare(reported_queries(), modes, ROUNDS))
+        use(sealed, cipher)
+        opened = database.get_transactions_page(limit=5)
+        use(plain, None)
+        database.close_connections()
+
+    over = [name for name, times in budgeted.items() if times["sealed"] > times["plain"] * (1 + max_overhead / 100)]
+    if over:
+        ok = False
+        print(f"\nover the overhead budget: {', '.join(over)}")
+    print(f"\nsample sealed rows opened: {[t.description for t in opened[:3]]}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size")
+    parser.add_argument("--ops", type=int, default=50, help="Calls per budgeted query")
+    parser.add_argument("--max-overhead", type=float, default=100.0, help="Allowed overhead of the sealed ledger, %%")
+    parser.add_argument("--budget", type=float, default=crypto.UNLOCK_BUDGET, help="Unlock budget in seconds")
+    args = parser.parse_args()
+    raise SystemExit(run(args.rows, args.ops, args.max_overhead, args.budget))
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: cost of the utils.instrumentation hooks when disabled and
+enabled, alone and around a real page query.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_instrumentation --ops 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import populate
+from utils import instrumentation
+
+
+def per_call_ns(func, ops):
+    start = time.perf_counter()
+    for _ in range(ops):
+        func()
+    return (time.perf_counter() - start) / ops * 1e9
+
+
+def hooks(ops):
+    def noop():
+        pass
+
+    def with_span():
+        with instrumentation.span("bench.span"):
+            pass
+
+    def with_count():
+        instrumentation.count("bench.count")
+
+    def with_trace():
+        instrumentation.trace("bench %s", 1)
+
+    results = {}
+    for state in (False, True):
+        instrumentation.enabled = state
+        label = "enabled" if state else "disabled"
+        decorated = instrumentation.timed("bench.timed")(noop)
+        results[label] = {
+            "bare call": per_call_ns(noop, ops),
+            "@timed call": per_call_ns(decorated, ops),
+            "span()": per_call_ns(with_span, ops),
+            "count()": per_call_ns(with_count, ops),
+            "trace() (not tracing)": per_call_ns(with_trace, ops),
+        }
+    instrumentation.enabled = False
+    instrumentation.reset()
+    return results
+
+
+def run(rows, ops):
+    print(f"{'hook':<24}{'disabled ns':>13}{'enabled ns':>13}")
+    results = hooks(ops)
+    for name in results["disabled"]:
+        print(f"{name:<24}{results['disabled'][name]:>13.0f}{results['enabled'][name]:>13.0f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        populate(os.path.join(tmp, "bench.db"), rows)
+        page = database.get_transactions_page
+        timed_page = instrumentation.timed("db.get_transactions_page")(page)  # What enabled builds wrap it in
+        queries = max(1, ops // 100)
+        instrumentation.enabled = True
+        plain, wrapped = per_call_ns(page, queries), per_call_ns(timed_page, queries)
+        instrumentation.enabled = False
+        print(f"\nget_transactions_page on {rows} rows: {plain / 1000:.1f} us plain, {wrapped / 1000:.1f} us timed "
+              f"({100 * (wrapped - plain) / plain:+.1f}%)")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="Ledger size for the page query")
+    parser.add_argument("--ops", type=int, default=200_000, help="Calls per hook")
+    args = parser.parse_args()
+    run(args.rows, args.ops)
@@ -0,0 +1,63 @@
+"""
+Memory benchmark: bytes per row held by a fully fetched ledger as plain
+sqlite3 tuples versus models.Transaction records from the row factory.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import populate
+from models import transaction_row_factory
+
+
+def measure(label, fetch, rows):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fetch()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28}{current / rows:>12.1f}{peak / rows:>12.1f}{elapsed:>10.2f}")
+    return result
+
+
+def fetch_tuples():
+    return database.get_connection().execute(database.SELECT_TRANSACTIONS_SQL).fetchall()
+
+
+def fetch_records():
+    cursor = database.get_connection().cursor()
+    cursor.row_factory = transaction_row_factory
+    return cursor.execute(database.SELECT_TRANSACTIONS_SQL).fetchall()
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            populate(os.path.join(tmp, "bench.db"), rows)
+        print(f"{rows} transactions\n")
+        print(f"{'representation':<28}{'bytes/row':>12}{'peak/row':>12}{'seconds':>10}")
+        tuples = measure("sqlite3 tuples", fetch_tuples, rows)
+        del tuples
+        records = measure("Transaction (__slots__)", fetch_records, rows)
+        del records
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size to benchmark against")
+    run(parser.parse_args().rows)
@@ -0,0 +1,69 @@
+"""
+Benchmark: recurring rule scheduling. Times loading many rules, a check when
+nothing is due (what the app does every minute), and catching up after a long
+absence.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_recurring --rules 10000 --days 90
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from utils import recurrence
+from utils.recurrence import RecurringScheduler, DATE_FORMAT
+
+SCHEDULES = ["daily", "weekly", "monthly", "every 2 weeks", "0 9 * * 1-5", "30 18 1,15 * *"]
+
+
+def run(rules, days):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, "bench.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        rng = random.Random(42)
+        start = datetime(2024, 1, 1)
+        for i in range(rules):
+            first = start + timedelta(days=rng.randrange(days), hours=rng.randrange(24))
+            database.add_recurring_rule(rng.uniform(1, 500), f"Rule {i}", "INR", "debit", "Bills",
+                                        rng.choice(SCHEDULES), first.strftime(DATE_FORMAT), first.strftime(DATE_FORMAT))
+        scheduler = RecurringScheduler()
+
+        started = time.perf_counter()
+        scheduler.load()
+        print(f"load {rules} rules:            {(time.perf_counter() - started) * 1000:9.2f} ms")
+
+        checks = 1000
+        started = time.perf_counter()
+        for _ in range(checks):
+            scheduler.run_due(start - timedelta(days=1))
+        print(f"check with nothing due:      {(time.perf_counter() - started) / checks * 1e6:9.2f} us")
+
+        # Logging is the transaction log's own cost (and its queue is bounded); keep it out of the timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            log_add, recurrence.transaction_log.log_add = recurrence.transaction_log.log_add, lambda *args: True
+            started = time.perf_counter()
+            added = len(scheduler.run_due(start + timedelta(days=days)).result())
+            elapsed = time.perf_counter() - started
+            recurrence.transaction_log.log_add = log_add
+        print(f"catch up {days} days:            {elapsed * 1000:9.2f} ms ({added} transactions, "
+              f"{added / max(elapsed, 1e-9):.0f}/s)")
+        print(f"next due: {scheduler.next_due()}")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=10_000, help="Number of recurring rules")
+    parser.add_argument("--days", type=int, default=90, help="Length of the absence to catch up on")
+    args = parser.parse_args()
+    run(args.rules, args.days)
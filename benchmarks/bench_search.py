@@ -0,0 +1,69 @@
+"""
+Benchmark: search_transactions latency on a large ledger with realistic
+descriptions, for rare, common and prefix-only queries.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_search --rows 1000000 --ops 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.bench_connections import time_calls, summarize
+from benchmarks.ledger import populate, MERCHANTS, WORDS
+
+QUERIES = {
+    "rare word": "decathlon gift",
+    "common word": "order",
+    "common word, finished": "order ",
+    "two-letter prefix": "gr",
+    "three-letter prefix": "sub",
+    "long prefix": "bigbasket groce",
+    "tag": "travel",
+    "no match": "xylophone",
+}
+# Latency budget per search on the default ledger size.
+TARGET_MS = 10.0
+
+
+def describe(rng, i):
+    return f"{rng.choice(MERCHANTS)} {rng.choice(WORDS)} {rng.choice(WORDS)} #{i}"
+
+
+def run(rows, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Populating {rows} rows...")
+        start = time.perf_counter()
+        populate(os.path.join(tmp, "bench.db"), rows, describe=describe)
+        print(f"Populated (with FTS index) in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'query':<22}{'results':>9}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        worst = 0.0
+        for label, query in QUERIES.items():
+            results = len(database.search_transactions(query))
+            mean, p50, p95 = summarize(time_calls(database.search_transactions, [(query,)] * ops))
+            worst = max(worst, p95)
+            print(f"{label:<22}{results:>9}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+        # Incremental typing, as the debounced search box issues it
+        typed = "bigbasket groceries"
+        prefixes = [(typed[:n],) for n in range(2, len(typed) + 1)]
+        mean, p50, p95 = summarize(time_calls(database.search_transactions, prefixes * max(1, ops // len(prefixes))))
+        worst = max(worst, p95)
+        print(f"{'incremental typing':<22}{'':>9}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+        print(f"\nWorst p95: {worst:.2f} ms ({'within' if worst <= TARGET_MS else 'over'} the {TARGET_MS:.0f} ms target)")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size to benchmark against")
+    parser.add_argument("--ops", type=int, default=200, help="Searches per query")
+    args = parser.parse_args()
+    run(args.rows, args.ops)
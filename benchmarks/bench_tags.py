@@ -0,0 +1,126 @@
+"""
+Benchmark: reading the tags in use from the tags table against the old
+DISTINCT scan of the transactions, the cost of refreshing the tag filter after
+an operation (rescan and sort, against TagSet.apply), and the migration that
+builds the tags table and merges case variants of a tag.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_tags --rows 1000000 --ops 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.bench_connections import time_calls, summarize
+from benchmarks.ledger import SyntheticLedger, cached_ledger
+from models import Transaction
+from utils.journal import Change
+from utils.tags import TagSet
+
+# What get_unique_tags ran before the tags table, and the index it could use.
+DISTINCT_TAGS_SQL = "SELECT DISTINCT tag FROM transactions WHERE tag IS NOT NULL AND tag != '' ORDER BY tag"
+TAG_INDEX_SQL = "CREATE INDEX idx_transactions_tag_date_ts ON transactions (tag, date_ts)"
+# Case variants written into the text column (one row in VARIANT_EVERY each) before timing the migration.
+VARIANTS = ("food", "FOOD", "travel", "SHOPPING")
+VARIANT_EVERY = 50
+
+
+def distinct_tags(conn):
+    return sorted(set(row[0] for row in conn.execute(DISTINCT_TAGS_SQL)))
+
+
+def time_migration(source, target):
+    """Turns a copy back into a version 10 database with case variants and times init_db migrating it."""
+    shutil.copyfile(source, target)
+    conn = sqlite3.connect(target)
+    for trigger in ("trg_transactions_tag_id_insert", "trg_transactions_tag_id_update",
+                    "trg_tags_count_insert", "trg_tags_count_delete", "trg_tags_count_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP INDEX idx_transactions_tag_id_date_ts")
+    # tag_id can't be dropped (it is a foreign key), so it is cleared; the migration keeps the column
+    conn.execute("UPDATE transactions SET tag_id = NULL")
+    conn.execute("DELETE FROM tags")
+    conn.execute(TAG_INDEX_SQL)
+    for i, variant in enumerate(VARIANTS):
+        conn.execute("UPDATE transactions SET tag = ? WHERE tag = ? AND id % ? = ?",
+                     (variant, variant.capitalize(), VARIANT_EVERY, i))
+    variants = conn.execute(f"SELECT COUNT(*) FROM transactions WHERE tag IN ({','.join('?' * len(VARIANTS))})",
+                            VARIANTS).fetchone()[0]
+    conn.execute("PRAGMA user_version = 10")
+    conn.commit()
+    conn.close()
+    database.DB_FILE = target
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+    elapsed = time.perf_counter() - start
+    merged = database.get_connection().execute(
+        f"SELECT COUNT(*) FROM transactions WHERE tag IN ({','.join('?' * len(VARIANTS))})", VARIANTS).fetchone()[0]
+    problems = database.check_aggregates()
+    database.close_connections()
+    return elapsed, variants, merged, problems
+
+
+def run(rows, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Preparing a {rows}-row ledger...")
+        source = cached_ledger(SyntheticLedger(rows), os.path.join(tmp, "source.db"))
+        indexed = os.path.join(tmp, "indexed.db")
+        shutil.copyfile(source, indexed)
+        with sqlite3.connect(indexed) as conn:
+            conn.execute(TAG_INDEX_SQL)
+
+        database.DB_FILE = source
+        plain = sqlite3.connect(source)
+        with_index = sqlite3.connect(indexed)
+        assert distinct_tags(plain) == sorted(database.get_unique_tags()), "tag lists differ"
+        reads = {
+            "DISTINCT scan": time_calls(lambda: distinct_tags(plain), [()] * ops),
+            "DISTINCT over (tag, date_ts) index": time_calls(lambda: distinct_tags(with_index), [()] * ops),
+            "tags table (get_tag_counts)": time_calls(database.get_tag_counts, [()] * ops),
+        }
+        print(f"\n{'reading the tags in use':<40}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, latencies in reads.items():
+            mean, p50, p95 = summarize(latencies)
+            print(f"{name:<40}{mean:>10.3f}{p50:>10.3f}{p95:>10.3f}")
+
+        # Refreshing the filter after retagging one row, the old way and with TagSet
+        tag_set = TagSet()
+        tag_set.load()
+        row = Transaction(1, 10.0, "x", "INR", "debit", "2020-01-01 00:00:00", "Food")
+        retagged = Transaction(1, 10.0, "x", "INR", "debit", "2020-01-01 00:00:00", "Travel")
+        changes = [Change((), (), [retagged], [row]), Change((), (), [row], [retagged])] * 500
+        start = time.perf_counter()
+        for change in changes:
+            if tag_set.apply(change):
+                tag_set.names()
+        apply_us = (time.perf_counter() - start) / len(changes) * 1e6
+        rescan_ms = summarize(reads["DISTINCT over (tag, date_ts) index"])[1]
+        print(f"\nfilter refresh per operation: rescan {rescan_ms:.3f} ms, TagSet.apply {apply_us / 1000:.4f} ms")
+        plain.close()
+        with_index.close()
+        database.close_connections()
+
+        elapsed, variants, merged, problems = time_migration(source, os.path.join(tmp, "migrate.db"))
+        print(f"\nMigration to the tags table: {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} rows/s), "
+              f"{variants} rows spelled with {len(VARIANTS)} case variants, {merged} left after merging")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1 if merged or problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Ledger size")
+    parser.add_argument("--ops", type=int, default=20, help="Runs per way of reading the tags")
+    args = parser.parse_args()
+    raise SystemExit(run(args.rows, args.ops))
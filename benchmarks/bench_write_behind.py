@@ -0,0 +1,130 @@
+"""
+Benchmark: stress test of adds from the UI thread, committing on the UI thread
+(OperationJournal without a writer, as before) against the write-behind
+LedgerWriter. A 60 fps frame loop fires `--rate` adds per second for
+`--seconds`, and handles completed writes the way MainScreen does on the next
+frame (list insert and TagSet update). A frame whose work takes longer than
+its 16.7 ms budget counts as dropped. Afterwards every add must be in the
+database and in the transaction log, and the maintained aggregates must agree.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_write_behind --rate 5000 --seconds 5
+"""
+import argparse
+import collections
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from bisect import insort
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.bench_connections import summarize
+from utils import journal
+from utils.journal import OperationJournal, AddOperation
+from utils.ledger_writer import LedgerWriter
+from utils.tags import TagSet
+from utils.transaction_log import TransactionLogWriter
+
+FRAME_SECONDS = 1 / 60
+TAGS = ["Food", "Travel", "Shopping", "Bills", "Rent", "Salary"]
+
+
+def stress(tmp, name, writer, rate, seconds):
+    """Runs the frame loop with `writer` (None commits on the loop's thread). Returns a result row."""
+    database.DB_FILE = os.path.join(tmp, f"{name}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+    log = TransactionLogWriter(os.path.join(tmp, f"{name}.jsonl"), max_queue=rate * seconds * 2,
+                               max_bytes=1 << 40)
+    journal.transaction_log = log
+    ops = OperationJournal(writer=writer)
+    tag_set = TagSet()
+    tag_set.load()
+    rows = []
+    completed = collections.deque()  # Filled from the writer thread, drained by the next frame (like Clock)
+    rng = random.Random(42)
+    per_frame = max(1, round(rate * FRAME_SECONDS))
+    frames = []
+    failed = submitted = 0
+
+    started = time.perf_counter()
+    for frame in range(round(seconds / FRAME_SECONDS)):
+        frame_start = time.perf_counter()
+        while completed:
+            future = completed.popleft()
+            change = future.result() if future.exception() is None else None
+            if change is None:
+                failed += 1
+                continue
+            for t in change.inserted:
+                insort(rows, (t.date, t.id))
+            tag_set.apply(change)
+        for _ in range(per_frame):
+            date = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00"
+            _, future = ops.do(AddOperation(round(rng.uniform(1, 500), 2), f"Stress {submitted}", "INR",
+                                            "debit", date, rng.choice(TAGS)))
+            future.add_done_callback(completed.append)
+            submitted += 1
+        elapsed = time.perf_counter() - frame_start
+        frames.append(elapsed * 1000)
+        time.sleep(max(0.0, (frame + 1) * FRAME_SECONDS - (time.perf_counter() - started)))
+
+    if writer is not None:
+        writer.flush(timeout=60)
+    committed_in = time.perf_counter() - started
+    while completed:
+        future = completed.popleft()
+        if future.exception() is not None or future.result() is None:
+            failed += 1
+    log.close()
+
+    stored = database.get_connection().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    problems = database.check_aggregates()
+    database.close_connections()
+    mean, p50, p95 = summarize(frames)
+    groups = f"{writer.commits} commits, {writer.steps / max(writer.commits, 1):.0f} adds each" if writer else \
+        f"{submitted} commits"
+    return {
+        "name": name, "submitted": submitted, "stored": stored, "logged": log.written, "failed": failed,
+        "dropped_frames": sum(1 for ms in frames if ms > FRAME_SECONDS * 1000), "frames": len(frames),
+        "mean": mean, "p95": p95, "worst": max(frames), "rate": submitted / committed_in, "groups": groups,
+        "problems": problems,
+    }
+
+
+def run(rate, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = LedgerWriter()
+        results = [stress(tmp, "commit on UI thread", None, rate, seconds),
+                   stress(tmp, "write-behind", writer, rate, seconds)]
+        writer.close()
+
+    print(f"\n{rate} adds/s for {seconds}s at 60 fps")
+    print(f"{'':<22}{'frame mean ms':>14}{'p95 ms':>8}{'worst ms':>10}{'dropped':>10}{'adds/s':>9}  commits")
+    ok = True
+    for r in results:
+        print(f"{r['name']:<22}{r['mean']:>14.2f}{r['p95']:>8.2f}{r['worst']:>10.2f}"
+              f"{r['dropped_frames']:>5}/{r['frames']:<4}{r['rate']:>9.0f}  {r['groups']}")
+        lost = r["submitted"] - r["stored"]
+        unlogged = r["stored"] - r["logged"]
+        if lost or unlogged or r["failed"] or r["problems"]:
+            ok = False
+            print(f"  {lost} rows lost, {unlogged} not logged, {r['failed']} failed")
+            for problem in r["problems"]:
+                print(f"  {problem}")
+    print("\nno lost rows" if ok else "\nFAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=5000, help="Adds fired per second")
+    parser.add_argument("--seconds", type=int, default=5, help="How long to keep firing")
+    args = parser.parse_args()
+    raise SystemExit(run(args.rate, args.seconds))
@@ -0,0 +1,111 @@
+"""
+Deterministic synthetic ledgers for the benchmarks.
+
+The same parameters and seed always produce the same rows, so results from
+different commits are measured against identical data. Built databases can be
+kept in benchmarks/.cache (see cached_ledger) because large ones take a while
+to create.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Relative weights: most rows in the home currency, a long tail of tags.
+DEFAULT_CURRENCIES = {"INR": 70, "USD": 15, "EUR": 8, "GBP": 5, "JPY": 2}
+DEFAULT_TAGS = {"Food": 25, "Shopping": 15, "Bills": 12, "Travel": 10, "Rent": 8, "Health": 6,
+                "Salary": 4, "Entertainment": 8, "Uncategorized": 12}
+MERCHANTS = ["Amazon", "Swiggy", "Zomato", "Uber", "Ola", "Flipkart", "BigBasket", "Starbucks",
+             "Netflix", "Spotify", "Airtel", "Jio", "Apollo Pharmacy", "IRCTC", "Shell", "Decathlon"]
+WORDS = ["order", "refund", "groceries", "dinner", "lunch", "ride", "subscription", "recharge",
+         "tickets", "fuel", "medicines", "gift", "transfer", "salary", "rent", "electricity"]
+
+
+class SyntheticLedger:
+    """
+    Parameters of a generated ledger.
+
+    `currencies` and `tags` map names to relative weights. Dates fall uniformly in
+    the `days` days starting at `start_date` ('YYYY-MM-DD'). `credit_ratio` is the
+    share of credits.
+    """
+
+    def __init__(self, rows, seed=42, currencies=None, tags=None, start_date="2015-01-01", days=3650,
+                 credit_ratio=0.3):
+        self.rows = rows
+        self.seed = seed
+        self.currencies = dict(currencies or DEFAULT_CURRENCIES)
+        self.tags = dict(tags or DEFAULT_TAGS)
+        self.start_date = start_date
+        self.days = days
+        self.credit_ratio = credit_ratio
+
+    def params(self):
+        return {
+            "rows": self.rows, "seed": self.seed, "currencies": self.currencies, "tags": self.tags,
+            "start_date": self.start_date, "days": self.days, "credit_ratio": self.credit_ratio,
+        }
+
+    def key(self):
+        """Short stable hash of the parameters, used for cache file names."""
+        return hashlib.sha1(json.dumps(self.params(), sort_keys=True).encode()).hexdigest()[:12]
+
+    def iter_rows(self, describe=None):
+        """
+        Yields (amount, description, currency, transaction_type, date, tag) tuples.
+        `describe(rng, i)`, if given, returns the description of row i.
+        """
+        rng = random.Random(self.seed)
+        currency_names, currency_weights = list(self.currencies), list(self.currencies.values())
+        tag_names, tag_weights = list(self.tags), list(self.tags.values())
+        start = date.fromisoformat(self.start_date)
+        for i in range(self.rows):
+            day = start + timedelta(days=rng.randrange(self.days))
+            yield (
+                round(rng.uniform(1, 5000), 2),
+                describe(rng, i) if describe else f"{rng.choice(MERCHANTS)} {rng.choice(WORDS)} #{i}",
+                rng.choices(currency_names, currency_weights)[0],
+                "credit" if rng.random() < self.credit_ratio else "debit",
+                f"{day.isoformat()} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00",
+                rng.choices(tag_names, tag_weights)[0],
+            )
+
+    def write(self, db_file, describe=None):
+        """Creates db_file (through init_db, so with every index and trigger) and bulk inserts the rows."""
+        database.DB_FILE = db_file
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+            database.add_transactions_bulk(self.iter_rows(describe), chunk_size=50000)
+            database.optimize_search_index()
+        database.close_connections()
+
+
+def populate(db_file, rows, seed=42, describe=None):
+    """Fills db_file with `rows` transactions of the default synthetic ledger."""
+    SyntheticLedger(rows, seed=seed).write(db_file, describe=describe)
+
+
+def cached_ledger(ledger, target):
+    """
+    Copies a database for `ledger` to `target`, building it in CACHE_DIR first if
+    needed. The cache is keyed by the generator parameters and the schema version.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cached = os.path.join(CACHE_DIR, f"ledger-{ledger.key()}-v{database.SCHEMA_VERSION}.db")
+    if not os.path.exists(cached):
+        building = cached + ".tmp"
+        ledger.write(building)
+        os.replace(building, cached)
+    shutil.copyfile(cached, target)
+    return target
@@ -0,0 +1,162 @@
+"""
+Benchmark suite: times the data and analysis paths against synthetic ledgers of
+several sizes, headlessly (no Kivy window), and writes the results as JSON so
+runs from different commits can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --output before.json
+    python -m benchmarks.suite --sizes 1000 10000 100000 1000000 --compare before.json
+
+Ledgers are generated deterministically and cached in benchmarks/.cache, so
+only the first run at a size pays for building it (10^7 rows takes a while).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from benchmarks.ledger import SyntheticLedger, cached_ledger
+from models import transaction_list_items
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# Fewer repetitions for operations whose cost grows with the ledger.
+POINT_REPEAT = 200
+SCAN_REPEAT = 5
+
+
+def timings(func, repeat):
+    """Runs func `repeat` times and returns summary statistics in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(samples[0], 4),
+        "median_ms": round(samples[len(samples) // 2], 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "mean_ms": round(sum(samples) / len(samples), 4),
+    }
+
+
+def main_screen_data():
+    """What MainScreen.load_transactions computes, minus the widgets: balance and the first list page."""
+    database.get_balance_in_base()
+    page = database.get_transactions_page(limit=database.TRANSACTIONS_PAGE_SIZE, newest_first=False)
+    return transaction_list_items(page)
+
+
+def bench_size(ledger, tmp, scan_repeat):
+    from utils.analysis import generate_analysis_plot, analysis_cache
+
+    db_file = cached_ledger(ledger, os.path.join(tmp, f"ledger-{ledger.rows}.db"))
+    database.DB_FILE = db_file
+    results = {}
+    results["init_db (up to date)"] = timings(database.init_db, POINT_REPEAT)
+    results["get_unique_tags"] = timings(database.get_unique_tags, scan_repeat)
+    results["get_transactions"] = timings(database.get_transactions, scan_repeat)
+    results["main screen data"] = timings(main_screen_data, scan_repeat)
+
+    def cold_analysis():
+        analysis_cache.clear()
+        generate_analysis_plot()
+
+    results["generate_analysis_plot (cold)"] = timings(cold_analysis, scan_repeat)
+    results["generate_analysis_plot (cached)"] = timings(generate_analysis_plot, POINT_REPEAT)
+
+    # Writes last, so the reads above see exactly the generated ledger
+    row = (12.5, "Benchmark row", "INR", "debit", "2024-01-01 09:00:00", "Food")
+    results["add_transaction"] = timings(lambda: database.add_transaction(*row), POINT_REPEAT)
+    database.close_connections()
+    os.remove(db_file)
+    return results
+
+
+def bench_init_db(tmp):
+    """init_db on a new file: every migration."""
+    def fresh():
+        path = os.path.join(tmp, "fresh.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        database.close_connections()
+        database.DB_FILE = path
+        database.init_db()
+
+    return timings(fresh, SCAN_REPEAT)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "schema_version": database.SCHEMA_VERSION,
+    }
+
+
+def compare(results, baseline):
+    """Prints median time ratios against a previous run (below 1.0 is faster)."""
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('time')}):")
+    for size, operations in results["sizes"].items():
+        for operation, stats in operations.items():
+            before = baseline["sizes"].get(size, {}).get(operation)
+            if before and before["median_ms"] > 0:
+                ratio = stats["median_ms"] / before["median_ms"]
+                print(f"  {size:>9} {operation:<34}{before['median_ms']:>11.3f} ->{stats['median_ms']:>11.3f} ms  x{ratio:.2f}")
+
+
+def run(sizes, seed, scan_repeat, output, baseline_path):
+    results = {"environment": environment(), "seed": seed, "sizes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["init_db (new file)"] = bench_init_db(tmp)
+        for rows in sizes:
+            ledger = SyntheticLedger(rows, seed=seed)
+            print(f"Benchmarking {rows} rows...", flush=True)
+            # The code under test prints; keep only the report on stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["sizes"][str(rows)] = bench_size(ledger, tmp, scan_repeat)
+            for operation, stats in results["sizes"][str(rows)].items():
+                print(f"  {operation:<34}{stats['median_ms']:>11.3f} ms median{stats['p95_ms']:>11.3f} ms p95")
+    print(f"init_db (new file): {results['init_db (new file)']['median_ms']:.3f} ms median")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Ledger sizes to run (e.g. 1000 ... 10000000)")
+    parser.add_argument("--seed", type=int, default=42, help="Generator seed")
+    parser.add_argument("--scan-repeat", type=int, default=SCAN_REPEAT, help="Runs of each full-ledger operation")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Print ratios against a previous results file")
+    args = parser.parse_args()
+    run(args.sizes, args.seed, args.scan_repeat, args.output, args.compare)
@@ -22,7 +22,7 @@ source.include_patterns = assets/*
 #source.exclude_exts = spec
 
 # (list) List of directory to exclude (let empty to not exclude anything)
-source.exclude_dirs = tests, bin, __pycache__, .git
+source.exclude_dirs = tests, bin, benchmarks, __pycache__, .git
 
 # (list) List of exclusions using pattern matching
 #source.exclude_patterns = license,images/*/*.jpg
@@ -35,7 +35,7 @@ version = 0.1
 # version.filename = %(source.dir)s/main.py
 
 # (list) Application requirements - SIMPLIFIED to avoid GStreamer issues
-requirements = python3==3.9,kivy==2.1.0,pillow,sqlite3,kivy_garden.graph
+requirements = python3==3.9,kivy==2.1.0,pillow,sqlite3,kivy_garden.graph,numpy,cryptography
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
@@ -158,7 +158,7 @@ p4a.disable-build-gst = true
 p4a.audio = sdl2
 
 # Disable numpy (which is causing issues)
-p4a.blacklist_requirements = numpy,pandas,matplotlib,scipy,atlantic,tornado
+p4a.blacklist_requirements = pandas,matplotlib,scipy,atlantic,tornado
 
 # (str) Python installation to use (one of cpython3)
 p4a.python_depends = openssl
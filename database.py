@@ -1,131 +1,2147 @@
 import sqlite3
-import os
+import re
+import unicodedata
+import threading
+from itertools import islice
 from datetime import datetime # Keep for potential migration default date
+from models import Transaction, transaction_row_factory
+from utils.instrumentation import timed, count, trace
+from utils.currencies import CURRENCY_EXPONENTS, DEFAULT_EXPONENT
 
 # Define the database file name
 DB_FILE = "transactions.db"
 
+# --- Connection tuning ---
+# Applied once to every connection when it is opened. WAL lets the UI read while
+# another thread writes, and NORMAL sync is safe under WAL (only the last commits
+# can be lost on power failure, never corrupted).
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-8000;",     # Negative means KiB, so ~8 MB of page cache
+    "PRAGMA mmap_size=67108864;",   # 64 MB of memory-mapped reads
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA foreign_keys=ON;",      # transactions.tag_id must name a row of tags
+)
+# Number of prepared statements sqlite3 keeps per connection. The SQL below is
+# kept in module constants so repeated calls hit this cache.
+STATEMENT_CACHE_SIZE = 64
+
+# --- SQL used by the data-access functions ---
+# date_ts is the 'YYYY-MM-DD HH:MM:SS' date as integer seconds since the Unix
+# epoch, reading the stored wall-clock time as UTC so it orders exactly like the
+# text. Lists and date ranges use it through the indexes below; `date` stays the
+# column every other reader (and the transaction log) sees. The insert statements
+# compute it from the bound date (?5 is reused), and triggers fill it in for
+# writers that don't.
+DATE_TS_SQL = "CAST(strftime('%s', {}) AS INTEGER)"
+# amount_minor is `amount` as an integer number of its currency's minor units
+# (utils/currencies.py), rounded half away from zero. Balances and aggregates are
+# integer sums of it, so they stay exact however many rows are added up; only
+# display and conversion between currencies go back to floats. Like date_ts it
+# is computed from the bound values and kept in step by triggers.
+def _minor_unit_scale_sql():
+    """CASE expression for the minor units per unit of the currency code in {currency}."""
+    by_exponent = {}
+    for code, exponent in sorted(CURRENCY_EXPONENTS.items()):
+        by_exponent.setdefault(exponent, []).append(f"'{code}'")
+    cases = " ".join(f"WHEN UPPER({{currency}}) IN ({', '.join(codes)}) THEN {10 ** exponent}"
+                     for exponent, codes in sorted(by_exponent.items()))
+    return f"CASE {cases} ELSE {10 ** DEFAULT_EXPONENT} END"
+MINOR_UNIT_SCALE_SQL = _minor_unit_scale_sql()
+AMOUNT_MINOR_SQL = "CAST(ROUND({amount} * " + MINOR_UNIT_SCALE_SQL + ") AS INTEGER)"
+# tag_id is looked up from the (canonical) tag name; see "Tags" below.
+INSERT_TRANSACTION_SQL = f'''
+    INSERT INTO transactions (amount, description, currency, transaction_type, date, tag, date_ts, amount_minor, tag_id)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, {DATE_TS_SQL.format("?5")}, {AMOUNT_MINOR_SQL.format(amount="?1", currency="?3")},
+            (SELECT id FROM tags WHERE name = ?6))
+'''
+SELECT_TRANSACTIONS_SQL = ("SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions "
+                           "ORDER BY date_ts DESC, id DESC")
+SELECT_TRANSACTIONS_BETWEEN_SQL = (
+    "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions "
+    f"WHERE date_ts >= {DATE_TS_SQL.format('?1')} AND date_ts < {DATE_TS_SQL.format('?2')} "
+    "ORDER BY date_ts {order}, id {order}"
+)
+DELETE_TRANSACTION_SQL = "DELETE FROM transactions WHERE id = ?"
+SELECT_TRANSACTIONS_BY_IDS_SQL = "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions WHERE id IN ({})"
+DELETE_TRANSACTIONS_BY_IDS_SQL = "DELETE FROM transactions WHERE id IN ({})"
+RESTORE_TRANSACTION_SQL = f'''
+    INSERT INTO transactions (id, amount, description, currency, transaction_type, date, tag, date_ts, amount_minor, tag_id)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, {DATE_TS_SQL.format("?6")}, {AMOUNT_MINOR_SQL.format(amount="?2", currency="?4")},
+            (SELECT id FROM tags WHERE name = ?7))
+'''
+UPDATE_TAG_SQL = "UPDATE transactions SET tag = ?1, tag_id = (SELECT id FROM tags WHERE name = ?1) WHERE id = ?2"
+
+# Rows returned per call to get_transactions_page (one screenful plus scroll headroom).
+TRANSACTIONS_PAGE_SIZE = 50
+
+# Ids per "id IN (...)" statement in the batch operations, below SQLite's
+# default limit of 999 bound parameters on older builds.
+ID_BATCH_SIZE = 500
+
+# Rows per UPDATE when a migration backfills a new column of an existing ledger.
+BACKFILL_BATCH_SIZE = 20000
+
+# Rows per commit for add_transactions_bulk. Large enough to amortize the commit,
+# small enough that an interrupted import loses little work.
+BULK_CHUNK_SIZE = 5000
+
+# --- Date timestamps ---
+# idx_transactions_date_ts covers the list query: it holds every selected column
+# in (date_ts, id) order, so a page or a date range is one contiguous index scan
+# with no lookups into the table, and the full list needs no sort. Filtered pages
+# use (tag_id, date_ts) since migration 11. The triggers keep date_ts right for
+# inserts that leave it out (older app versions, log replay) and for any change
+# of `date`.
+LIST_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_transactions_date_ts
+    ON transactions (date_ts, id, amount, description, currency, transaction_type, date, tag);
+'''
+DATE_TS_SCHEMA_SQL = (
+    LIST_INDEX_SQL,
+    "CREATE INDEX IF NOT EXISTS idx_transactions_tag_date_ts ON transactions (tag, date_ts);",
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_date_ts_insert AFTER INSERT ON transactions
+    WHEN NEW.date_ts IS NULL BEGIN
+        UPDATE transactions SET date_ts = {DATE_TS_SQL.format("NEW.date")} WHERE id = NEW.id;
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_date_ts_update AFTER UPDATE OF date ON transactions BEGIN
+        UPDATE transactions SET date_ts = {DATE_TS_SQL.format("NEW.date")} WHERE id = NEW.id;
+    END;
+    ''',
+)
+BACKFILL_DATE_TS_SQL = f"UPDATE transactions SET date_ts = {DATE_TS_SQL.format('date')} WHERE id >= ? AND id < ?"
+STALE_DATE_TS_SQL = f"SELECT COUNT(*) FROM transactions WHERE date_ts IS NOT {DATE_TS_SQL.format('date')}"
+REPAIR_DATE_TS_SQL = (f"UPDATE transactions SET date_ts = {DATE_TS_SQL.format('date')} "
+                      f"WHERE date_ts IS NOT {DATE_TS_SQL.format('date')}")
+
+# --- Amount triggers ---
+AMOUNT_MINOR_SCHEMA_SQL = (
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_amount_minor_insert AFTER INSERT ON transactions
+    WHEN NEW.amount_minor IS NULL BEGIN
+        UPDATE transactions SET amount_minor = {AMOUNT_MINOR_SQL.format(amount="NEW.amount", currency="NEW.currency")}
+        WHERE id = NEW.id;
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_amount_minor_update AFTER UPDATE OF amount, currency ON transactions BEGIN
+        UPDATE transactions SET amount_minor = {AMOUNT_MINOR_SQL.format(amount="NEW.amount", currency="NEW.currency")}
+        WHERE id = NEW.id;
+    END;
+    ''',
+)
+BACKFILL_AMOUNT_MINOR_SQL = (f"UPDATE transactions SET amount_minor = {AMOUNT_MINOR_SQL.format(amount='amount', currency='currency')} "
+                             "WHERE id >= ? AND id < ?")
+
+# --- Materialized aggregates ---
+# ledger_totals holds one row per (currency, type) and ledger_daily one row per
+# (day, currency, type, tag), with integer totals in minor units. Triggers on
+# transactions keep both in step with every insert, update and delete, so
+# balances and summaries never rescan rows. The triggers encode the amount
+# themselves rather than read amount_minor, which a writer that only sets
+# `amount` (log replay) leaves to be fixed up by the triggers above.
+_NEW_MINOR = AMOUNT_MINOR_SQL.format(amount="NEW.amount", currency="NEW.currency")
+_OLD_MINOR = AMOUNT_MINOR_SQL.format(amount="OLD.amount", currency="OLD.currency")
+_ADD_NEW_TOTALS = f'''
+        INSERT INTO ledger_totals (currency, transaction_type, tx_count, total_minor)
+        VALUES (NEW.currency, NEW.transaction_type, 1, {_NEW_MINOR})
+        ON CONFLICT (currency, transaction_type) DO UPDATE SET
+            tx_count = tx_count + 1, total_minor = total_minor + excluded.total_minor;
+        INSERT INTO ledger_daily (day, currency, transaction_type, tag, tx_count, total_minor)
+        VALUES (substr(NEW.date, 1, 10), NEW.currency, NEW.transaction_type, IFNULL(NEW.tag, ''), 1, {_NEW_MINOR})
+        ON CONFLICT (day, currency, transaction_type, tag) DO UPDATE SET
+            tx_count = tx_count + 1, total_minor = total_minor + excluded.total_minor;'''
+_REMOVE_OLD_TOTALS = f'''
+        UPDATE ledger_totals SET tx_count = tx_count - 1, total_minor = total_minor - {_OLD_MINOR}
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type;
+        DELETE FROM ledger_totals
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type AND tx_count <= 0;
+        UPDATE ledger_daily SET tx_count = tx_count - 1, total_minor = total_minor - {_OLD_MINOR}
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '');
+        DELETE FROM ledger_daily
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '') AND tx_count <= 0;'''
+AGGREGATE_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_totals (
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        total_minor INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (currency, transaction_type)
+    ) WITHOUT ROWID;
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_daily (
+        day TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        total_minor INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, currency, transaction_type, tag)
+    ) WITHOUT ROWID;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_insert AFTER INSERT ON transactions BEGIN{_ADD_NEW_TOTALS}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_delete AFTER DELETE ON transactions BEGIN{_REMOVE_OLD_TOTALS}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_update
+    AFTER UPDATE OF amount, currency, transaction_type, date, tag ON transactions BEGIN{_REMOVE_OLD_TOTALS}{_ADD_NEW_TOTALS}
+    END;
+    ''',
+)
+# The same groupings computed from the raw rows, for rebuilds and consistency checks.
+RAW_TOTALS_SQL = '''
+    SELECT currency, transaction_type, COUNT(*), SUM(amount_minor)
+    FROM transactions GROUP BY currency, transaction_type
+'''
+RAW_DAILY_SQL = '''
+    SELECT substr(date, 1, 10), currency, transaction_type, IFNULL(tag, ''), COUNT(*), SUM(amount_minor)
+    FROM transactions GROUP BY 1, 2, 3, 4
+'''
+# Converted (float) sums drift slightly with insertion order; differences below this are not errors.
+AGGREGATE_TOLERANCE = 1e-6
+
+# --- Tags ---
+# One row per distinct tag, keyed by its case-folded name (fold_tag), so 'Food',
+# 'food' and 'FOOD' are one tag. It keeps the spelling it was first entered
+# with, or the most used one for case variants merged by migration 11.
+# transactions.tag_id references it, and transactions.tag holds the same
+# canonical spelling for the aggregates, budgets and search that are keyed by
+# text. tx_count is kept by triggers, so the tags in use are read from this
+# small table instead of a DISTINCT scan of the ledger. Folding is done in
+# Python (_canonical_tags) by the data-access functions; the triggers, which
+# must work for any connection, only resolve tag_id from an exact canonical
+# name. Rows they can't resolve keep a NULL tag_id until check_aggregates
+# repairs them.
+DEFAULT_TAG = "Uncategorized"
+_RESOLVE_TAG_ID = '''
+        UPDATE transactions SET tag_id = (SELECT id FROM tags WHERE name = NEW.tag)
+        WHERE id = NEW.id AND tag_id IS NOT (SELECT id FROM tags WHERE name = NEW.tag);'''
+TAGS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        folded TEXT NOT NULL UNIQUE,
+        tx_count INTEGER NOT NULL DEFAULT 0
+    );
+'''
+TAGS_SCHEMA_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_transactions_tag_id_date_ts ON transactions (tag_id, date_ts);",
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_tag_id_insert AFTER INSERT ON transactions
+    WHEN NEW.tag_id IS NULL BEGIN{_RESOLVE_TAG_ID}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_tag_id_update AFTER UPDATE OF tag ON transactions BEGIN{_RESOLVE_TAG_ID}
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_tags_count_insert AFTER INSERT ON transactions
+    WHEN NEW.tag_id IS NOT NULL BEGIN
+        UPDATE tags SET tx_count = tx_count + 1 WHERE id = NEW.tag_id;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_tags_count_delete AFTER DELETE ON transactions
+    WHEN OLD.tag_id IS NOT NULL BEGIN
+        UPDATE tags SET tx_count = tx_count - 1 WHERE id = OLD.tag_id;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_tags_count_update AFTER UPDATE OF tag_id ON transactions
+    WHEN OLD.tag_id IS NOT NEW.tag_id BEGIN
+        UPDATE tags SET tx_count = tx_count - 1 WHERE id = OLD.tag_id;
+        UPDATE tags SET tx_count = tx_count + 1 WHERE id = NEW.tag_id;
+    END;
+    ''',
+)
+INSERT_TAG_SQL = "INSERT OR IGNORE INTO tags (name, folded) VALUES (?, ?)"
+SELECT_TAG_NAME_SQL = "SELECT name FROM tags WHERE folded = ?"
+SELECT_TAG_COUNTS_SQL = "SELECT name, tx_count FROM tags WHERE tx_count > 0 ORDER BY folded"
+RECOUNT_TAGS_SQL = "UPDATE tags SET tx_count = (SELECT COUNT(*) FROM transactions WHERE tag_id = tags.id)"
+STORED_TAG_COUNTS_SQL = '''
+    SELECT name, tx_count, (SELECT COUNT(*) FROM transactions WHERE tag_id = tags.id) FROM tags
+'''
+# Rows whose tag text isn't their tag's canonical spelling (or that have no tag_id).
+STALE_TAGS_SQL = "SELECT COUNT(*) FROM transactions t LEFT JOIN tags g ON g.id = t.tag_id WHERE t.tag IS NOT g.name"
+RESPELL_TAGS_SQL = '''
+    UPDATE transactions SET tag = (SELECT name FROM tags WHERE id = tag_id)
+    WHERE tag_id IS NOT NULL AND tag IS NOT (SELECT name FROM tags WHERE id = tag_id)
+'''
+
+# --- Exchange rates ---
+# Dated rates to the base currency (INR). A rate applies from its effective_date
+# until the next one for the same currency; dates before a currency's first rate
+# use that first rate. Seeded once with these values, effective from the epoch.
+BASE_CURRENCY = "INR"
+DEFAULT_EXCHANGE_RATES = {
+    "INR": 1.0,
+    "USD": 83.0,  # 1 USD = 83 INR (approx)
+    "EUR": 90.0,  # 1 EUR = 90 INR (approx)
+    "GBP": 105.0,  # 1 GBP = 105 INR (approx)
+    "JPY": 0.55,  # 1 JPY = 0.55 INR (approx)
+}
+DEFAULT_RATES_DATE = "1970-01-01"
+UPSERT_EXCHANGE_RATE_SQL = '''
+    INSERT INTO exchange_rates (currency, effective_date, rate) VALUES (?, ?, ?)
+    ON CONFLICT (currency, effective_date) DO UPDATE SET rate = excluded.rate
+'''
+# Effective date of the rate that converts {currency} on {day}: the latest one
+# on or before it, else the currency's earliest ('' if it has no rates). Uses the
+# exchange_rates primary key.
+RATE_PERIOD_SQL = '''IFNULL(
+    IFNULL((SELECT r.effective_date FROM exchange_rates r WHERE r.currency = UPPER({currency}) AND r.effective_date <= {day}
+            ORDER BY r.effective_date DESC LIMIT 1),
+           (SELECT r.effective_date FROM exchange_rates r WHERE r.currency = UPPER({currency})
+            ORDER BY r.effective_date LIMIT 1)),
+    '')'''
+
+# --- Balance by rate period ---
+# ledger_rate_periods holds the net change (credits minus debits, in minor units)
+# per currency and rate period, a period being the effective_date of the rate
+# that converts it (RATE_PERIOD_SQL). Triggers keep it in step like
+# ledger_daily, so the balance in the base currency converts one row per
+# (currency, rate) instead of one per day of history. New rates move days
+# between periods, so upsert_exchange_rates rebuilds it from ledger_daily.
+_NEW_NET = f"CASE NEW.transaction_type WHEN 'credit' THEN {_NEW_MINOR} ELSE -{_NEW_MINOR} END"
+_OLD_NET = f"CASE OLD.transaction_type WHEN 'credit' THEN {_OLD_MINOR} ELSE -{_OLD_MINOR} END"
+_NEW_PERIOD = RATE_PERIOD_SQL.format(currency="NEW.currency", day="substr(NEW.date, 1, 10)")
+_OLD_PERIOD = RATE_PERIOD_SQL.format(currency="OLD.currency", day="substr(OLD.date, 1, 10)")
+_ADD_NEW_PERIOD = f'''
+        INSERT INTO ledger_rate_periods (currency, period, tx_count, net_minor)
+        VALUES (UPPER(NEW.currency), {_NEW_PERIOD}, 1, {_NEW_NET})
+        ON CONFLICT (currency, period) DO UPDATE SET
+            tx_count = tx_count + 1, net_minor = net_minor + excluded.net_minor;'''
+_REMOVE_OLD_PERIOD = f'''
+        UPDATE ledger_rate_periods SET tx_count = tx_count - 1, net_minor = net_minor - {_OLD_NET}
+        WHERE currency = UPPER(OLD.currency) AND period = {_OLD_PERIOD};
+        DELETE FROM ledger_rate_periods
+        WHERE currency = UPPER(OLD.currency) AND period = {_OLD_PERIOD} AND tx_count <= 0;'''
+RATE_PERIODS_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_rate_periods (
+        currency TEXT NOT NULL,
+        period TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        net_minor INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (currency, period)
+    ) WITHOUT ROWID;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rate_periods_insert AFTER INSERT ON transactions BEGIN{_ADD_NEW_PERIOD}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rate_periods_delete AFTER DELETE ON transactions BEGIN{_REMOVE_OLD_PERIOD}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rate_periods_update
+    AFTER UPDATE OF amount, currency, transaction_type, date ON transactions BEGIN{_REMOVE_OLD_PERIOD}{_ADD_NEW_PERIOD}
+    END;
+    ''',
+)
+# ledger_rate_periods computed from ledger_daily, for rebuilds and consistency checks.
+RAW_RATE_PERIODS_SQL = f'''
+    SELECT UPPER(d.currency), {RATE_PERIOD_SQL.format(currency="d.currency", day="d.day")}, SUM(d.tx_count),
+           SUM(CASE d.transaction_type WHEN 'credit' THEN d.total_minor ELSE -d.total_minor END)
+    FROM ledger_daily d GROUP BY 1, 2
+'''
+# Each period's net converted at its rate (1.0 for a currency without rates).
+BALANCE_IN_BASE_SQL = '''
+    SELECT SUM(p.net_minor * IFNULL(r.rate, 1.0) / {scale})
+    FROM ledger_rate_periods p
+    LEFT JOIN exchange_rates r ON r.currency = p.currency AND r.effective_date = p.period
+'''.format(scale=MINOR_UNIT_SCALE_SQL.format(currency="p.currency"))
+MISSING_RATES_SQL = '''
+    SELECT currency, SUM(tx_count) FROM ledger_totals
+    WHERE UPPER(currency) NOT IN (SELECT currency FROM exchange_rates)
+    GROUP BY currency ORDER BY currency
+'''
+
+# --- Budgets ---
+# Monthly spending limits per tag, in the base currency. budget_spending keeps a
+# running debit total per (tag, month), converted at the rate in effect on each
+# transaction's day (RATE_IN_EFFECT_SQL, the same rule as RATE_PERIOD_SQL),
+# and is updated by triggers as rows change. Budget status is then one primary
+# key lookup per budget instead of a sum over the month's transactions. New
+# exchange rates change the converted totals, so upsert_exchange_rates
+# rebuilds it (from ledger_daily, not the raw rows).
+DEFAULT_ALERT_THRESHOLD = 0.8  # Warn once this fraction of a budget is spent
+RATE_IN_EFFECT_SQL = '''IFNULL(
+    IFNULL((SELECT r.rate FROM exchange_rates r WHERE r.currency = UPPER({currency}) AND r.effective_date <= {day}
+            ORDER BY r.effective_date DESC LIMIT 1),
+           (SELECT r.rate FROM exchange_rates r WHERE r.currency = UPPER({currency})
+            ORDER BY r.effective_date LIMIT 1)),
+    1.0)'''
+_NEW_SPENT = (f"{_NEW_MINOR} * {RATE_IN_EFFECT_SQL.format(currency='NEW.currency', day='substr(NEW.date, 1, 10)')} "
+              f"/ {MINOR_UNIT_SCALE_SQL.format(currency='NEW.currency')}")
+_OLD_SPENT = (f"{_OLD_MINOR} * {RATE_IN_EFFECT_SQL.format(currency='OLD.currency', day='substr(OLD.date, 1, 10)')} "
+              f"/ {MINOR_UNIT_SCALE_SQL.format(currency='OLD.currency')}")
+_ADD_NEW_SPENDING = f'''
+        INSERT INTO budget_spending (tag, month, tx_count, spent)
+        SELECT IFNULL(NEW.tag, ''), substr(NEW.date, 1, 7), 1, {_NEW_SPENT} WHERE NEW.transaction_type = 'debit'
+        ON CONFLICT (tag, month) DO UPDATE SET tx_count = tx_count + 1, spent = spent + excluded.spent;'''
+_REMOVE_OLD_SPENDING = f'''
+        UPDATE budget_spending SET tx_count = tx_count - 1, spent = spent - {_OLD_SPENT}
+        WHERE OLD.transaction_type = 'debit' AND tag = IFNULL(OLD.tag, '') AND month = substr(OLD.date, 1, 7);
+        DELETE FROM budget_spending
+        WHERE tag = IFNULL(OLD.tag, '') AND month = substr(OLD.date, 1, 7) AND tx_count <= 0;'''
+BUDGETS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS budgets (
+        tag TEXT PRIMARY KEY,
+        monthly_limit REAL NOT NULL CHECK(monthly_limit > 0),
+        alert_threshold REAL NOT NULL DEFAULT 0.8 CHECK(alert_threshold > 0 AND alert_threshold <= 1)
+    ) WITHOUT ROWID;
+'''
+BUDGET_SPENDING_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS budget_spending (
+        tag TEXT NOT NULL,
+        month TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        spent REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (tag, month)
+    ) WITHOUT ROWID;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_insert AFTER INSERT ON transactions BEGIN{_ADD_NEW_SPENDING}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_delete AFTER DELETE ON transactions BEGIN{_REMOVE_OLD_SPENDING}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_update
+    AFTER UPDATE OF amount, currency, transaction_type, date, tag ON transactions BEGIN{_REMOVE_OLD_SPENDING}{_ADD_NEW_SPENDING}
+    END;
+    ''',
+)
+# budget_spending computed from ledger_daily, for rebuilds and consistency checks.
+RAW_BUDGET_SPENDING_SQL = f'''
+    SELECT d.tag, substr(d.day, 1, 7), SUM(d.tx_count),
+           SUM(d.total_minor * {RATE_IN_EFFECT_SQL.format(currency="d.currency", day="d.day")}
+               / {MINOR_UNIT_SCALE_SQL.format(currency="d.currency")})
+    FROM ledger_daily d WHERE d.transaction_type = 'debit' GROUP BY 1, 2
+'''
+UPSERT_BUDGET_SQL = '''
+    INSERT INTO budgets (tag, monthly_limit, alert_threshold) VALUES (?, ?, ?)
+    ON CONFLICT (tag) DO UPDATE SET monthly_limit = excluded.monthly_limit, alert_threshold = excluded.alert_threshold
+'''
+# Every budget with its spending in one month: a primary key lookup per budget.
+BUDGET_STATUS_SQL = '''
+    SELECT b.tag, b.monthly_limit, b.alert_threshold, IFNULL(s.spent, 0.0)
+    FROM budgets b LEFT JOIN budget_spending s ON s.tag = b.tag AND s.month = ?
+    {where} ORDER BY b.tag
+'''
+
+# --- Recurring transactions ---
+# Rules that materialize transactions on a schedule (see utils/recurrence.py).
+# next_due is the date of the rule's next occurrence not yet inserted; it moves
+# forward in the same SQL transaction as the occurrences it covers, so nothing
+# is generated twice.
+RECURRING_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount REAL NOT NULL,
+        description TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL CHECK(transaction_type IN ('credit', 'debit')),
+        tag TEXT DEFAULT 'Uncategorized',
+        schedule TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        next_due TEXT,
+        end_date TEXT
+    );
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_recurring_rules_next_due ON recurring_rules (next_due) WHERE next_due IS NOT NULL;",
+)
+SELECT_RECURRING_RULES_SQL = '''
+    SELECT id, amount, description, currency, transaction_type, tag, schedule, start_date, next_due, end_date
+    FROM recurring_rules WHERE next_due IS NOT NULL
+'''
+INSERT_RECURRING_RULE_SQL = '''
+    INSERT INTO recurring_rules (amount, description, currency, transaction_type, tag, schedule, start_date, next_due, end_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+UPDATE_NEXT_DUE_SQL = "UPDATE recurring_rules SET next_due = ? WHERE id = ?"
+
+# --- Full-text search ---
+# FTS5 index over description and tag, mirroring the transactions table
+# (external content, so the text is not stored twice) and kept in sync by
+# triggers. prefix='2 3 4' adds prefix indexes, so while a word is being typed
+# its first few letters are matched by streaming one index entry.
+SEARCH_SCHEMA_SQL = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        description, tag, content='transactions', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, description, tag) VALUES (NEW.id, NEW.description, NEW.tag);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, tag)
+        VALUES ('delete', OLD.id, OLD.description, OLD.tag);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update AFTER UPDATE OF description, tag ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description, tag)
+        VALUES ('delete', OLD.id, OLD.description, OLD.tag);
+        INSERT INTO transactions_fts (rowid, description, tag) VALUES (NEW.id, NEW.description, NEW.tag);
+    END
+    ''',
+    "INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')",
+)
+# Only the most recently added this-many matches are fetched and ranked. Index
+# lookups stream in reverse id order and stop there, so a very common word costs about the same as a
+# rare one. (bm25 would first scan every match of every word.)
+SEARCH_RANK_WINDOW = 200
+# A last word shorter than this is ignored until more is typed.
+SEARCH_MIN_PREFIX = 2
+SEARCH_SQL = '''
+    SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions
+    WHERE id IN (
+        SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+    )
+'''
+# Within one tag (the list's tag filter): the window is of the matches with that tag
+SEARCH_IN_TAG_SQL = '''
+    SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions
+    WHERE tag_id = ? AND id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)
+    ORDER BY id DESC LIMIT ?
+'''
+_SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Newest first, for searching sealed descriptions (see encrypt_ledger)
+SELECT_NEWEST_TRANSACTIONS_SQL = "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions ORDER BY id DESC"
+SELECT_DESCRIPTIONS_BY_IDS_SQL = "SELECT id, description, tag FROM transactions WHERE id IN ({})"
+
+# --- Encryption at rest ---
+# Once encrypt_ledger() has run, descriptions are stored sealed (BLOBs, see
+# utils/crypto.py). The full-text index goes: its terms would be plaintext.
+DROP_SEARCH_INDEX_SQL = (
+    "DROP TRIGGER IF EXISTS trg_transactions_fts_insert",
+    "DROP TRIGGER IF EXISTS trg_transactions_fts_delete",
+    "DROP TRIGGER IF EXISTS trg_transactions_fts_update",
+    "DROP TABLE IF EXISTS transactions_fts",
+)
+# Rows still in plaintext (written before encryption, or by a writer without the
+# key such as the command line), found through a partial index that stays empty
+# once they are sealed
+PLAIN_DESCRIPTIONS_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_transactions_plain_description ON transactions (id)
+    WHERE typeof(description) = 'text'
+'''
+COUNT_PLAIN_DESCRIPTIONS_SQL = "SELECT COUNT(*) FROM transactions WHERE typeof(description) = 'text'"
+SELECT_PLAIN_DESCRIPTIONS_SQL = ("SELECT id, description FROM transactions "
+                                 "WHERE typeof(description) = 'text' AND id > ? ORDER BY id LIMIT ?")
+UPDATE_DESCRIPTION_SQL = "UPDATE transactions SET description = ? WHERE id = ?"
+# Recurring rules are few, so theirs are sealed in one step
+SELECT_PLAIN_RULE_DESCRIPTIONS_SQL = "SELECT id, description FROM recurring_rules WHERE typeof(description) = 'text'"
+UPDATE_RULE_DESCRIPTION_SQL = "UPDATE recurring_rules SET description = ? WHERE id = ?"
+# Whether descriptions were sealed, from the schema alone: finish_encryption
+# leaves the plaintext-row index, and until then the first encryption runs
+# without the list index
+ENCRYPTED_SCHEMA_SQL = '''
+    SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'idx_transactions_plain_description')
+        OR NOT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'idx_transactions_date_ts')
+'''
+# Sealed rows are found through keyed search tokens instead: the
+# LedgerCipher.search_token of the first 2, 3 and 4 letters of each word of the
+# description and tag, kept as the terms of a contentless full-text index (so
+# only row ids are stored under each token, and rows are filed in any order
+# cheaply). Search looks up the rows filed under every word of the query, newest
+# first, and opens only those. Under one key the tokens are deterministic, so
+# they show which rows share a word's first letters (never the letters), the
+# price of any index. The triggers call row_search_tokens(), a SQL function
+# registered on every connection (_row_search_tokens). Without the key it can't
+# compute them and files the row under PENDING_SEARCH_TOKEN, to be indexed at
+# the next unlock. A contentless index can't forget a row without its tokens,
+# so those of deleted rows and old tags stay: they only add candidates that
+# fail the match.
+SEARCH_TOKEN_PREFIXES = (2, 3, 4)
+PENDING_SEARCH_TOKEN = "pending"  # Not hex, so never a token
+SEARCH_TOKENS_SCHEMA_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_tokens USING fts5(tokens, content='', detail=none, columnsize=0)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_search_tokens_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO search_tokens (rowid, tokens) VALUES (NEW.id, row_search_tokens(NEW.description, NEW.tag));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_search_tokens_update AFTER UPDATE OF description, tag ON transactions BEGIN
+        INSERT INTO search_tokens (rowid, tokens) VALUES (NEW.id, row_search_tokens(NEW.description, NEW.tag));
+    END
+    ''',
+)
+# Rows sealed before the tokens existed are indexed like pending ones
+QUEUE_SEALED_ROWS_SQL = (f"INSERT INTO search_tokens (rowid, tokens) "
+                         f"SELECT id, '{PENDING_SEARCH_TOKEN}' FROM transactions WHERE typeof(description) = 'blob'")
+COUNT_PENDING_TOKENS_SQL = f"SELECT COUNT(*) FROM search_tokens WHERE search_tokens MATCH '{PENDING_SEARCH_TOKEN}'"
+SELECT_PENDING_TOKENS_SQL = f"SELECT rowid FROM search_tokens WHERE search_tokens MATCH '{PENDING_SEARCH_TOKEN}' LIMIT ?"
+DELETE_PENDING_TOKEN_SQL = (f"INSERT INTO search_tokens (search_tokens, rowid, tokens) "
+                            f"VALUES ('delete', ?, '{PENDING_SEARCH_TOKEN}')")
+INSERT_SEARCH_TOKENS_SQL = "INSERT INTO search_tokens (rowid, tokens) VALUES (?, ?)"
+SEARCH_TOKENS_SQL = '''
+    SELECT t.id, t.amount, t.description, t.currency, t.transaction_type, t.date, t.tag
+    FROM search_tokens s JOIN transactions t ON t.id = s.rowid
+    WHERE search_tokens MATCH ? ORDER BY s.rowid DESC
+'''
+# Shown for a sealed description while no cipher is set, or if it can't be opened
+SEALED_PLACEHOLDER = "(encrypted)"
+UNREADABLE_PLACEHOLDER = "(unreadable)"
+
+# --- Connection pool ---
+# One long-lived connection per thread, shared by every data-access call made on
+# that thread. Connections are reopened when DB_FILE changes or after
+# close_connections().
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool = []
+_pool_generation = 0
+
+
+# --- Ledger version ---
+# Bumped after every committed write made through this module. Combined with
+# PRAGMA data_version (which changes when any *other* connection commits) it
+# identifies the ledger's contents for caches such as utils/analysis.py's.
+_ledger_version = 0
+_ledger_version_lock = threading.Lock()
+
+
+def _bump_ledger_version():
+    global _ledger_version
+    with _ledger_version_lock:
+        _ledger_version += 1
+
+
+def get_ledger_version():
+    """Returns a value that changes whenever the transactions (or exchange rates) may have changed."""
+    try:
+        data_version = get_connection().execute("PRAGMA data_version;").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"!!! Database Error reading data_version: {e}")
+        data_version = None
+    return (DB_FILE, _ledger_version, data_version)
+
+
+def _open_connection(db_file):
+    """Opens a connection to db_file and applies CONNECTION_PRAGMAS."""
+    # check_same_thread=False only so close_connections() may close it from
+    # another thread; each connection is still used by a single thread.
+    conn = sqlite3.connect(db_file, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    conn.create_function("row_search_tokens", 2, _row_search_tokens)
+    return conn
+
+
+def get_connection():
+    """Returns the calling thread's persistent connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.db_file != DB_FILE or _local.generation != _pool_generation:
+        conn = _open_connection(DB_FILE)
+        with _pool_lock:
+            _pool.append(conn)
+            _local.generation = _pool_generation
+        _local.conn = conn
+        _local.db_file = DB_FILE
+    return conn
+
+
+def close_connections():
+    """Closes every pooled connection (e.g. on app exit, or before replacing the DB file)."""
+    global _pool_generation
+    with _pool_lock:
+        for conn in _pool:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"!!! Database Error closing connection: {e}")
+        _pool.clear()
+        _pool_generation += 1
+
+
+# --- Aggregates as migrations 4 and 7 shipped them ---
+# Float totals (amount, not amount_minor) and the triggers that kept them.
+# Migrations that have shipped are never edited, so 4 and 7 still build these
+# shapes; migration 10 then replaces them with the minor-unit ones above.
+_V4_AGGREGATE_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_totals (
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (currency, transaction_type)
+    ) WITHOUT ROWID;
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_daily (
+        day TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, currency, transaction_type, tag)
+    ) WITHOUT ROWID;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO ledger_totals (currency, transaction_type, tx_count, total)
+        VALUES (NEW.currency, NEW.transaction_type, 1, NEW.amount)
+        ON CONFLICT (currency, transaction_type) DO UPDATE SET
+            tx_count = tx_count + 1, total = total + excluded.total;
+        INSERT INTO ledger_daily (day, currency, transaction_type, tag, tx_count, total)
+        VALUES (substr(NEW.date, 1, 10), NEW.currency, NEW.transaction_type, IFNULL(NEW.tag, ''), 1, NEW.amount)
+        ON CONFLICT (day, currency, transaction_type, tag) DO UPDATE SET
+            tx_count = tx_count + 1, total = total + excluded.total;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_delete AFTER DELETE ON transactions BEGIN
+        UPDATE ledger_totals SET tx_count = tx_count - 1, total = total - OLD.amount
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type;
+        DELETE FROM ledger_totals
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type AND tx_count <= 0;
+        UPDATE ledger_daily SET tx_count = tx_count - 1, total = total - OLD.amount
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '');
+        DELETE FROM ledger_daily
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '') AND tx_count <= 0;
+    END;
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_update
+    AFTER UPDATE OF amount, currency, transaction_type, date, tag ON transactions BEGIN
+        UPDATE ledger_totals SET tx_count = tx_count - 1, total = total - OLD.amount
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type;
+        DELETE FROM ledger_totals
+        WHERE currency = OLD.currency AND transaction_type = OLD.transaction_type AND tx_count <= 0;
+        UPDATE ledger_daily SET tx_count = tx_count - 1, total = total - OLD.amount
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '');
+        DELETE FROM ledger_daily
+        WHERE day = substr(OLD.date, 1, 10) AND currency = OLD.currency
+          AND transaction_type = OLD.transaction_type AND tag = IFNULL(OLD.tag, '') AND tx_count <= 0;
+        INSERT INTO ledger_totals (currency, transaction_type, tx_count, total)
+        VALUES (NEW.currency, NEW.transaction_type, 1, NEW.amount)
+        ON CONFLICT (currency, transaction_type) DO UPDATE SET
+            tx_count = tx_count + 1, total = total + excluded.total;
+        INSERT INTO ledger_daily (day, currency, transaction_type, tag, tx_count, total)
+        VALUES (substr(NEW.date, 1, 10), NEW.currency, NEW.transaction_type, IFNULL(NEW.tag, ''), 1, NEW.amount)
+        ON CONFLICT (day, currency, transaction_type, tag) DO UPDATE SET
+            tx_count = tx_count + 1, total = total + excluded.total;
+    END;
+    ''',
+)
+_V4_RAW_TOTALS_SQL = '''
+    SELECT currency, transaction_type, COUNT(*), SUM(amount)
+    FROM transactions GROUP BY currency, transaction_type
+'''
+_V4_RAW_DAILY_SQL = '''
+    SELECT substr(date, 1, 10), currency, transaction_type, IFNULL(tag, ''), COUNT(*), SUM(amount)
+    FROM transactions GROUP BY 1, 2, 3, 4
+'''
+_V7_NEW_SPENT = "NEW.amount * " + RATE_IN_EFFECT_SQL.format(currency="NEW.currency", day="substr(NEW.date, 1, 10)")
+_V7_OLD_SPENT = "OLD.amount * " + RATE_IN_EFFECT_SQL.format(currency="OLD.currency", day="substr(OLD.date, 1, 10)")
+_V7_ADD_NEW_SPENDING = f'''
+        INSERT INTO budget_spending (tag, month, tx_count, spent)
+        SELECT IFNULL(NEW.tag, ''), substr(NEW.date, 1, 7), 1, {_V7_NEW_SPENT} WHERE NEW.transaction_type = 'debit'
+        ON CONFLICT (tag, month) DO UPDATE SET tx_count = tx_count + 1, spent = spent + excluded.spent;'''
+_V7_REMOVE_OLD_SPENDING = f'''
+        UPDATE budget_spending SET tx_count = tx_count - 1, spent = spent - {_V7_OLD_SPENT}
+        WHERE OLD.transaction_type = 'debit' AND tag = IFNULL(OLD.tag, '') AND month = substr(OLD.date, 1, 7);
+        DELETE FROM budget_spending
+        WHERE tag = IFNULL(OLD.tag, '') AND month = substr(OLD.date, 1, 7) AND tx_count <= 0;'''
+_V7_BUDGET_SPENDING_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS budget_spending (
+        tag TEXT NOT NULL,
+        month TEXT NOT NULL,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        spent REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (tag, month)
+    ) WITHOUT ROWID;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_insert AFTER INSERT ON transactions BEGIN{_V7_ADD_NEW_SPENDING}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_delete AFTER DELETE ON transactions BEGIN{_V7_REMOVE_OLD_SPENDING}
+    END;
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_budget_update
+    AFTER UPDATE OF amount, currency, transaction_type, date, tag ON transactions BEGIN{_V7_REMOVE_OLD_SPENDING}{_V7_ADD_NEW_SPENDING}
+    END;
+    ''',
+)
+_V7_RAW_BUDGET_SPENDING_SQL = f'''
+    SELECT d.tag, substr(d.day, 1, 7), SUM(d.tx_count),
+           SUM(d.total * {RATE_IN_EFFECT_SQL.format(currency="d.currency", day="d.day")})
+    FROM ledger_daily d WHERE d.transaction_type = 'debit' GROUP BY 1, 2
+'''
+
+# --- Schema migrations ---
+# Migration N brings the schema from user_version N - 1 to N. Databases created
+# before versioning report user_version 0 whatever their shape, so the early
+# migrations check what already exists instead of assuming an empty file.
+
+def _migration_1_transactions(cursor):
+    """Transactions table, adding the 'date' and 'tag' columns missing from older schemas."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL NOT NULL,
+            description TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            transaction_type TEXT NOT NULL CHECK(transaction_type IN ('credit', 'debit')),
+            date TEXT NOT NULL,
+            tag TEXT DEFAULT 'Uncategorized'
+        );
+    ''')
+    cursor.execute("PRAGMA table_info(transactions);")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'date' not in columns:
+        print("Schema migration: adding 'date' column.")
+        cursor.execute("ALTER TABLE transactions ADD COLUMN date TEXT DEFAULT '1970-01-01 00:00:00';")
+    if 'tag' not in columns:
+        print("Schema migration: adding 'tag' column.")
+        cursor.execute("ALTER TABLE transactions ADD COLUMN tag TEXT DEFAULT 'Uncategorized';")
+
+def _migration_2_import_progress(cursor):
+    """Bookkeeping for resumable imports (see utils/importer.py)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        );
+    ''')
+
+def _migration_3_paging_indexes(cursor):
+    """Indexes for filtered, date-ordered paging (replaced by the date_ts ones in migration 9)."""
+    # SQLite appends the rowid (id) to every index, so these also serve
+    # the (date, id) keyset order.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_tag_date ON transactions (tag, date);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);")
+
+def _migration_4_aggregates(cursor):
+    """Materialized balance aggregates and their triggers, built from the existing rows."""
+    for statement in _V4_AGGREGATE_SCHEMA_SQL:
+        cursor.execute(statement)
+    cursor.execute(f"INSERT INTO ledger_totals (currency, transaction_type, tx_count, total) {_V4_RAW_TOTALS_SQL}")
+    cursor.execute(f"INSERT INTO ledger_daily (day, currency, transaction_type, tag, tx_count, total) {_V4_RAW_DAILY_SQL}")
+
+def _migration_5_exchange_rates(cursor):
+    """Dated exchange rates, seeded with the defaults."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT NOT NULL,
+            effective_date TEXT NOT NULL,
+            rate REAL NOT NULL CHECK(rate > 0),
+            PRIMARY KEY (currency, effective_date)
+        ) WITHOUT ROWID;
+    ''')
+    cursor.execute("SELECT 1 FROM exchange_rates LIMIT 1;")
+    if cursor.fetchone() is None:
+        cursor.executemany(UPSERT_EXCHANGE_RATE_SQL, [
+            (currency, DEFAULT_RATES_DATE, rate) for currency, rate in DEFAULT_EXCHANGE_RATES.items()
+        ])
+
+def _migration_6_search_index(cursor):
+    """Full-text index for search_transactions, if this SQLite has FTS5."""
+    if not _fts5_available(cursor):
+        print("Warning: SQLite was built without FTS5; search will use slower LIKE matching.")
+        return
+    for statement in SEARCH_SCHEMA_SQL:
+        cursor.execute(statement)
+
+def _migration_7_budgets(cursor):
+    """Per-tag monthly budgets and the trigger-maintained spending accumulator."""
+    cursor.execute(BUDGETS_TABLE_SQL)
+    for statement in _V7_BUDGET_SPENDING_SCHEMA_SQL:
+        cursor.execute(statement)
+    cursor.execute(f"INSERT INTO budget_spending (tag, month, tx_count, spent) {_V7_RAW_BUDGET_SPENDING_SQL}")
+
+def _migration_8_recurring_rules(cursor):
+    """Rules for recurring transactions."""
+    for statement in RECURRING_SCHEMA_SQL:
+        cursor.execute(statement)
+
+def _migration_9_date_timestamps(cursor):
+    """Integer date_ts column, backfilled in batches, replacing the text date indexes."""
+    cursor.execute("PRAGMA table_info(transactions);")
+    if 'date_ts' not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN date_ts INTEGER;")
+    # Backfill by id range before creating the indexes, so they are built once
+    # from sorted data instead of updated row by row
+    low, high = cursor.execute("SELECT MIN(id), MAX(id) FROM transactions;").fetchone()
+    if low is not None:
+        for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+            cursor.execute(BACKFILL_DATE_TS_SQL, (start, start + BACKFILL_BATCH_SIZE))
+            trace("date_ts backfill: ids up to %d of %d", min(start + BACKFILL_BATCH_SIZE - 1, high), high)
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_date;")
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_tag_date;")
+    for statement in DATE_TS_SCHEMA_SQL:
+        cursor.execute(statement)
+
+def _migration_10_minor_units(cursor):
+    """
+    Integer amount_minor column, backfilled in batches, and every aggregate
+    rebuilt from it (they are derived data, so their tables are recreated).
+    """
+    cursor.execute("PRAGMA table_info(transactions);")
+    if 'amount_minor' not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN amount_minor INTEGER;")
+    low, high = cursor.execute("SELECT MIN(id), MAX(id) FROM transactions;").fetchone()
+    if low is not None:
+        for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+            cursor.execute(BACKFILL_AMOUNT_MINOR_SQL, (start, start + BACKFILL_BATCH_SIZE))
+            trace("amount_minor backfill: ids up to %d of %d", min(start + BACKFILL_BATCH_SIZE - 1, high), high)
+    for trigger in ("trg_ledger_insert", "trg_ledger_delete", "trg_ledger_update",
+                    "trg_budget_insert", "trg_budget_delete", "trg_budget_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    for table in ("ledger_totals", "ledger_daily", "budget_spending"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table};")
+    for statement in AMOUNT_MINOR_SCHEMA_SQL + AGGREGATE_SCHEMA_SQL + BUDGET_SPENDING_SCHEMA_SQL:
+        cursor.execute(statement)
+    _rebuild_aggregates(cursor)
+    _rebuild_budget_spending(cursor)
+
+def _merge_tag_spellings(spellings):
+    """
+    Canonical spelling for each of `spellings` ({spelling: rows using it}):
+    case variants go to the most used one (ties to the first in sort order),
+    and empty tags to DEFAULT_TAG.
+    """
+    groups = {}
+    for spelling, rows in spellings.items():
+        groups.setdefault(fold_tag(spelling or DEFAULT_TAG), []).append((spelling, rows))
+    canonical = {}
+    for variants in groups.values():
+        uses = {}
+        for spelling, rows in variants:
+            uses[spelling or DEFAULT_TAG] = uses.get(spelling or DEFAULT_TAG, 0) + rows
+        name = min(uses, key=lambda name: (-uses[name], name))
+        canonical.update((spelling, name) for spelling, _ in variants)
+    return canonical
+
+def _migration_11_tags(cursor):
+    """
+    Tags table keyed by case-folded name and transactions.tag_id referencing it.
+    Case variants of a tag (in transactions, budgets and recurring rules) are
+    merged into its most used spelling.
+    """
+    cursor.execute(TAGS_TABLE_SQL)
+    cursor.execute("PRAGMA table_info(transactions);")
+    if 'tag_id' not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN tag_id INTEGER REFERENCES tags(id);")
+    spellings = dict(cursor.execute("SELECT tag, COUNT(*) FROM transactions GROUP BY tag;").fetchall())
+    for table in ("budgets", "recurring_rules"):
+        for (spelling,) in cursor.execute(f"SELECT DISTINCT tag FROM {table};").fetchall():
+            spellings.setdefault(spelling, 0)
+    canonical = _merge_tag_spellings(spellings)
+    cursor.executemany(INSERT_TAG_SQL, [(name, fold_tag(name)) for name in sorted(set(canonical.values()))])
+    for spelling, name in canonical.items():
+        if spelling != name:
+            trace("Merging tag %r into %r", spelling, name)
+            # The aggregate, budget and search triggers move the merged rows' totals
+            cursor.execute("UPDATE transactions SET tag = ? WHERE tag IS ?;", (name, spelling))
+            cursor.execute("UPDATE recurring_rules SET tag = ? WHERE tag IS ?;", (name, spelling))
+            # A variant's budget is dropped if the canonical tag already has one
+            cursor.execute("UPDATE OR IGNORE budgets SET tag = ? WHERE tag IS ?;", (name, spelling))
+            cursor.execute("DELETE FROM budgets WHERE tag IS ?;", (spelling,))
+    # One indexed update per tag, before the count triggers exist; then count once
+    for tag_id, name in cursor.execute("SELECT id, name FROM tags;").fetchall():
+        cursor.execute("UPDATE transactions SET tag_id = ? WHERE tag = ? AND tag_id IS NOT ?;", (tag_id, name, tag_id))
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_tag_date_ts;")
+    for statement in TAGS_SCHEMA_SQL:
+        cursor.execute(statement)
+    cursor.execute(RECOUNT_TAGS_SQL)
+
+def _migration_12_rate_periods(cursor):
+    """Balance totals per currency and rate period, built from ledger_daily."""
+    for statement in RATE_PERIODS_SCHEMA_SQL:
+        cursor.execute(statement)
+    _rebuild_rate_periods(cursor)
+
+# Append only: a migration's position is its version number.
+MIGRATIONS = (
+    _migration_1_transactions,
+    _migration_2_import_progress,
+    _migration_3_paging_indexes,
+    _migration_4_aggregates,
+    _migration_5_exchange_rates,
+    _migration_6_search_index,
+    _migration_7_budgets,
+    _migration_8_recurring_rules,
+    _migration_9_date_timestamps,
+    _migration_10_minor_units,
+    _migration_11_tags,
+    _migration_12_rate_periods,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn=None):
+    """Returns the database's PRAGMA user_version."""
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+@timed("db.init_db")
 def init_db():
     """
-    Initialize the database: create the table if it doesn't exist,
-    and handle schema migration (like adding 'date' and 'tag' columns).
+    Brings the database schema up to SCHEMA_VERSION.
+
+    An up-to-date database costs a single PRAGMA read. Otherwise every pending
+    migration runs, and user_version is updated, in one transaction: a failure
+    leaves the database exactly as it was.
+    """
+    try:
+        conn = get_connection()
+        if get_schema_version(conn) == SCHEMA_VERSION:
+            return
+        cursor = conn.cursor()
+        # IMMEDIATE takes the write lock first, so a concurrent process can't
+        # migrate at the same time; re-read the version under the lock.
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            version = get_schema_version(conn)
+            if version > SCHEMA_VERSION:
+                print(f"Warning: database '{DB_FILE}' has schema version {version}, newer than this app's {SCHEMA_VERSION}.")
+            elif version < SCHEMA_VERSION:
+                print(f"Migrating database '{DB_FILE}' from schema version {version} to {SCHEMA_VERSION}...")
+                for migration in MIGRATIONS[version:]:
+                    migration(cursor)
+                # PRAGMA arguments can't be bound; SCHEMA_VERSION is an int constant
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if version < SCHEMA_VERSION:
+            _bump_ledger_version()
+            print("Database migration finished.")
+
+    except sqlite3.Error as e:
+        print(f"!!! Database Error during initialization: {e}")
+
+def fold_tag(tag):
+    """The case-insensitive key of a tag: 'Food', 'FOOD' and 'food' all fold to 'food'."""
+    return tag.casefold()
+
+def _canonical_tags(cursor, tags):
+    """
+    Maps each distinct tag in `tags` to its canonical spelling (empty ones to
+    DEFAULT_TAG), adding a tags row for any not seen before, spelled as it first
+    appears. Runs in the caller's SQL transaction, so new rows go away with it
+    on rollback.
     """
-    db_existed = os.path.exists(DB_FILE)
-    print(f"Initializing database '{DB_FILE}'...")
-    if not db_existed:
-        print("Database file not found, creating new one.")
+    canonical = {}
+    for tag in dict.fromkeys(tags):
+        folded = fold_tag(tag or DEFAULT_TAG)
+        cursor.execute(INSERT_TAG_SQL, (tag or DEFAULT_TAG, folded))
+        canonical[tag] = cursor.execute(SELECT_TAG_NAME_SQL, (folded,)).fetchone()[0]
+    return canonical
+
+# --- Encryption at rest ---
+# Set at login (screens/login_screen.py). Descriptions are sealed as they are
+# written and opened as rows are read (_transaction_row). Amounts, dates,
+# currencies and tags stay plain: the indexes, triggers and aggregates compute
+# on them.
+_ledger_cipher = None
+
+def set_ledger_cipher(cipher):
+    """Seals descriptions written from now on with `cipher` (a utils.crypto.LedgerCipher, or None)."""
+    global _ledger_cipher
+    _ledger_cipher = cipher
+
+def seal_description(description):
+    """`description` as it is stored: sealed (bytes) while a cipher is set, else unchanged."""
+    if _ledger_cipher is None or isinstance(description, bytes):
+        return description
+    return _ledger_cipher.seal(description)
 
+def has_sealed_descriptions():
+    """
+    Whether descriptions are stored sealed, i.e. the ledger was encrypted with
+    some password's key. Reads only the schema (see ENCRYPTED_SCHEMA_SQL).
+    """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
+        return bool(get_connection().execute(ENCRYPTED_SCHEMA_SQL).fetchone()[0])
+    except sqlite3.Error as e:
+        print(f"!!! Database Error checking for sealed descriptions: {e}")
+        return False
 
-            # --- Step 1: Ensure the table exists with the latest schema ---
-            # The schema includes id, amount, description, currency, transaction_type, date, tag
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    amount REAL NOT NULL,
-                    description TEXT NOT NULL,
-                    currency TEXT NOT NULL,
-                    transaction_type TEXT NOT NULL CHECK(transaction_type IN ('credit', 'debit')),
-                    date TEXT NOT NULL,
-                    tag TEXT DEFAULT 'Uncategorized'
-                );
-            ''')
-            print("Ensured 'transactions' table exists with base schema.")
-
-            # --- Step 2: Check for and add missing columns ('date', 'tag') ---
-            cursor.execute("PRAGMA table_info(transactions);")
-            columns = [col[1] for col in cursor.fetchall()]
-
-            if 'date' not in columns:
-                print("Schema migration: 'date' column not found. Adding it with a default.")
-                try:
-                    cursor.execute("ALTER TABLE transactions ADD COLUMN date TEXT DEFAULT '1970-01-01 00:00:00';")
-                    conn.commit()
-                    print("'date' column added successfully.")
-                except sqlite3.Error as e:
-                    print(f"!!! Error adding 'date' column: {e}")
-                    conn.rollback() # Rollback if adding column fails
-            else:
-                print("'date' column already exists.")
+def _open_description(sealed):
+    if _ledger_cipher is None:
+        return SEALED_PLACEHOLDER
+    try:
+        return _ledger_cipher.open(sealed)
+    except ValueError:
+        return UNREADABLE_PLACEHOLDER
 
-            if 'tag' not in columns:
-                print("Schema migration: 'tag' column not found. Adding it with a default 'Uncategorized'.")
-                try:
-                    cursor.execute("ALTER TABLE transactions ADD COLUMN tag TEXT DEFAULT 'Uncategorized';")
-                    conn.commit()
-                    print("'tag' column added successfully.")
-                except sqlite3.Error as e:
-                    print(f"!!! Error adding 'tag' column: {e}")
-                    conn.rollback()
-            else:
-                print("'tag' column already exists.")
-            
-            conn.commit() # Final commit for any successful alterations
-            print("Database initialization and migration check finished.")
+def _search_tokens(cipher, description, tag):
+    """The search tokens of a row with `description` (plaintext) and `tag`, space-separated (see SEARCH_TOKENS_SCHEMA_SQL)."""
+    prefixes = {word[:n] for word in _search_words(f"{description} {tag}")
+                for n in SEARCH_TOKEN_PREFIXES if len(word) >= n}
+    return " ".join(cipher.search_token(prefix) for prefix in prefixes)
+
+def _row_search_tokens(description, tag):
+    """SQL function row_search_tokens(description, tag): the tokens to file a row under."""
+    cipher = _ledger_cipher
+    if cipher is None:
+        return PENDING_SEARCH_TOKEN
+    if isinstance(description, bytes):
+        try:
+            description = cipher.open(description)
+        except ValueError:
+            return ""  # Sealed with another key; search couldn't open it either
+    return _search_tokens(cipher, description, tag)
+
+def _transaction_row(cursor, row):
+    """Row factory: models.transaction_row_factory, opening a sealed description."""
+    if isinstance(row[2], bytes):
+        return Transaction(row[0], row[1], _open_description(row[2]), row[3], row[4], row[5], row[6])
+    return transaction_row_factory(cursor, row)
+
+def begin_encryption(cursor):
+    """
+    Write step: turns on secure_delete for the writing connection, drops the
+    full-text index (its terms would be plaintext) and adds the search tokens.
+    The first time, the list index goes too while every row changes, to be
+    rebuilt once from sorted data by finish_encryption. Returns the number of
+    descriptions left to seal plus the rows waiting for search tokens.
+    """
+    cursor.execute("PRAGMA secure_delete = ON;")
+    first_time = not cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'idx_transactions_plain_description';").fetchone()
+    has_tokens = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_tokens';").fetchone()
+    for statement in DROP_SEARCH_INDEX_SQL:
+        cursor.execute(statement)
+    # Without FTS5, search scans and opens every row instead
+    if not has_tokens and _fts5_available(cursor):
+        for statement in SEARCH_TOKENS_SCHEMA_SQL:
+            cursor.execute(statement)
+        cursor.execute(QUEUE_SEALED_ROWS_SQL)
+        has_tokens = True
+    if first_time:
+        cursor.execute("DROP INDEX IF EXISTS idx_transactions_date_ts;")
+    pending = cursor.execute(COUNT_PENDING_TOKENS_SQL).fetchone()[0] if has_tokens else 0
+    return cursor.execute(COUNT_PLAIN_DESCRIPTIONS_SQL).fetchone()[0] + pending
+
+def seal_plain_descriptions(cursor, cipher, after_id, limit):
+    """
+    Write step: seals with `cipher` up to `limit` descriptions still in
+    plaintext, with ids above `after_id`. Returns (rows sealed, last id).
+    """
+    rows = cursor.execute(SELECT_PLAIN_DESCRIPTIONS_SQL, (after_id, limit)).fetchall()
+    cursor.executemany(UPDATE_DESCRIPTION_SQL, [(cipher.seal(description), transaction_id)
+                                                for transaction_id, description in rows])
+    return len(rows), rows[-1][0] if rows else after_id
+
+def index_pending_rows(cursor, cipher, limit):
+    """
+    Write step: adds the search tokens of up to `limit` rows filed under
+    PENDING_SEARCH_TOKEN (written without the key). Returns how many.
+    """
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_tokens';").fetchone():
+        return 0
+    ids = [transaction_id for (transaction_id,) in cursor.execute(SELECT_PENDING_TOKENS_SQL, (limit,))]
+    rows = cursor.execute(SELECT_DESCRIPTIONS_BY_IDS_SQL.format(", ".join("?" * len(ids))), ids).fetchall() if ids else []
+    tokens = []
+    for transaction_id, description, tag in rows:
+        if isinstance(description, bytes):
+            try:
+                description = cipher.open(description)
+            except ValueError:
+                continue
+        tokens.append((transaction_id, _search_tokens(cipher, description, tag)))
+    cursor.executemany(INSERT_SEARCH_TOKENS_SQL, tokens)
+    cursor.executemany(DELETE_PENDING_TOKEN_SQL, [(transaction_id,) for transaction_id in ids])
+    return len(ids)
 
+def seal_rule_descriptions(cursor, cipher):
+    """Write step: seals with `cipher` the recurring rules' descriptions still in plaintext. Returns how many."""
+    rows = cursor.execute(SELECT_PLAIN_RULE_DESCRIPTIONS_SQL).fetchall()
+    cursor.executemany(UPDATE_RULE_DESCRIPTION_SQL, [(cipher.seal(description), rule_id)
+                                                     for rule_id, description in rows])
+    return len(rows)
+
+def finish_encryption(cursor):
+    """Write step: (re)creates the list and plaintext-row indexes and turns secure_delete back off."""
+    cursor.execute(LIST_INDEX_SQL)
+    cursor.execute(PLAIN_DESCRIPTIONS_INDEX_SQL)
+    cursor.execute("PRAGMA secure_delete = OFF;")
+
+def _run_step_here(step):
+    (result, error), = run_write_steps([step])
+    if error is not None:
+        raise error
+    return result
+
+@timed("db.encrypt_ledger")
+def encrypt_ledger(cipher, writer=None, chunk_size=BULK_CHUNK_SIZE, on_progress=None):
+    """
+    Starts sealing descriptions with `cipher` and seals the ones stored in
+    plaintext, a chunk per write step, then adds the search tokens of rows
+    written without the key and seals the recurring rules' descriptions. The first time, the full-text index is
+    dropped (search then opens descriptions as it scans them). After that only
+    rows written without the key are left, so it is cheap to run at every
+    unlock. secure_delete and a WAL checkpoint keep the replaced plaintext out
+    of free space. The steps go through `writer` (a utils.ledger_writer
+    LedgerWriter; this waits on it, so never call it from the UI thread) or,
+    without one, run on this thread. `on_progress(sealed, total)`, if given,
+    is called after each chunk. Returns True on success; after a failure it
+    can simply run again.
+    """
+    run = (lambda step: writer.submit(step).result()) if writer is not None else _run_step_here
+    try:
+        total = run(begin_encryption)
+        set_ledger_cipher(cipher)
+        sealed = last_id = 0
+        while True:
+            count_sealed, last_id = run(lambda cursor: seal_plain_descriptions(cursor, cipher, last_id, chunk_size))
+            sealed += count_sealed
+            if on_progress is not None:
+                on_progress(sealed, max(total, sealed))
+            if count_sealed < chunk_size:
+                break
+        while True:
+            count_indexed = run(lambda cursor: index_pending_rows(cursor, cipher, chunk_size))
+            sealed += count_indexed
+            if on_progress is not None:
+                on_progress(sealed, max(total, sealed))
+            if count_indexed < chunk_size:
+                break
+        sealed += run(lambda cursor: seal_rule_descriptions(cursor, cipher))
+        run(finish_encryption)
+        get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        trace("Ledger encrypted: %d descriptions sealed or indexed", sealed)
+        return True
     except sqlite3.Error as e:
-        print(f"!!! Database Error during initialization: {e}")
+        print(f"!!! Database Error encrypting the ledger: {e}")
+        return False
+
+# --- Write steps ---
+# The write functions below each run one of these in its own SQL transaction.
+# A step takes a cursor inside an open transaction, raises sqlite3.Error on
+# failure and never commits, so utils/ledger_writer.py can run many of them in
+# one transaction with run_write_steps.
 
+@timed("db.run_write_steps")
+def run_write_steps(steps):
+    """
+    Runs `steps` (callables taking a cursor) in one SQL transaction and commits
+    once. Each step runs in its own savepoint, so one that raises is rolled back
+    alone; a lone step needs none (the transaction is its savepoint), which
+    spares a bulk step copying every page it changes into the savepoint's
+    journal. Returns a (result, exception) pair per step; if the transaction
+    can't be started or committed, every step gets that error.
+    """
+    try:
+        conn = get_connection()
+        # IMMEDIATE takes the write lock up front, so the steps never hit SQLITE_BUSY halfway
+        conn.execute("BEGIN IMMEDIATE;")
+    except sqlite3.Error as e:
+        print(f"!!! Database Error starting write transaction: {e}")
+        return [(None, e)] * len(steps)
+    cursor = conn.cursor()
+    outcomes = []
+    try:
+        if len(steps) == 1:
+            try:
+                outcomes.append((steps[0](cursor), None))
+            except Exception as e:
+                conn.rollback()
+                outcomes.append((None, e))
+        else:
+            for step in steps:
+                cursor.execute("SAVEPOINT step;")
+                try:
+                    outcomes.append((step(cursor), None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO step;")
+                    outcomes.append((None, e))
+                cursor.execute("RELEASE step;")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"!!! Database Error committing {len(steps)} writes: {e}")
+        return [(None, e)] * len(steps)
+    if any(error is None for _, error in outcomes):
+        _bump_ledger_version()
+    count("db.write_steps", len(steps))
+    return outcomes
+
+def insert_transaction_row(cursor, amount, description, currency, transaction_type, date, tag):
+    """Write step: inserts one transaction. Returns it (models.Transaction) with its new id and canonical tag."""
+    tag = _canonical_tags(cursor, [tag])[tag]
+    cursor.execute(INSERT_TRANSACTION_SQL, (amount, seal_description(description), currency, transaction_type, date, tag))
+    return Transaction(cursor.lastrowid, amount, description, currency, transaction_type, date, tag)
+
+def insert_transaction_rows(cursor, rows):
+    """
+    Write step: inserts `rows`, (amount, description, currency,
+    transaction_type, date, tag) tuples, with one executemany. Returns them as
+    models.Transaction records with their new ids and canonical tags.
+    """
+    tags = _canonical_tags(cursor, [row[5] for row in rows])
+    cursor.executemany(INSERT_TRANSACTION_SQL, [
+        (amount, seal_description(description), currency, transaction_type, date, tags[tag])
+        for amount, description, currency, transaction_type, date, tag in rows
+    ])
+    # AUTOINCREMENT ids are consecutive while this transaction holds the write lock
+    last_id = cursor.execute("SELECT last_insert_rowid();").fetchone()[0]
+    count("db.rows_inserted", len(rows))
+    return [Transaction(transaction_id, amount, description, currency, transaction_type, date, tags[tag])
+            for transaction_id, (amount, description, currency, transaction_type, date, tag)
+            in zip(range(last_id - len(rows) + 1, last_id + 1), rows)]
+
+@timed("db.add_transaction")
 def add_transaction(amount, description, currency, transaction_type, date, tag):
-    """Adds a new transaction to the database, including its tag."""
+    """
+    Adds a new transaction to the database, including its tag (stored in its
+    canonical spelling, see canonical_tag). Returns the new id, or None on error.
+    """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO transactions (amount, description, currency, transaction_type, date, tag)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (amount, description, currency, transaction_type, date, tag if tag else 'Uncategorized'))
-            conn.commit()
-            print(f"Transaction added: {amount} {currency} ({transaction_type}) - {description} [Tag: {tag if tag else 'Uncategorized'}]")
+        conn = get_connection()
+        with conn:
+            transaction = insert_transaction_row(conn.cursor(), amount, description, currency, transaction_type, date, tag)
+        _bump_ledger_version()
+        trace("Transaction added: %s %s (%s) - %s [Tag: %s]", amount, currency, transaction_type, description,
+              transaction.tag)
+        return transaction.id
     except sqlite3.Error as e:
         print(f"!!! Database Error adding transaction: {e}")
+        return None
 
+@timed("db.add_transactions_bulk")
+def add_transactions_bulk(rows, chunk_size=BULK_CHUNK_SIZE, on_chunk=None):
+    """
+    Inserts many transactions using executemany, committing once per chunk.
+
+    `rows` is any iterable of (amount, description, currency, transaction_type,
+    date, tag) tuples. It is consumed lazily, so a generator is never held in
+    memory as a whole. If given, `on_chunk(conn, rows_inserted)` runs inside each
+    chunk's transaction, letting callers record progress atomically with the rows.
+    Returns the number of rows inserted.
+    """
+    rows = iter(rows)
+    inserted = 0
+    try:
+        conn = get_connection()
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            with conn:
+                tags = _canonical_tags(conn.cursor(), [row[5] for row in chunk])
+                conn.executemany(INSERT_TRANSACTION_SQL, [
+                    (amount, seal_description(description), currency, transaction_type, date, tags[tag])
+                    for amount, description, currency, transaction_type, date, tag in chunk
+                ])
+                if on_chunk:
+                    on_chunk(conn, inserted + len(chunk))
+            inserted += len(chunk)
+            _bump_ledger_version()
+            count("db.rows_inserted", len(chunk))
+    except sqlite3.Error as e:
+        print(f"!!! Database Error during bulk insert after {inserted} rows: {e}")
+    return inserted
+
+@timed("db.get_transactions")
 def get_transactions():
-    """Retrieves all transactions from the database, ordered by date descending."""
+    """Retrieves all transactions as models.Transaction records, ordered by date descending."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            # Order by date descending so newest appear first in lists
-            cursor.execute("SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions ORDER BY date DESC")
-            transactions = cursor.fetchall()
-            return transactions
+        cursor = get_connection().cursor()
+        cursor.row_factory = _transaction_row
+        # Order by date descending so newest appear first in lists
+        cursor.execute(SELECT_TRANSACTIONS_SQL)
+        transactions = cursor.fetchall()
+        count("db.rows_fetched", len(transactions))
+        return transactions
     except sqlite3.Error as e:
         print(f"!!! Database Error getting transactions: {e}")
         return []
 
+@timed("db.get_transactions_page")
+def get_transactions_page(tag=None, transaction_type=None, start_date=None, end_date=None,
+                          after=None, limit=TRANSACTIONS_PAGE_SIZE, newest_first=True):
+    """
+    Retrieves one page of transactions (models.Transaction records) matching the
+    given filters, in (date, id) order. `tag` matches in any case.
+
+    Pagination is keyset-based: pass the (date, id) of the last row of the previous
+    page as `after` to get the next one. Each page is a single index range scan on
+    date_ts, so its cost doesn't grow with the size of the table. `start_date` is
+    inclusive and `end_date` exclusive; both are 'YYYY-MM-DD[ HH:MM:SS]' strings.
+    """
+    clauses = []
+    params = []
+    if tag:
+        clauses.append("tag_id = (SELECT id FROM tags WHERE folded = ?)")
+        params.append(fold_tag(tag))
+    if transaction_type:
+        clauses.append("transaction_type = ?")
+        params.append(transaction_type)
+    if start_date:
+        clauses.append(f"date_ts >= {DATE_TS_SQL.format('?')}")
+        params.append(start_date)
+    if end_date:
+        clauses.append(f"date_ts < {DATE_TS_SQL.format('?')}")
+        params.append(end_date)
+    if after is not None:
+        clauses.append(f"(date_ts, id) {'<' if newest_first else '>'} ({DATE_TS_SQL.format('?')}, ?)")
+        params.extend(after)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = "DESC" if newest_first else "ASC"
+    sql = (f"SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions "
+           f"{where} ORDER BY date_ts {order}, id {order} LIMIT ?")
+    params.append(limit)
+    try:
+        cursor = get_connection().cursor()
+        cursor.row_factory = _transaction_row
+        page = cursor.execute(sql, params).fetchall()
+        count("db.rows_fetched", len(page))
+        return page
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting transactions page: {e}")
+        return []
+
+@timed("db.get_transactions_between")
+def get_transactions_between(start_date, end_date, newest_first=True):
+    """
+    Retrieves every transaction dated from `start_date` (inclusive) to `end_date`
+    (exclusive) as models.Transaction records, in (date, id) order. Dates are
+    'YYYY-MM-DD[ HH:MM:SS]' strings. The range is read straight off the covering
+    date_ts index, so the cost depends on the rows returned, not the ledger size.
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.row_factory = _transaction_row
+        cursor.execute(SELECT_TRANSACTIONS_BETWEEN_SQL.format(order="DESC" if newest_first else "ASC"),
+                       (start_date, end_date))
+        transactions = cursor.fetchall()
+        count("db.rows_fetched", len(transactions))
+        return transactions
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting transactions between {start_date} and {end_date}: {e}")
+        return []
+
+def _fts5_available(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x);")
+        cursor.execute("DROP TABLE temp.fts5_probe;")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def _search_words(text):
+    """Lower-cased words of `text` with accents removed, as the FTS tokenizer sees them."""
+    text = text.lower()
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SEARCH_TOKEN_RE.findall(text)
+
+def _search_relevance(words, transaction, tag_words, prefix=True):
+    """Scores a match: whole words over prefixes of the last word, tag hits double, a leading word +1."""
+    description = _search_words(transaction.description)
+    tag = tag_words.get(transaction.tag)
+    if tag is None:
+        tag = tag_words[transaction.tag] = _search_words(transaction.tag)
+    score = 0
+    for i, word in enumerate(words):
+        is_last = prefix and i == len(words) - 1
+        for tokens, weight in ((tag, 2), (description, 1)):
+            if word in tokens:
+                score += 2 * weight
+            elif is_last and any(token.startswith(word) for token in tokens):
+                score += weight
+    if description and description[0].startswith(words[0]):
+        score += 1
+    return score
+
+def _matches_words(words, description, tag, prefix=True):
+    """What the full-text query matches: each word is a word of the description or tag, the last a prefix of one."""
+    text = f"{description} {tag}".lower()
+    if text.isascii() and not all(word in text for word in words):
+        return False  # Cheap rejection of most rows before splitting into words
+    tokens = _search_words(text)
+    last = words[-1]
+    return (all(word in tokens for word in words[:-1])
+            and (any(token.startswith(last) for token in tokens) if prefix else last in tokens))
+
+def _search_sealed(cursor, words, prefix, window, tag=None):
+    """
+    The newest `window` matches on an encrypted ledger, with tag `tag` if
+    given. The rows filed under the search token of every word of two letters
+    or more are opened and matched; with no such word every row is, newest
+    first.
+    """
+    folded = fold_tag(tag) if tag else None
+    lookups = {word[:SEARCH_TOKEN_PREFIXES[-1]] for word in words if len(word) >= SEARCH_TOKEN_PREFIXES[0]}
+    has_tokens = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_tokens';").fetchone()
+    cursor.row_factory = _transaction_row
+    if lookups and has_tokens:
+        match = " ".join(_ledger_cipher.search_token(lookup) for lookup in lookups)
+        rows = cursor.execute(SEARCH_TOKENS_SQL, (match,))
+    else:
+        rows = cursor.execute(SELECT_NEWEST_TRANSACTIONS_SQL)
+    matches = []
+    for t in rows:
+        if matches and t.id == matches[-1].id:
+            continue  # Filed again after an update
+        if folded is not None and fold_tag(t.tag) != folded:
+            continue
+        if _matches_words(words, t.description, t.tag, prefix):
+            matches.append(t)
+            if len(matches) == window:
+                break
+    return matches
+
+@timed("db.search_transactions")
+def search_transactions(query, limit=TRANSACTIONS_PAGE_SIZE, offset=0, tag=None):
+    """
+    Returns transactions (models.Transaction records) whose description or tag
+    contain every word of `query`, the last word matching as a prefix unless
+    followed by a space ("amazon gro" finds "Amazon groceries"), and with tag
+    `tag` (in any case) if given. Results are ranked by relevance, most recently
+    added first among equals, within the SEARCH_RANK_WINDOW most recent matches.
+    On an encrypted ledger the rows filed under the words' search tokens are
+    opened and matched instead (see SEARCH_TOKENS_SCHEMA_SQL).
+    """
+    words = _search_words(query)
+    # A trailing space means the last word is complete, so it needn't match as a prefix
+    prefix = bool(query) and not query[-1].isspace()
+    if prefix and words and len(words[-1]) < SEARCH_MIN_PREFIX:
+        words.pop()
+    if not words:
+        return []
+    try:
+        conn = get_connection()
+        has_index = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts';").fetchone()
+        cursor = conn.cursor()
+        cursor.row_factory = _transaction_row
+        window = max(SEARCH_RANK_WINDOW, offset + limit)
+        tag_id = None
+        if tag:
+            row = conn.execute("SELECT id FROM tags WHERE folded = ?;", (fold_tag(tag),)).fetchone()
+            if row is None:
+                return []
+            tag_id = row[0]
+        if _ledger_cipher is not None:
+            matches = _search_sealed(conn.cursor(), words, prefix, window, tag)
+        elif has_index:
+            match = " ".join(f'"{word}"' for word in words) + ("*" if prefix else "")
+            if tag_id is not None:
+                matches = cursor.execute(SEARCH_IN_TAG_SQL, (tag_id, match, window)).fetchall()
+            else:
+                matches = cursor.execute(SEARCH_SQL, (match, window)).fetchall()
+        else:
+            # No FTS5: substring match on the newest rows
+            clauses = " AND ".join("(description LIKE ? OR tag LIKE ?)" for _ in words)
+            params = [f"%{word}%" for word in words for _ in (0, 1)]
+            if tag_id is not None:
+                clauses += " AND tag_id = ?"
+                params.append(tag_id)
+            matches = cursor.execute(
+                f"SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions "
+                f"WHERE {clauses} ORDER BY id DESC LIMIT ?",
+                params + [window],
+            ).fetchall()
+        tag_words = {}  # Tags repeat across rows; split each once
+        matches.sort(key=lambda t: (-_search_relevance(words, t, tag_words, prefix), -t.id))
+        return matches[offset:offset + limit]
+    except sqlite3.Error as e:
+        print(f"!!! Database Error searching transactions: {e}")
+        return []
+
+def optimize_search_index():
+    """Merges the full-text index (or an encrypted ledger's search tokens) into one segment; worth doing after large bulk inserts."""
+    try:
+        conn = get_connection()
+        for table in ("transactions_fts", "search_tokens"):
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (table,)).fetchone():
+                with conn:
+                    conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize');")
+    except sqlite3.Error as e:
+        print(f"!!! Database Error optimizing search index: {e}")
+
+@timed("db.get_balance_in_base")
+def get_balance_in_base():
+    """
+    Returns (balance, missing) where balance is credits minus debits in the base
+    currency, each day's totals converted at the rate effective that day, and
+    missing is {currency: transaction_count} for currencies with no rate (left
+    unconverted). Reads the maintained per-rate-period totals, so the cost
+    depends on the number of rates, not on the ledger's history.
+    """
+    try:
+        conn = get_connection()
+        balance = conn.execute(BALANCE_IN_BASE_SQL).fetchone()[0] or 0.0
+        missing = dict(conn.execute(MISSING_RATES_SQL).fetchall())
+        return balance, missing
+    except sqlite3.Error as e:
+        print(f"!!! Database Error computing balance: {e}")
+        return 0.0, {}
+
+def get_exchange_rates():
+    """Returns every (currency, effective_date, rate) ordered by currency, then date."""
+    try:
+        return get_connection().execute(
+            "SELECT currency, effective_date, rate FROM exchange_rates ORDER BY currency, effective_date"
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting exchange rates: {e}")
+        return []
+
+def upsert_exchange_rates(cursor, rows):
+    """
+    Write step: inserts or replaces (currency, effective_date, rate) rows, with
+    currency codes upper-case, and rebuilds the converted aggregates. Returns
+    the number of rows written.
+    """
+    rows = [(currency.upper(), effective_date, rate) for currency, effective_date, rate in rows]
+    cursor.executemany(UPSERT_EXCHANGE_RATE_SQL, rows)
+    _rebuild_rate_periods(cursor)
+    _rebuild_budget_spending(cursor)
+    return len(rows)
+
+@timed("db.get_daily_totals")
+def get_daily_totals(start_day=None, end_day=None, tag=None):
+    """
+    Returns (day, currency, transaction_type, tag, count, total_minor) rows from
+    the per-day aggregates, ordered by day, with totals in minor units. `start_day`
+    is inclusive and `end_day` exclusive, both 'YYYY-MM-DD'.
+    """
+    clauses = []
+    params = []
+    if start_day:
+        clauses.append("day >= ?")
+        params.append(start_day)
+    if end_day:
+        clauses.append("day < ?")
+        params.append(end_day)
+    if tag:
+        clauses.append("tag = ?")
+        params.append(canonical_tag(tag))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        return get_connection().execute(
+            f"SELECT day, currency, transaction_type, tag, tx_count, total_minor FROM ledger_daily {where} ORDER BY day",
+            params,
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting daily totals: {e}")
+        return []
+
+def _rebuild_aggregates(cursor):
+    """Recomputes both aggregate tables from the raw transactions."""
+    cursor.execute("DELETE FROM ledger_totals;")
+    cursor.execute("DELETE FROM ledger_daily;")
+    cursor.execute(f"INSERT INTO ledger_totals (currency, transaction_type, tx_count, total_minor) {RAW_TOTALS_SQL}")
+    cursor.execute(f"INSERT INTO ledger_daily (day, currency, transaction_type, tag, tx_count, total_minor) {RAW_DAILY_SQL}")
+
+def _rebuild_rate_periods(cursor):
+    """Recomputes ledger_rate_periods from ledger_daily at the current exchange rates."""
+    cursor.execute("DELETE FROM ledger_rate_periods;")
+    cursor.execute(f"INSERT INTO ledger_rate_periods (currency, period, tx_count, net_minor) {RAW_RATE_PERIODS_SQL}")
+
+def _rebuild_budget_spending(cursor):
+    """Recomputes budget_spending from ledger_daily at the current exchange rates."""
+    cursor.execute("DELETE FROM budget_spending;")
+    cursor.execute(f"INSERT INTO budget_spending (tag, month, tx_count, spent) {RAW_BUDGET_SPENDING_SQL}")
+
+def _repair_tags(cursor):
+    """Gives every row its tag's canonical spelling and tag_id, then recounts the tags."""
+    unresolved = [tag for (tag,) in cursor.execute("SELECT DISTINCT tag FROM transactions WHERE tag_id IS NULL;")]
+    for tag, name in _canonical_tags(cursor, unresolved).items():
+        # Setting tag (even to the same text) fires trg_transactions_tag_id_update
+        cursor.execute("UPDATE transactions SET tag = ? WHERE tag_id IS NULL AND tag IS ?;", (name, tag))
+    cursor.execute(RESPELL_TAGS_SQL)
+    cursor.execute(RECOUNT_TAGS_SQL)
+
+def check_aggregates(repair=False):
+    """
+    Verifies the aggregate tables against the raw transactions.
+
+    Returns a list of human-readable mismatches (empty when consistent). With
+    `repair=True` the aggregates are rebuilt when any mismatch is found.
+    """
+    def compare(name, stored, expected, tolerance=0):
+        found = []
+        for key in sorted(set(stored) | set(expected), key=repr):
+            have = stored.get(key, (0, 0))
+            want = expected.get(key, (0, 0))
+            if have[0] != want[0] or abs(have[1] - want[1]) > tolerance * max(1.0, abs(want[1])):
+                found.append(f"{name} {key}: stored count={have[0]} total={have[1]}, "
+                             f"expected count={want[0]} total={want[1]}")
+        return found
+
+    try:
+        conn = get_connection()
+        mismatches = compare(
+            "ledger_totals",
+            {row[:2]: row[2:] for row in conn.execute("SELECT currency, transaction_type, tx_count, total_minor FROM ledger_totals")},
+            {row[:2]: row[2:] for row in conn.execute(RAW_TOTALS_SQL)},
+        )
+        mismatches += compare(
+            "ledger_daily",
+            {row[:4]: row[4:] for row in conn.execute("SELECT day, currency, transaction_type, tag, tx_count, total_minor FROM ledger_daily")},
+            {row[:4]: row[4:] for row in conn.execute(RAW_DAILY_SQL)},
+        )
+        mismatches += compare(
+            "ledger_rate_periods",
+            {row[:2]: row[2:] for row in conn.execute("SELECT currency, period, tx_count, net_minor FROM ledger_rate_periods")},
+            {row[:2]: row[2:] for row in conn.execute(RAW_RATE_PERIODS_SQL)},
+        )
+        budget_mismatches = compare(
+            "budget_spending",
+            {row[:2]: row[2:] for row in conn.execute("SELECT tag, month, tx_count, spent FROM budget_spending")},
+            {row[:2]: row[2:] for row in conn.execute(RAW_BUDGET_SPENDING_SQL)},
+            AGGREGATE_TOLERANCE,
+        )
+        mismatches += budget_mismatches
+        stale_dates = conn.execute(STALE_DATE_TS_SQL).fetchone()[0]
+        if stale_dates:
+            mismatches.append(f"transactions.date_ts: {stale_dates} rows out of step with date")
+        stale_tags = conn.execute(STALE_TAGS_SQL).fetchone()[0]
+        if stale_tags:
+            mismatches.append(f"transactions.tag: {stale_tags} rows not spelled like their tags entry")
+        for name, stored, actual in conn.execute(STORED_TAG_COUNTS_SQL):
+            if stored != actual:
+                mismatches.append(f"tags {name!r}: stored count={stored}, expected count={actual}")
+        if mismatches and repair:
+            with conn:
+                # Tags first: re-spelling rows moves them between aggregate keys
+                _repair_tags(conn.cursor())
+                _rebuild_aggregates(conn.cursor())
+                _rebuild_rate_periods(conn.cursor())
+                _rebuild_budget_spending(conn.cursor())
+                conn.execute(REPAIR_DATE_TS_SQL)
+            print(f"Rebuilt aggregates after {len(mismatches)} mismatches.")
+        return mismatches
+    except sqlite3.Error as e:
+        print(f"!!! Database Error checking aggregates: {e}")
+        return [f"error: {e}"]
+
+@timed("db.delete_transaction")
 def delete_transaction(transaction_id):
-    """Deletes a transaction by its ID."""
+    """Deletes a transaction by its ID. Returns True if a row was deleted."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        conn = get_connection()
+        with conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
-            conn.commit()
-            if cursor.rowcount > 0:
-                print(f"Transaction deleted: id={transaction_id}")
-            else:
-                print(f"Warning: No transaction found with id={transaction_id} to delete.")
+            cursor.execute(DELETE_TRANSACTION_SQL, (transaction_id,))
+        if cursor.rowcount > 0:
+            _bump_ledger_version()
+            trace("Transaction deleted: id=%s", transaction_id)
+            return True
+        print(f"Warning: No transaction found with id={transaction_id} to delete.")
     except sqlite3.Error as e:
         print(f"!!! Database Error deleting transaction: {e}")
+    return False
+
+def _select_by_ids(cursor, ids):
+    """Transactions (models.Transaction) with the given ids, in batches of ID_BATCH_SIZE."""
+    found = []
+    cursor.row_factory = _transaction_row
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[start:start + ID_BATCH_SIZE]
+        found.extend(cursor.execute(SELECT_TRANSACTIONS_BY_IDS_SQL.format(",".join("?" * len(batch))), batch))
+    cursor.row_factory = None
+    return found
+
+@timed("db.get_transactions_by_ids")
+def get_transactions_by_ids(ids):
+    """Returns the transactions (models.Transaction) with the given ids that exist, in no particular order."""
+    try:
+        return _select_by_ids(get_connection().cursor(), list(ids))
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting transactions by id: {e}")
+        return []
+
+def delete_transaction_rows(cursor, ids):
+    """Write step: deletes the transactions in `ids`. Returns the deleted rows (models.Transaction)."""
+    ids = list(ids)
+    deleted = _select_by_ids(cursor, ids)
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[start:start + ID_BATCH_SIZE]
+        cursor.execute(DELETE_TRANSACTIONS_BY_IDS_SQL.format(",".join("?" * len(batch))), batch)
+    return deleted
+
+@timed("db.delete_transactions")
+def delete_transactions(ids):
+    """
+    Deletes every transaction in `ids` in one SQL transaction. Returns the
+    deleted rows (models.Transaction), so the caller can restore them, or [] on
+    error (nothing is deleted then).
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            deleted = delete_transaction_rows(conn.cursor(), ids)
+        if deleted:
+            _bump_ledger_version()
+        trace("Transactions deleted: %d", len(deleted))
+        return deleted
+    except sqlite3.Error as e:
+        print(f"!!! Database Error deleting transactions: {e}")
+        return []
+
+def restore_transaction_rows(cursor, transactions):
+    """Write step: re-inserts deleted transactions (models.Transaction) with their original ids."""
+    tags = _canonical_tags(cursor, [t.tag for t in transactions])
+    cursor.executemany(RESTORE_TRANSACTION_SQL, [
+        (t.id, t.amount, seal_description(t.description), t.currency, t.transaction_type, t.date, tags[t.tag])
+        for t in transactions
+    ])
+
+@timed("db.restore_transactions")
+def restore_transactions(transactions):
+    """
+    Re-inserts previously deleted transactions with their original ids, in one
+    SQL transaction. Returns True on success; on error (e.g. an id in use) nothing
+    is inserted.
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            restore_transaction_rows(conn.cursor(), transactions)
+        _bump_ledger_version()
+        return True
+    except sqlite3.Error as e:
+        print(f"!!! Database Error restoring transactions: {e}")
+        return False
+
+def update_transaction_tags(cursor, changes):
+    """
+    Write step: applies [(transaction_id, tag), ...], storing each tag in its
+    canonical spelling. Returns the rows that exist (models.Transaction) as they
+    were before and as they are after.
+    """
+    before = _select_by_ids(cursor, [transaction_id for transaction_id, _ in changes])
+    tags = _canonical_tags(cursor, [tag for _, tag in changes])
+    cursor.executemany(UPDATE_TAG_SQL, [(tags[tag], transaction_id) for transaction_id, tag in changes])
+    new_tags = {transaction_id: tags[tag] for transaction_id, tag in changes}
+    after = [Transaction(t.id, t.amount, t.description, t.currency, t.transaction_type, t.date, new_tags[t.id])
+             for t in before]
+    return before, after
+
+@timed("db.set_transaction_tags")
+def set_transaction_tags(changes):
+    """
+    Applies [(transaction_id, tag), ...] in one SQL transaction, storing each tag
+    in its canonical spelling. Returns the rows as they were before
+    (models.Transaction, only those that exist), or None on error (nothing is
+    changed then).
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            before, _ = update_transaction_tags(conn.cursor(), changes)
+        if before:
+            _bump_ledger_version()
+        return before
+    except sqlite3.Error as e:
+        print(f"!!! Database Error updating tags: {e}")
+        return None
+
+@timed("db.get_tag_counts")
+def get_tag_counts():
+    """Returns (tag, transaction count) for every tag in use, ordered case-insensitively."""
+    try:
+        return get_connection().execute(SELECT_TAG_COUNTS_SQL).fetchall()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting tag counts: {e}")
+        return []
 
 def get_unique_tags():
-    """Retrieves all unique tags from the transactions."""
+    """Retrieves the tags in use, ordered case-insensitively."""
+    return [tag for tag, _ in get_tag_counts()]
+
+def canonical_tag(tag):
+    """The stored spelling of `tag` if it or a case variant is known, else `tag` itself ('Uncategorized' if empty)."""
+    tag = tag or DEFAULT_TAG
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT tag FROM transactions WHERE tag IS NOT NULL AND tag != '' ORDER BY tag")
-            tags = [row[0] for row in cursor.fetchall() if row[0]] # Ensure not None or empty
-            return tags
+        row = get_connection().execute(SELECT_TAG_NAME_SQL, (fold_tag(tag),)).fetchone()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error looking up tag: {e}")
+        row = None
+    return row[0] if row else tag
+
+def insert_recurring_rule(cursor, amount, description, currency, transaction_type, tag, schedule, start_date,
+                          next_due, end_date=None):
+    """Write step: stores a recurring rule whose first occurrence not yet inserted is `next_due`. Returns its id."""
+    cursor.execute(INSERT_RECURRING_RULE_SQL, (amount, seal_description(description), currency, transaction_type,
+                                               tag if tag else 'Uncategorized', schedule, start_date,
+                                               next_due, end_date))
+    return cursor.lastrowid
+
+def add_recurring_rule(amount, description, currency, transaction_type, tag, schedule, start_date, next_due,
+                       end_date=None):
+    """Stores a recurring rule (see insert_recurring_rule). Returns its id, or None on error."""
+    try:
+        conn = get_connection()
+        with conn:
+            return insert_recurring_rule(conn.cursor(), amount, description, currency, transaction_type, tag,
+                                         schedule, start_date, next_due, end_date)
+    except sqlite3.Error as e:
+        print(f"!!! Database Error adding recurring rule: {e}")
+        return None
+
+def get_recurring_rules():
+    """
+    Returns the rules that still have occurrences to come, as tuples in
+    RECURRING_SCHEMA_SQL column order. A sealed description is opened; while no
+    cipher is set it stays sealed (bytes), and occurrences store it as it is.
+    """
+    try:
+        rows = get_connection().execute(SELECT_RECURRING_RULES_SQL).fetchall()
+        if _ledger_cipher is None:
+            return rows
+        return [row[:2] + (_open_description(row[2]),) + row[3:] if isinstance(row[2], bytes) else row
+                for row in rows]
     except sqlite3.Error as e:
-        print(f"!!! Database Error getting unique tags: {e}")
+        print(f"!!! Database Error getting recurring rules: {e}")
+        return []
+
+def stop_recurring_rule(cursor, rule_id):
+    """Write step: stops a rule from generating further occurrences. Returns True if it existed."""
+    cursor.execute(UPDATE_NEXT_DUE_SQL, (None, rule_id))
+    return cursor.rowcount > 0
+
+def end_recurring_rule(rule_id):
+    """Stops a rule from generating further occurrences. Returns True if it existed."""
+    try:
+        conn = get_connection()
+        with conn:
+            return stop_recurring_rule(conn.cursor(), rule_id)
+    except sqlite3.Error as e:
+        print(f"!!! Database Error ending recurring rule: {e}")
+        return False
+
+@timed("db.insert_recurring_occurrences")
+def insert_recurring_occurrences(cursor, rows, next_dues):
+    """
+    Write step: inserts generated occurrences and moves their rules' next_due
+    forward. `rows` are (amount, description, currency, transaction_type, date,
+    tag) tuples and `next_dues` (next_due, rule_id) pairs (next_due None once a
+    rule is finished). Returns the new transaction ids in `rows` order.
+    """
+    ids = [t.id for t in insert_transaction_rows(cursor, rows)]
+    cursor.executemany(UPDATE_NEXT_DUE_SQL, next_dues)
+    return ids
+
+def upsert_budget(cursor, tag, monthly_limit, alert_threshold=DEFAULT_ALERT_THRESHOLD):
+    """Write step: sets (or replaces) the monthly budget for `tag` (any case), in the base currency. Returns True."""
+    tag = _canonical_tags(cursor, [tag])[tag]
+    cursor.execute(UPSERT_BUDGET_SQL, (tag, monthly_limit, alert_threshold))
+    return True
+
+def delete_budget_row(cursor, tag):
+    """Write step: removes the budget for `tag` (any case). Returns True if there was one."""
+    row = cursor.execute(SELECT_TAG_NAME_SQL, (fold_tag(tag),)).fetchone()
+    cursor.execute("DELETE FROM budgets WHERE tag = ?", (row[0] if row else tag,))
+    return cursor.rowcount > 0
+
+def set_budget(tag, monthly_limit, alert_threshold=DEFAULT_ALERT_THRESHOLD):
+    """Sets (or replaces) the monthly budget for `tag` (any case), in the base currency. Returns True on success."""
+    try:
+        conn = get_connection()
+        with conn:
+            return upsert_budget(conn.cursor(), tag, monthly_limit, alert_threshold)
+    except sqlite3.Error as e:
+        print(f"!!! Database Error saving budget: {e}")
+        return False
+
+def delete_budget(tag):
+    """Removes the budget for `tag` (any case). Returns True if there was one."""
+    try:
+        conn = get_connection()
+        with conn:
+            return delete_budget_row(conn.cursor(), tag)
+    except sqlite3.Error as e:
+        print(f"!!! Database Error deleting budget: {e}")
+        return False
+
+@timed("db.get_budget_status")
+def get_budget_status(month=None, tags=None):
+    """
+    Returns (tag, monthly_limit, alert_threshold, spent) for every budget (or
+    only those for `tags`) in `month` ('YYYY-MM', default the current month),
+    spent being the month's debits in the base currency.
+    """
+    month = month or datetime.now().strftime("%Y-%m")
+    params = [month]
+    where = ""
+    if tags is not None:
+        tags = list(tags)
+        if not tags:
+            return []
+        where = f"WHERE b.tag IN ({','.join('?' * len(tags))})"
+        params.extend(tags)
+    try:
+        return get_connection().execute(BUDGET_STATUS_SQL.format(where=where), params).fetchall()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error getting budget status: {e}")
         return []
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Money Tracker database utilities.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    import_parser = subparsers.add_parser("import", help="Import transactions from a CSV or OFX file.")
+    import_parser.add_argument("path", help="CSV or OFX file to import")
+    import_parser.add_argument("--format", choices=["csv", "ofx"], help="Input format (default: from file extension)")
+    import_parser.add_argument("--currency", default="INR", help="Currency for rows that don't specify one")
+    import_parser.add_argument("--date-format", help="strptime format for CSV dates (default: auto-detect)")
+    import_parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="Rows per commit")
+    import_parser.add_argument("--restart", action="store_true", help="Ignore saved progress and import from the start")
+
+    check_parser = subparsers.add_parser("check", help="Verify the balance aggregates against the raw transactions.")
+    check_parser.add_argument("--repair", action="store_true", help="Rebuild the aggregates if they don't match")
+
+    rates_parser = subparsers.add_parser("rates", help="Import dated exchange rates from a CSV file.")
+    rates_parser.add_argument("path", help=f"CSV with currency, date (YYYY-MM-DD) and rate (to {BASE_CURRENCY}) columns")
+
+    budget_parser = subparsers.add_parser("budget", help="Show this month's budgets, or set or remove one.")
+    budget_parser.add_argument("tag", nargs="?", help="Tag to budget")
+    budget_parser.add_argument("limit", nargs="?", type=float, help=f"Monthly limit in {BASE_CURRENCY} (0 removes the budget)")
+    budget_parser.add_argument("--threshold", type=float, default=DEFAULT_ALERT_THRESHOLD,
+                               help="Fraction of the budget at which to warn")
+    budget_parser.add_argument("--month", help="Month to show (YYYY-MM, default: this month)")
+
+    recurring_parser = subparsers.add_parser("recurring", help="List, add or end recurring rules, or add what is due.")
+    recurring_parser.add_argument("action", nargs="?", choices=["list", "add", "end", "run"], default="list")
+    recurring_parser.add_argument("--id", type=int, help="Rule to end")
+    recurring_parser.add_argument("--amount", type=float)
+    recurring_parser.add_argument("--description")
+    recurring_parser.add_argument("--schedule", help="daily, weekly, monthly, yearly, 'every N days' or a cron expression")
+    recurring_parser.add_argument("--type", choices=["credit", "debit"], default="debit")
+    recurring_parser.add_argument("--currency", default=BASE_CURRENCY)
+    recurring_parser.add_argument("--tag", default="")
+    recurring_parser.add_argument("--start", help="First occurrence, 'YYYY-MM-DD HH:MM:SS' (default: now)")
+    recurring_parser.add_argument("--end", help="No occurrences after this, 'YYYY-MM-DD HH:MM:SS'")
+
+    replay_parser = subparsers.add_parser("replay", help="Rebuild or verify the database from the JSON-lines transaction log.")
+    replay_parser.add_argument("log", nargs="?", default="transaction_logs.jsonl", help="Log file (rotated .N.gz archives are read too)")
+    replay_parser.add_argument("--into", help=f"Database file to rebuild into (default: {DB_FILE})")
+    replay_parser.add_argument("--verify", action="store_true", help="Only compare the database with the log")
+
+    args = parser.parse_args()
+    if args.command == "replay" and args.into:
+        DB_FILE = args.into
     init_db()
-    print("Database file should be initialized/updated.")
-    # Example of adding a transaction with a tag
-    # add_transaction(25.0, "Lunch", "USD", "debit", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Food")
-    # print(get_transactions())
-    # print(get_unique_tags())
\ No newline at end of file
+    print(f"Database '{DB_FILE}' is at schema version {get_schema_version()}.")
+
+    if args.command == "import":
+        from utils.importer import import_file
+        from utils.transaction_log import transaction_log
+        import_file(
+            args.path,
+            file_format=args.format,
+            default_currency=args.currency,
+            date_format=args.date_format,
+            chunk_size=args.chunk_size,
+            restart=args.restart,
+        )
+        transaction_log.close()
+    elif args.command == "check":
+        problems = check_aggregates(repair=args.repair)
+        for problem in problems:
+            print(problem)
+        print("Aggregates are consistent." if not problems else f"{len(problems)} aggregate mismatches found.")
+        if problems and not args.repair:
+            raise SystemExit(1)
+    elif args.command == "rates":
+        from utils.rates import import_rates_file
+        import_rates_file(args.path)
+    elif args.command == "budget":
+        if args.tag and args.limit is not None:
+            if args.limit > 0:
+                set_budget(args.tag, args.limit, args.threshold)
+            else:
+                delete_budget(args.tag)
+        for tag, limit, threshold, spent in get_budget_status(args.month):
+            print(f"{tag:<20}{spent:>12.2f} of {limit:>12.2f} {BASE_CURRENCY} ({100 * spent / limit:.0f}%)")
+    elif args.command == "recurring":
+        from utils.recurrence import create_rule, RecurringScheduler
+        from utils.transaction_log import transaction_log
+        if args.action == "add":
+            if args.amount is None or not args.description or not args.schedule:
+                parser.error("recurring add needs --amount, --description and --schedule")
+            try:
+                rule = create_rule(args.amount, args.description, args.currency, args.type, args.tag, args.schedule,
+                                   start_date=args.start, end_date=args.end).result()
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"Added recurring rule {rule.id}, first due {rule.next_due}.")
+        elif args.action == "end":
+            print(f"Ended rule {args.id}." if end_recurring_rule(args.id) else f"No rule {args.id}.")
+        elif args.action == "run":
+            scheduler = RecurringScheduler()
+            scheduler.load()
+            print(f"Added {len(scheduler.run_due().result())} recurring transactions.")
+            transaction_log.close()
+        for rule_id, amount, description, currency, t_type, tag, schedule, _, next_due, end_date in get_recurring_rules():
+            if isinstance(description, bytes):
+                description = SEALED_PLACEHOLDER
+            print(f"{rule_id:>5} {schedule:<16} {t_type:<6} {amount:>10.2f} {currency} {description} [{tag}] "
+                  f"next {next_due}{f' until {end_date}' if end_date else ''}")
+    elif args.command == "replay":
+        from utils.transaction_log import replay_log, verify_against_log
+        if args.verify:
+            missing, extra, dropped = verify_against_log(get_connection(), args.log)
+            print(f"{missing} logged transactions missing or different in {DB_FILE}, {extra} not in the log.")
+            if dropped:
+                print(f"Warning: the log is incomplete, {dropped} events were dropped when its queue was full.")
+            if missing or extra or dropped:
+                raise SystemExit(1)
+        else:
+            import time
+            start = time.perf_counter()
+            adds, deletes, dropped = replay_log(get_connection(), args.log)
+            # Logged tags may predate their tags rows, or be case variants of them
+            with get_connection() as conn:
+                _repair_tags(conn.cursor())
+            _bump_ledger_version()
+            elapsed = time.perf_counter() - start
+            print(f"Replayed {adds} adds and {deletes} deletes into {DB_FILE} "
+                  f"in {elapsed:.2f}s ({(adds + deletes) / max(elapsed, 1e-9):.0f} ops/s).")
+            if dropped:
+                print(f"Warning: the log is incomplete, {dropped} events were dropped when its queue was full; "
+                      f"the rebuilt ledger is missing their changes.")
+                raise SystemExit(1)
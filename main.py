@@ -1,45 +1,84 @@
-from kivy.app import App
-from kivy.uix.screenmanager import ScreenManager, FadeTransition
-from kivy.properties import StringProperty
-from kivy.lang import Builder
-from kivy.core.window import Window
-from kivy.metrics import dp
-from database import init_db, get_transactions # Import get_transactions
-from widgets.pie_chart import PieChart
-import os
-
-# Import screens
-from screens.login_screen import LoginScreen
-from screens.main_screen import MainScreen
-from screens.analysis_screen import AnalysisScreen
-# Import widgets
-from widgets.transaction_item import TransactionItem
-from widgets.add_transaction_popup import AddTransactionPopup
+from utils import startup  # First, so startup timing includes the Kivy import
+from utils import instrumentation
+
+instrumentation.start_capture()  # Only if $MONEYTRACKER_PROFILE is set
+
+with startup.phase("import kivy"):
+    from kivy.app import App
+    from kivy.uix.screenmanager import FadeTransition
+    from kivy.properties import StringProperty
+    from kivy.clock import Clock, mainthread
+
+with startup.phase("import app modules"):
+    from database import init_db, close_connections
+    from utils.transaction_log import transaction_log
+    from utils.ledger_writer import ledger_writer
+    from utils.recurrence import recurring_scheduler
+    from screens.lazy_screen_manager import LazyScreenManager
+    import os
+
+# Screens are built on first visit: name -> (module, class, KV files).
+# Widgets used by a screen are imported by its module or KV file.
+SCREENS = {
+    'login': ('screens.login_screen', 'LoginScreen', ('screens/login_screen.kv',)),
+    'main': ('screens.main_screen', 'MainScreen',
+             ('widgets/transaction_item.kv', 'widgets/add_transaction_popup.kv', 'widgets/tag_edit_popup.kv',
+              'widgets/budget_popup.kv', 'screens/main_screen.kv')),
+    'analysis': ('screens.analysis_screen', 'AnalysisScreen', ('screens/analysis_screen.kv',)),
+}
+# Seconds between checks for due recurring transactions while the app runs.
+RECURRING_CHECK_INTERVAL = 60
 
 
 class MoneyTrackerApp(App):
     theme = StringProperty("light")  # Default theme: "light" or "dark"
+    _db_ready = False
+    _recurring_started = False
 
     def build(self):
-        init_db() # Initialize the database on startup
-        try:
-            Builder.load_file("screens/login_screen.kv")
-            Builder.load_file("screens/main_screen.kv")
-            Builder.load_file("screens/analysis_screen.kv")
-            Builder.load_file("widgets/transaction_item.kv")
-            Builder.load_file("widgets/add_transaction_popup.kv")
-            print("KV files loaded successfully.")
-        except Exception as e:
-            print(f"Error loading KV files: {e}")
-            # Consider more robust error handling or app exit
-
-        sm = ScreenManager(transition=FadeTransition(duration=0.2))
-        sm.add_widget(LoginScreen(name='login'))
-        sm.add_widget(MainScreen(name='main'))
-        sm.add_widget(AnalysisScreen(name='analysis'))
-        sm.current = 'login'
+        with startup.phase("build"):
+            sm = LazyScreenManager(transition=FadeTransition(duration=0.2))
+            for name, (module_name, class_name, kv_files) in SCREENS.items():
+                # Screens other than login read the database, so make sure it is initialized
+                before_load = None if name == 'login' else self.ensure_db
+                sm.register(name, module_name, class_name, kv_files, before_load=before_load)
+            sm.current = 'login'
+        # Migrations run once the login screen is on screen, while the user types
+        startup.watch_first_frame(lambda: Clock.schedule_once(lambda dt: self.ensure_db()))
         return sm
 
+    def ensure_db(self):
+        """Initializes the database on first call."""
+        if not self._db_ready:
+            with startup.phase("init_db"):
+                init_db()
+            self._db_ready = True
+
+    def start_recurring(self):
+        """
+        Catches up on recurring transactions missed while the app was closed and
+        starts the periodic check. Called once unlocked, so the new rows are
+        written with the ledger cipher set.
+        """
+        if not self._recurring_started:
+            self.ensure_db()
+            with startup.phase("recurring catch-up"):
+                recurring_scheduler.load()
+            self.run_recurring()
+            Clock.schedule_interval(self.run_recurring, RECURRING_CHECK_INTERVAL)
+            self._recurring_started = True
+
+    def run_recurring(self, dt=0):
+        """Queues recurring transactions that came due on the ledger writer; the list refreshes once they are committed."""
+        recurring_scheduler.run_due().add_done_callback(self._recurring_added)
+
+    @mainthread
+    def _recurring_added(self, future):
+        if future.exception() is None and future.result() and self.root and self.root.has_screen('main'):
+            main_screen = self.root.get_screen('main')
+            main_screen.load_tags_for_filter()
+            main_screen.load_transactions()
+
     def get_currency_symbol(self):
         """
         Returns the symbol for the base currency used in analysis.
@@ -49,6 +88,16 @@ class MoneyTrackerApp(App):
         # always return the INR symbol here for the analysis screen.
         return "₹"
 
+    def on_stop(self):
+        # Commit whatever the ledger writer still has queued
+        ledger_writer.close()
+        # Close pooled DB connections so the WAL is checkpointed into transactions.db
+        close_connections()
+        # Write out any queued log entries before exiting
+        transaction_log.close()
+        # Profiles and the latency report, if enabled
+        instrumentation.finish()
+
     def toggle_theme(self):
         self.theme = "dark" if self.theme == "light" else "light"
         print(f"Theme toggled to: {self.theme}")
@@ -0,0 +1,83 @@
+import sys
+from datetime import datetime
+
+from utils.currencies import format_amount
+
+# Strings repeated on nearly every row (currency codes, types, tags) are
+# interned, so a large page shares one copy of each instead of one per row.
+_intern = sys.intern
+
+
+class Transaction:
+    """
+    One row of the transactions table.
+
+    Uses __slots__ (no per-instance __dict__) and interned currency, type and tag
+    strings to keep large result sets small. Still unpacks like the old
+    (id, amount, description, currency, transaction_type, date, tag) tuples.
+    """
+
+    __slots__ = ("id", "amount", "description", "currency", "transaction_type", "date", "tag", "_datetime")
+
+    def __init__(self, id, amount, description, currency, transaction_type, date, tag):
+        self.id = id
+        self.amount = amount
+        self.description = description
+        self.currency = _intern(currency)
+        self.transaction_type = _intern(transaction_type)
+        self.date = date
+        self.tag = _intern(tag) if tag else "Uncategorized"
+        self._datetime = None
+
+    @property
+    def datetime(self):
+        """`date` parsed to a datetime on first access and kept for later ones."""
+        if self._datetime is None:
+            self._datetime = datetime.fromisoformat(self.date)
+        return self._datetime
+
+    @property
+    def is_credit(self):
+        return self.transaction_type == "credit"
+
+    def __iter__(self):
+        return iter((self.id, self.amount, self.description, self.currency,
+                     self.transaction_type, self.date, self.tag))
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"Transaction(id={self.id!r}, amount={self.amount!r}, description={self.description!r}, "
+                f"currency={self.currency!r}, transaction_type={self.transaction_type!r}, "
+                f"date={self.date!r}, tag={self.tag!r})")
+
+
+def transaction_row_factory(cursor, row):
+    """sqlite3 row factory for queries selecting the seven transaction columns in table order."""
+    return Transaction(*row)
+
+
+def transaction_list_item(t, delete_callback=None, select_callback=None, selected=False):
+    """RecycleView data for one TransactionItem in MainScreen's list. The amount stays in its original currency."""
+    return {
+        "transaction_id": t.id,
+        "amount": format_amount(t.amount, t.currency),
+        "description": t.description,
+        "currency": t.currency,
+        "transaction_type": t.transaction_type.capitalize(),
+        "date": t.date,
+        "tag": t.tag,
+        "delete_callback": delete_callback,
+        "select_callback": select_callback,
+        "selected": selected,
+    }
+
+
+def transaction_list_items(transactions, delete_callback=None, select_callback=None, selected_ids=()):
+    """RecycleView data for MainScreen's list: one transaction_list_item per transaction."""
+    return [transaction_list_item(t, delete_callback, select_callback, t.id in selected_ids) for t in transactions]
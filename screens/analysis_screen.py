@@ -1,42 +1,211 @@
 from kivy.uix.screenmanager import Screen
-from kivy.properties import StringProperty, DictProperty, BooleanProperty, ObjectProperty
+from kivy.properties import StringProperty, DictProperty, BooleanProperty, ObjectProperty, NumericProperty, ListProperty
 from kivy.clock import Clock
-from utils.analysis import generate_analysis_plot
+from concurrent.futures import ThreadPoolExecutor
+from kivy_garden.graph import Graph, MeshLinePlot, BarPlot
+from utils.analysis import generate_analysis_plot, AnalysisCancelled, analysis_cache
+from utils.instrumentation import timed, trace
+import threading
+import math
 import os
 
+INCOME_COLOR = (0.3, 0.8, 0.3, 1)
+EXPENSE_COLOR = (0.8, 0.3, 0.3, 1)
+BALANCE_COLOR = (0.2, 0.6, 0.8, 1)
+ROLLING_COLORS = {30: (0.9, 0.6, 0.2, 1), 90: (0.6, 0.4, 0.8, 1)}
+
+# Pie chart modes: None is the Income vs Expenses split, otherwise the
+# (chart_data breakdown, side) to chart.
+BREAKDOWN_MODES = {
+    "Income vs Expenses": None,
+    "Spending by Tag": ('by_tag', 'expense'),
+    "Income by Tag": ('by_tag', 'income'),
+    "Spending by Currency": ('by_currency', 'expense'),
+    "Income by Currency": ('by_currency', 'income'),
+}
+
+# A single long-lived worker keeps analysis off the UI thread. Reusing one thread
+# also means one pooled DB connection instead of one per visit.
+_analysis_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+
+def _nice_step(span, ticks=5):
+    """Rounds span / ticks to 1, 2 or 5 times a power of ten."""
+    raw = span / ticks
+    if raw <= 0:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+
+class TrendGraph(Graph):
+    """Graph styled in analysis_screen.kv; plots are replaced through set_series."""
+
+    def set_series(self, series, xlabel=""):
+        """Shows [(plot, [y, ...]), ...] with x = index, rescaling both axes to fit."""
+        for plot in list(self.plots):
+            self.remove_plot(plot)
+        values = [y for _, ys in series for y in ys]
+        if not values:
+            return
+        length = max(len(ys) for _, ys in series)
+        ymin, ymax = min(0.0, min(values)), max(0.0, max(values))
+        if ymin == ymax:
+            ymax = ymin + 1
+        step = _nice_step(ymax - ymin)
+        self.xlabel = xlabel
+        self.xmin, self.xmax = 0, max(1, length)
+        self.ymin = math.floor(ymin / step) * step
+        self.ymax = math.ceil(ymax / step) * step
+        self.y_ticks_major = step
+        self.x_ticks_major = max(1, length // 6)
+        for plot, ys in series:
+            plot.points = list(enumerate(ys))
+            self.add_plot(plot)
+
+
 class AnalysisScreen(Screen):
     plot_source = StringProperty("")
     stats = DictProperty(None, allownone=True)
     is_loading = BooleanProperty(False)
+    progress = NumericProperty(0.0)  # 0..1 while is_loading
     chart_data = DictProperty(None, allownone=True)  # New property for chart data
+    breakdown_mode = StringProperty("Income vs Expenses")  # Key of BREAKDOWN_MODES
+    pie_values = ListProperty([])
+    pie_labels = ListProperty([])
+    pie_colors = ListProperty([])
+
+    _cancel_event = None
 
     def on_enter(self, *args):
-        print("Entering Analysis Screen...")
+        trace("Entering Analysis Screen...")
         self.is_loading = True
+        self.progress = 0.0
         self.plot_source = ""
         self.stats = None
         self.chart_data = None  # Reset chart data
-        Clock.schedule_once(self.update_analysis, 0.1)
+        self.update_analysis()
+
+    def on_leave(self, *args):
+        self.cancel_analysis()
 
     def update_analysis(self, dt=0):
-        print("Updating analysis data and plot...")
-        plot_path, stats_data, chart_data = generate_analysis_plot()  # Now returns chart_data too
+        """Starts computing the analysis on the worker thread, replacing any run in progress."""
+        trace("Updating analysis data and plot...")
+        self.cancel_analysis()
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+        _analysis_executor.submit(self._run_analysis, cancel_event)
+
+    def cancel_analysis(self):
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+
+    def _run_analysis(self, cancel_event):
+        """Worker thread: runs the analysis and hands every result back to the UI thread."""
+        def report_progress(fraction, partial_stats):
+            Clock.schedule_once(lambda dt: self._on_progress(cancel_event, fraction, partial_stats))
+
+        try:
+            result = generate_analysis_plot(progress_callback=report_progress, cancel_event=cancel_event)
+        except AnalysisCancelled:
+            trace("Analysis cancelled.")
+            return
+        except Exception as e:
+            print(f"Error running analysis: {e}")
+            result = (None, None, None)
+        Clock.schedule_once(lambda dt: self._on_analysis_done(cancel_event, result))
+
+    def _is_current(self, cancel_event):
+        return cancel_event is self._cancel_event and not cancel_event.is_set()
+
+    def _on_progress(self, cancel_event, fraction, partial_stats):
+        if not self._is_current(cancel_event):
+            return
+        self.progress = fraction
+        if partial_stats is not None and self.stats is None:
+            self.stats = partial_stats  # Show the summary while breakdowns finish
+
+    def _on_analysis_done(self, cancel_event, result):
+        if not self._is_current(cancel_event):
+            return
+        self._cancel_event = None
+        plot_path, stats_data, chart_data = result
 
         if plot_path:
             self.plot_source = plot_path
-            print(f"Plot source set to: {self.plot_source}")
+            trace("Plot source set to: %s", self.plot_source)
         else:
             self.plot_source = ""
-            print("No plot path available.")
+            trace("No plot path available.")
 
         self.stats = stats_data
         self.chart_data = chart_data  # Store the chart data
-        
+
+        self.progress = 1.0
         self.is_loading = False
-        print(f"Stats updated: {self.stats}")
-        print(f"Chart data: {self.chart_data}")
-        print(f"Is Loading: {self.is_loading}")
+        trace("Stats updated: %s", self.stats)
+        trace("Analysis cache: %s", analysis_cache.stats())
+
+    def on_chart_data(self, instance, chart_data):
+        self.update_pie_data()
+        self.update_trend_graphs()
+
+    def on_breakdown_mode(self, instance, mode):
+        self.update_pie_data()
+
+    @timed("ui.update_pie_data")
+    def update_pie_data(self):
+        """Selects the PieChart's values, labels and colors for the current breakdown_mode."""
+        breakdown = BREAKDOWN_MODES.get(self.breakdown_mode)
+        if not self.chart_data:
+            values, labels, colors = [], [], []
+        elif breakdown is None:
+            values = self.chart_data.get('values', [])
+            labels = self.chart_data.get('categories', [])
+            colors = self.chart_data.get('colors', [])
+        else:
+            key, side = breakdown
+            data = self.chart_data.get(key) or {'labels': [], side: []}
+            # Largest first, so the chart's "Other" bucket takes the long tail
+            pairs = sorted(((value, label or "Uncategorized") for label, value in zip(data['labels'], data[side]) if value > 0),
+                           reverse=True)
+            values = [value for value, _ in pairs]
+            labels = [label for _, label in pairs]
+            colors = []  # PieChart's default color cycle
+        self.pie_values, self.pie_labels, self.pie_colors = values, labels, colors
+
+    @timed("ui.update_trend_graphs")
+    def update_trend_graphs(self):
+        """Feeds the time series from chart_data into the three trend graphs."""
+        if 'monthly_graph' not in self.ids:
+            return
+        series = self.chart_data.get('time_series') if self.chart_data else None
+        if not series:
+            for graph in (self.ids.monthly_graph, self.ids.balance_graph, self.ids.rolling_graph):
+                graph.set_series([])
+            return
+
+        monthly = series['monthly']
+        daily_labels = series['daily']['labels']
+        self.ids.monthly_graph.set_series([
+            (BarPlot(color=INCOME_COLOR, bar_spacing=0.8), monthly['income']),
+            (BarPlot(color=EXPENSE_COLOR, bar_spacing=0.8), [-v for v in monthly['expense']]),
+        ], xlabel=f"Month ({monthly['labels'][0]} to {monthly['labels'][-1]})")
+        self.ids.balance_graph.set_series(
+            [(MeshLinePlot(color=BALANCE_COLOR), series['balance'])],
+            xlabel=f"Day ({daily_labels[0]} to {daily_labels[-1]})",
+        )
+        self.ids.rolling_graph.set_series(
+            [(MeshLinePlot(color=ROLLING_COLORS[window]), rolling['expense'])
+             for window, rolling in series['rolling'].items()],
+            xlabel="Day (orange: 30-day, purple: 90-day)",
+        )
 
     def go_back(self):
+        self.cancel_analysis()
         if self.manager:
-            self.manager.current = 'main'
\ No newline at end of file
+            self.manager.current = 'main'
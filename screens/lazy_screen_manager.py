@@ -0,0 +1,50 @@
+import importlib
+
+from kivy.lang import Builder
+from kivy.uix.screenmanager import ScreenManager
+
+from utils import startup
+
+# KV files already given to the Builder; several screens may list the same one.
+_loaded_kv_files = set()
+
+
+class LazyScreenManager(ScreenManager):
+    """
+    ScreenManager that builds screens on first visit.
+
+    Screens are registered by name with the module and class that implement them
+    and the KV files they need. Setting `current` to a registered name that has
+    not been built yet imports the module, loads the KV files and adds the
+    screen, so startup only pays for the first screen shown.
+    """
+
+    def __init__(self, **kwargs):
+        super(LazyScreenManager, self).__init__(**kwargs)
+        self._registry = {}
+
+    def register(self, name, module_name, class_name, kv_files=(), before_load=None):
+        """Registers a screen to build on demand. `before_load()` runs first, if given."""
+        self._registry[name] = (module_name, class_name, tuple(kv_files), before_load)
+
+    def load_screen(self, name):
+        """Builds and adds the registered screen `name` unless it already exists; returns it."""
+        if self.has_screen(name):
+            return self.get_screen(name)
+        module_name, class_name, kv_files, before_load = self._registry[name]
+        with startup.phase(f"load screen '{name}'"):
+            if before_load:
+                before_load()
+            screen_class = getattr(importlib.import_module(module_name), class_name)
+            for kv_file in kv_files:
+                if kv_file not in _loaded_kv_files:
+                    Builder.load_file(kv_file)
+                    _loaded_kv_files.add(kv_file)
+            screen = screen_class(name=name)
+            self.add_widget(screen)
+        return screen
+
+    def on_current(self, instance, value):
+        if value in self._registry and not self.has_screen(value):
+            self.load_screen(value)
+        super(LazyScreenManager, self).on_current(instance, value)
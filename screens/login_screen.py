@@ -2,23 +2,45 @@ from kivy.uix.screenmanager import Screen
 from kivy.properties import StringProperty, BooleanProperty
 from kivy.app import App
 from kivy.metrics import dp
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
+from concurrent.futures import ThreadPoolExecutor
+from database import encrypt_ledger, has_sealed_descriptions
+from utils.ledger_writer import ledger_writer
+from utils.transaction_log import transaction_log
+from utils.crypto import (create_password_record, unlock, check_legacy_password, LedgerCipher,
+                          CIPHER_AVAILABLE, CIPHER_NAME)
 import os
 import json
 
-# File to store password
+# File to store the password record (salt, scrypt parameters and verifier; see utils/crypto.py)
 USER_DATA_FILE = "user_data.json"
+# A new password has a new salt and so a new key, which can't open rows sealed with the old one
+ENCRYPTED_LEDGER_MESSAGE = "This ledger is encrypted with an earlier password. Restore user_data.json to open it."
+
+# Key derivation (about utils.crypto.UNLOCK_BUDGET, more when setting a password)
+# and sealing a ledger for the first time run on this worker, off the UI thread.
+_unlock_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="unlock")
+
+
+def has_password(user_data):
+    # "master_password" is the plaintext kept by older versions, replaced at the next login
+    return bool(user_data) and ("verifier" in user_data or "master_password" in user_data)
 
 class LoginScreen(Screen):
     error_message = StringProperty("")
     login_mode = BooleanProperty(True)  # True for login, False for register
     show_register_option = BooleanProperty(False)  # Whether to show the register option
+    busy = BooleanProperty(False)  # A password is being checked or set on the worker
+    # Encryption is opt-in: a sealed ledger loses the full-text index, so search
+    # scans and opens rows (about 250 ms at 1M rows instead of a few ms)
+    offer_encryption = BooleanProperty(False)
     
     def __init__(self, **kwargs):
         super(LoginScreen, self).__init__(**kwargs)
         # Check if a password already exists
         user_data = self.load_user_data()
-        if not user_data or "master_password" not in user_data:
+        self.offer_encryption = CIPHER_AVAILABLE and not user_data.get("ledger")
+        if not has_password(user_data):
             # No password exists yet, switch to registration mode
             self.login_mode = False
             self.show_register_option = False  # No option needed on first run
@@ -37,6 +59,8 @@ class LoginScreen(Screen):
 
     def login(self):
         """Handle login process"""
+        if self.busy:
+            return
         password = self.ids.password_input.text.strip()
         
         if not password:
@@ -45,22 +69,97 @@ class LoginScreen(Screen):
             
         user_data = self.load_user_data()
         
-        if not user_data or "master_password" not in user_data:
+        if not has_password(user_data):
             self.error_message = "No password set. Please create a password first."
             self.login_mode = False  # Switch to register mode
             return
-            
-        # Check if the password is correct
-        if password == user_data["master_password"]:
-            self.error_message = ""
-            App.get_running_app().root.current = 'main'  # Switch to main screen
-            self.ids.password_input.text = ""  # Clear password
-        else:
-            self.error_message = "Invalid password"
-            self.ids.password_input.text = ""  # Clear password
+
+        self.ids.password_input.text = ""  # Clear password
+        if self.offer_encryption and self.ids.encrypt_checkbox.active:
+            user_data["encrypt"] = True  # Saved once the ledger is encrypted
+        self.error_message = "Unlocking..."
+        self.busy = True
+        App.get_running_app().ensure_db()
+        _unlock_executor.submit(self.unlock_with, password, user_data)
+
+    def unlock_with(self, password, user_data):
+        """Worker thread: checks the password and opens the ledger with the key derived from it."""
+        try:
+            if "master_password" in user_data:
+                # Saved in plaintext by an older version: check it once, then store a hash instead
+                if not check_legacy_password(user_data["master_password"], password):
+                    self.unlock_finished("Invalid password")
+                    return
+                encrypt = user_data.get("encrypt")
+                user_data, ledger_key = create_password_record(password)
+                if encrypt:
+                    user_data["encrypt"] = True
+                try:
+                    # Saved before the key is used: a key whose salt is lost could seal rows for good
+                    self.save_user_data(user_data)
+                except OSError:
+                    self.unlock_finished("Could not save the password record")
+                    return
+            else:
+                ledger_key = unlock(user_data, password)
+                if ledger_key is None:
+                    self.unlock_finished("Invalid password")
+                    return
+            self.unlock_finished(self.open_ledger(ledger_key, user_data))
+        except Exception as e:
+            print(f"Error unlocking the ledger: {e}")
+            self.unlock_finished("Could not open the ledger")
+
+    @mainthread
+    def unlock_finished(self, error):
+        """Shows `error`, or (None) switches to the main screen."""
+        self.busy = False
+        if error:
+            self.error_message = error
+            return
+        self.error_message = ""
+        app = App.get_running_app()
+        app.start_recurring()
+        app.root.current = 'main'  # Switch to main screen
+
+    @mainthread
+    def show_encryption_progress(self, sealed, total):
+        if self.busy and total:
+            self.error_message = f"Encrypting the ledger... {100 * sealed // total}%"
+
+    def open_ledger(self, ledger_key, user_data):
+        """
+        Worker thread: if the ledger is encrypted or the user chose encryption,
+        encrypts it with `ledger_key` (sealing rows, recurring rules and
+        transaction log entries still in plaintext). Returns
+        an error message if it can't be opened, else None.
+        """
+        if not (user_data.get("ledger") or user_data.get("encrypt")):
+            return None  # Plaintext ledger, searched through the full-text index
+        if not CIPHER_AVAILABLE:
+            if user_data.get("ledger"):
+                return "This ledger is encrypted; the 'cryptography' package is needed to open it."
+            print("Warning: 'cryptography' is not installed; the ledger is stored unencrypted.")
+            return None
+        if user_data.get("ledger") != CIPHER_NAME:
+            # Recorded before the first row is sealed, so an interrupted run is finished at the next unlock
+            user_data.pop("encrypt", None)
+            user_data["ledger"] = CIPHER_NAME
+            try:
+                self.save_user_data(user_data)
+            except OSError:
+                return "Could not save the password record; the ledger was not encrypted"
+        cipher = LedgerCipher(ledger_key)
+        if not encrypt_ledger(cipher, writer=ledger_writer, on_progress=self.show_encryption_progress):
+            return "Could not open the encrypted ledger"
+        # Entries logged before encryption (or by the command line) are sealed too
+        transaction_log.seal_history(cipher.seal)
+        return None
 
     def register_user(self):
         """Handle new user registration"""
+        if self.busy:
+            return
         password = self.ids.password_input.text.strip()
         confirm_password = self.ids.confirm_password_input.text.strip()
         
@@ -72,11 +171,43 @@ class LoginScreen(Screen):
         if password != confirm_password:
             self.error_message = "Passwords do not match"
             return
-            
-        # Save the master password
-        user_data = {"master_password": password}
-        self.save_user_data(user_data)
-        
+
+        if self.load_user_data().get("ledger"):
+            self.error_message = ENCRYPTED_LEDGER_MESSAGE
+            return
+
+        encrypt = self.offer_encryption and self.ids.encrypt_checkbox.active
+        self.error_message = "Creating password..."
+        self.busy = True
+        App.get_running_app().ensure_db()
+        _unlock_executor.submit(self.save_password, password, encrypt)
+
+    def save_password(self, password, encrypt=False):
+        """
+        Worker thread: saves a hash of the master password, with scrypt tuned for
+        this device. With `encrypt` the ledger is encrypted at the first login.
+        Refuses if the ledger already holds sealed rows (user_data.json was lost).
+        """
+        if has_sealed_descriptions():
+            self.register_finished(ENCRYPTED_LEDGER_MESSAGE)
+            return
+        try:
+            user_data, _ = create_password_record(password)
+            if encrypt:
+                user_data["encrypt"] = True
+            self.save_user_data(user_data)
+        except Exception as e:
+            print(f"Error creating password: {e}")
+            self.register_finished("Could not create the password")
+            return
+        self.register_finished(None)
+
+    @mainthread
+    def register_finished(self, error):
+        self.busy = False
+        if error:
+            self.error_message = error
+            return
         # Success feedback
         self.error_message = "Password created successfully!"
         # Automatically switch to login mode
@@ -100,9 +231,17 @@ class LoginScreen(Screen):
             return {}
             
     def save_user_data(self, data):
-        """Save user data to file"""
+        """
+        Save user data to file. It is written to a temporary file and moved into
+        place, so a failed save leaves the previous record whole. Raises OSError.
+        """
+        temp_file = USER_DATA_FILE + ".tmp"
         try:
-            with open(USER_DATA_FILE, 'w') as f:
+            with open(temp_file, 'w') as f:
                 json.dump(data, f)
-        except Exception as e:
-            print(f"Error saving user data: {e}")
\ No newline at end of file
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, USER_DATA_FILE)
+        except OSError as e:
+            print(f"Error saving user data: {e}")
+            raise
\ No newline at end of file
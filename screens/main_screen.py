@@ -1,114 +1,366 @@
 from kivy.uix.screenmanager import Screen
-from kivy.properties import ListProperty, StringProperty, NumericProperty
-from kivy.clock import Clock
-from database import get_transactions, delete_transaction, add_transaction, get_unique_tags
+from kivy.properties import ListProperty, StringProperty, NumericProperty, BooleanProperty
+from kivy.clock import Clock, mainthread
+from database import (get_transactions_page, search_transactions, get_balance_in_base, fold_tag,
+                      TRANSACTIONS_PAGE_SIZE, DEFAULT_TAG, BASE_CURRENCY as BASE_CURRENCY_ANALYSIS)
+from models import Transaction, transaction_list_item, transaction_list_items
 from widgets.add_transaction_popup import AddTransactionPopup
-from utils.analysis import convert_to_base_currency, BASE_CURRENCY_ANALYSIS # Import conversion utilities
+from widgets.tag_edit_popup import TagEditPopup
+from widgets.budget_popup import BudgetPopup
+from utils.budgets import BudgetMonitor, BUDGET_EXCEEDED
+from utils.tags import TagSet
+from utils.recurrence import create_rule, recurring_scheduler
+from utils.journal import OperationJournal, AddOperation, DeleteOperation, RetagOperation, Change
+from utils.ledger_writer import ledger_writer
+from utils.instrumentation import timed, span, count, trace
+from bisect import bisect_left
+import itertools
 import os
 
-LOG_FILE = "transaction_logs.txt"
+# Fetch the next page once the list is scrolled within this fraction of its end
+# (RecycleView scroll_y goes from 1 at the top to 0 at the bottom).
+LOAD_MORE_THRESHOLD = 0.1
+# Seconds of no typing before the search box queries the database.
+SEARCH_DEBOUNCE = 0.25
+# Seconds a budget alert stays on screen.
+BUDGET_ALERT_SECONDS = 6
 
 class MainScreen(Screen):
     transactions_data = ListProperty([])
     total_balance = NumericProperty(0.0) # This will now be in BASE_CURRENCY_ANALYSIS
     available_tags = ListProperty([])
     current_tag_filter = StringProperty("All Tags") # Default filter
+    search_query = StringProperty("") # Search box text; the list shows search results while set
+    selected_count = NumericProperty(0) # Transactions ticked for a bulk action
+    can_undo = BooleanProperty(False)
+    can_redo = BooleanProperty(False)
+    budget_alert = StringProperty("") # Shown in a banner when a budget threshold is crossed
+
+    # Paging state for the current filter or search (see load_next_page)
+    _tag_filter = None
+    _page_cursor = None
+    _search = None
+    _search_offset = 0
+    _has_more_pages = False
+    _search_trigger = None
+
+    def __init__(self, **kwargs):
+        super(MainScreen, self).__init__(**kwargs)
+        self.journal = OperationJournal(writer=ledger_writer)
+        self._provisional_ids = itertools.count(-1, -1) # Ids for added rows shown before their commit
+        self._selected = set() # Ids ticked in the list
+        self.budget_monitor = BudgetMonitor()
+        self.tag_set = TagSet()
+        self._clear_alert_trigger = Clock.create_trigger(self.clear_budget_alert, BUDGET_ALERT_SECONDS)
 
     def on_enter(self, *args):
-        print("Entering Main Screen, scheduling transaction and tag load...")
+        trace("Entering Main Screen, scheduling transaction and tag load...")
+        self.budget_monitor.prime()
         Clock.schedule_once(self.load_tags_for_filter, 0.05) # Load tags first
         Clock.schedule_once(lambda dt: self.load_transactions(tag_filter=self.current_tag_filter), 0.1)
 
 
     def load_tags_for_filter(self, dt=0):
-        print("Loading unique tags for filter...")
-        unique_tags = get_unique_tags()
-        self.available_tags = ["All Tags"] + sorted(list(set(unique_tags))) # Ensure "All Tags" is an option
+        trace("Loading tags for filter...")
+        self.tag_set.load()
+        self.show_tags()
+
+    def show_tags(self):
+        """Puts the tag set into the filter spinner (after load_tags_for_filter or an operation changed it)."""
+        self.available_tags = ["All Tags"] + self.tag_set.names() # Ensure "All Tags" is an option
         if self.current_tag_filter not in self.available_tags and self.current_tag_filter != "All Tags":
             self.current_tag_filter = "All Tags"
         
         if hasattr(self.ids, 'tag_filter_spinner') and self.ids.tag_filter_spinner.text != self.current_tag_filter:
              self.ids.tag_filter_spinner.text = self.current_tag_filter
-        print(f"Available tags for filter: {self.available_tags}")
+        trace("Available tags for filter: %s", self.available_tags)
 
 
+    @timed("ui.load_transactions")
     def load_transactions(self, dt=0, tag_filter=None):
-        print(f"Executing scheduled load_transactions... Filter: {tag_filter}")
+        trace("Executing scheduled load_transactions... Filter: %s", tag_filter)
         if tag_filter is None:
             tag_filter = self.current_tag_filter
 
         try:
-            all_transactions = get_transactions() # Fetches (id, amount, desc, currency, type, date, tag)
-            temp_data = []
-            balance_in_base_currency = 0.0
-
-            # Calculate overall balance in base currency
-            for _, original_amount, _, currency, t_type, _, _ in all_transactions:
-                amount_in_base = convert_to_base_currency(float(original_amount), currency)
-                if t_type == 'credit':
-                    balance_in_base_currency += amount_in_base
-                elif t_type == 'debit':
-                    balance_in_base_currency -= amount_in_base
-            
-            self.total_balance = balance_in_base_currency # total_balance is now in INR
-
-            # Now filter for display
-            filtered_transactions_for_display = []
-            if tag_filter == "All Tags" or not tag_filter:
-                filtered_transactions_for_display = all_transactions
-            else:
-                for t in all_transactions:
-                    if t[6] == tag_filter: # index 6 is tag
-                        filtered_transactions_for_display.append(t)
-            
-            # Prepare data for RecycleView (amounts are kept in their original currency for display in the list)
-            for t_id, amount, desc, curr, t_type, date, tag_val in reversed(filtered_transactions_for_display):
-                temp_data.append({
-                    "transaction_id": t_id,
-                    "amount": f"{float(amount):.2f}", # Display original amount
-                    "description": desc,
-                    "currency": curr, # Display original currency
-                    "transaction_type": t_type.capitalize(),
-                    "date": date,
-                    "tag": tag_val if tag_val else "Uncategorized",
-                    "delete_callback": self.delete_transaction_callback
-                })
-
-            self.transactions_data = temp_data
-            print(f"Loaded {len(self.transactions_data)} transactions for display. Overall Balance (in {BASE_CURRENCY_ANALYSIS}): {self.total_balance:.2f}")
+            self.update_balance()
+            self.reset_list(tag_filter)
+            trace("Loaded %d transactions for display. Overall Balance (in %s): %.2f",
+                  len(self.transactions_data), BASE_CURRENCY_ANALYSIS, self.total_balance)
         except Exception as e:
             print(f"Error loading transactions: {e}")
             self.transactions_data = []
 
+    def update_balance(self):
+        # Overall balance in base currency, converted per day from the maintained aggregates
+        balance_in_base_currency, missing_rates = get_balance_in_base()
+        if missing_rates:
+            print(f"Warning: Exchange rates not found for {', '.join(missing_rates)}. Using 1.0 (no conversion).")
+        self.total_balance = balance_in_base_currency # total_balance is now in INR
+
+    def reset_list(self, tag_filter):
+        """Restarts paging for the (possibly new) filter or search; later pages load on scroll."""
+        self._tag_filter = None if tag_filter == "All Tags" or not tag_filter else tag_filter
+        self._page_cursor = None
+        self._search = self.search_query or None
+        self._search_offset = 0
+        self._has_more_pages = True
+        self.transactions_data = []
+        self.load_next_page()
+
+    @timed("ui.load_next_page")
+    def load_next_page(self, *args):
+        """Appends the next page of the current filter (or search results) to the RecycleView data."""
+        if not self._has_more_pages:
+            return
+        if self._search:
+            # Best matches first, within the tag filter
+            page = search_transactions(self._search, limit=TRANSACTIONS_PAGE_SIZE, offset=self._search_offset,
+                                       tag=self._tag_filter)
+            self._search_offset += len(page)
+        else:
+            # Oldest first, matching the list's chronological order
+            page = get_transactions_page(tag=self._tag_filter, after=self._page_cursor,
+                                         limit=TRANSACTIONS_PAGE_SIZE, newest_first=False)
+        self._has_more_pages = len(page) == TRANSACTIONS_PAGE_SIZE
+        if not page:
+            return
+        self._page_cursor = (page[-1].date, page[-1].id)
+
+        # Prepare data for RecycleView (amounts are kept in their original currency for display in the list)
+        with span("ui.transactions_data"):
+            self.transactions_data.extend(transaction_list_items(page, self.delete_transaction_callback,
+                                                                 self.select_callback, self._selected))
+        count("ui.list_rows", len(page))
+
+    def on_transactions_scroll(self, scroll_y):
+        if scroll_y <= LOAD_MORE_THRESHOLD:
+            self.load_next_page()
+
+    def on_search_text(self, text):
+        """Restarts the debounce timer on every keystroke; the search runs once typing pauses."""
+        if self._search_trigger is None:
+            self._search_trigger = Clock.create_trigger(self.run_search, SEARCH_DEBOUNCE)
+        self._search_trigger.cancel()
+        self._search_trigger()
+
+    def run_search(self, dt=0):
+        query = self.ids.search_input.text.lstrip() if 'search_input' in self.ids else self.search_query
+        if not query.strip():
+            query = ""
+        if query == self.search_query:
+            return
+        self.search_query = query
+        self.reset_list(self.current_tag_filter)
+
 
     def delete_transaction_callback(self, transaction_id):
-        print(f"Callback triggered: Deleting transaction id={transaction_id}")
-        try:
-            delete_transaction(transaction_id)
-            self.load_tags_for_filter() 
-            self.load_transactions(tag_filter=self.current_tag_filter) 
-        except Exception as e:
-            print(f"Error deleting transaction: {e}")
+        trace("Callback triggered: Deleting transaction id=%s", transaction_id)
+        if transaction_id < 0:
+            return # Still being added
+        self.run_operation(DeleteOperation([transaction_id]), preview=Change([transaction_id], (), (), ()))
 
     def add_transaction_callback(self, amount, description, currency, transaction_type, date, tag):
-        print(f"Callback triggered: Adding transaction with tag '{tag}'...")
+        trace("Callback triggered: Adding transaction with tag '%s'...", tag)
+        # Shown straight away under a provisional id; the committed row replaces it
+        provisional = Transaction(next(self._provisional_ids), amount, description, currency,
+                                  transaction_type, date, tag or DEFAULT_TAG)
+        self.run_operation(AddOperation(amount, description, currency, transaction_type, date, tag),
+                           preview=Change((), [provisional], (), ()))
+
+    # --- Selection, bulk actions and undo/redo ---
+
+    def select_callback(self, transaction_id, selected):
+        if selected:
+            self._selected.add(transaction_id)
+        else:
+            self._selected.discard(transaction_id)
+        self.selected_count = len(self._selected)
+        # Keep the item's data in step so a recycled view shows the right state
+        for i, item in enumerate(self.transactions_data):
+            if item["transaction_id"] == transaction_id:
+                if item["selected"] != selected:
+                    self.transactions_data[i] = dict(item, selected=selected)
+                break
+
+    def clear_selection(self):
+        if not self._selected:
+            return
+        selected = self._selected
+        self._selected = set()
+        self.selected_count = 0
+        for i, item in enumerate(self.transactions_data):
+            if item["transaction_id"] in selected:
+                self.transactions_data[i] = dict(item, selected=False)
+
+    def delete_selected(self):
+        if self._selected:
+            ids = sorted(self._selected)
+            self.run_operation(DeleteOperation(ids), preview=Change(ids, (), (), ()))
+
+    def open_tag_popup(self):
+        if self._selected:
+            popup = TagEditPopup(apply_callback=self.tag_selected, count=len(self._selected),
+                                 suggestions=[tag for tag in self.available_tags if tag != "All Tags"])
+            popup.open()
+
+    def tag_selected(self, tag):
+        if self._selected:
+            self.run_operation(RetagOperation(sorted(self._selected), tag))
+
+    def undo(self):
+        self._queue(self.journal.undo())
+
+    def redo(self):
+        self._queue(self.journal.redo())
+
+    def run_operation(self, operation, preview=None):
+        """
+        Queues `operation` on the ledger writer without waiting for its commit.
+        `preview`, a Change guessed from the request, updates the list at once;
+        _settle reconciles it with what was committed.
+        """
+        self.clear_selection()
+        if self._search:
+            preview = None # Search results are re-run once the change is committed
+        if preview is not None:
+            self.apply_change(preview)
+        self._queue(self.journal.do(operation), preview)
+
+    def _queue(self, pending, preview=None):
+        if pending is None:
+            return
+        operation, future = pending
+        self.can_undo = self.journal.can_undo
+        self.can_redo = self.journal.can_redo
+        future.add_done_callback(lambda future: self._settle(future, operation, preview))
+
+    @mainthread
+    def _settle(self, future, operation, preview):
+        """Runs on the UI thread once `operation`'s step is committed (or failed)."""
+        change = None
         try:
-            add_transaction(amount, description, currency, transaction_type, date, tag)
-            self.log_transaction(amount, description, currency, transaction_type, date, tag)
-            self.load_tags_for_filter() 
-            self.load_transactions(tag_filter=self.current_tag_filter)
+            change = future.result()
         except Exception as e:
-            print(f"Error adding transaction: {e}")
+            print(f"Error during {operation.label}: {e}")
+        if change is None:
+            # Nothing changed, so it can't be undone; put back whatever the preview showed
+            self.journal.discard(operation)
+            self.can_undo = self.journal.can_undo
+            self.can_redo = self.journal.can_redo
+            if preview is not None:
+                self.reset_list(self.current_tag_filter)
+            return
+        self._after_operation(change, preview)
+
+    def _after_operation(self, change, preview=None):
+        self.show_budget_alerts(self.budget_monitor.check(list(change.inserted) + list(change.updated)))
+        if change.removed or change.updated:
+            # Spending went down somewhere; re-read the levels so a later crossing alerts again
+            self.budget_monitor.prime()
+        if self._search:
+            # Search results are ordered by relevance, so run the search again
+            self.reset_list(self.current_tag_filter)
+        elif preview is not None:
+            # Provisional rows make way for the committed ones
+            self.apply_change(change._replace(removed=[t.id for t in preview.inserted] + list(change.removed)))
+        else:
+            self.apply_change(change)
+        self.update_balance()
+        if self.tag_set.apply(change):
+            self.show_tags()
+
+    def show_budget_alerts(self, alerts):
+        if not alerts:
+            return
+        messages = []
+        for status in alerts:
+            if status.level == BUDGET_EXCEEDED:
+                messages.append(f"{status.tag} budget exceeded: {status.spent:.2f} of {status.limit:.2f}")
+            else:
+                messages.append(f"{status.tag} budget {100 * status.fraction:.0f}% used: "
+                                f"{status.spent:.2f} of {status.limit:.2f}")
+        self.budget_alert = "\n".join(messages)
+        print(f"Budget alert: {self.budget_alert}")
+        self._clear_alert_trigger.cancel()
+        self._clear_alert_trigger()
+
+    def clear_budget_alert(self, dt=0):
+        self.budget_alert = ""
+
+    def open_budget_popup(self):
+        popup = BudgetPopup(tags=[tag for tag in self.available_tags if tag != "All Tags"])
+        popup.bind(on_dismiss=lambda *args: self.budget_monitor.prime())
+        popup.open()
 
-    def log_transaction(self, amount, description, currency, transaction_type, date, tag):
-         try:
-             with open(LOG_FILE, "a") as log_file:
-                 log_file.write(f"{date} - {transaction_type.capitalize()}: {amount} {currency} - {description} [Tag: {tag if tag else 'Uncategorized'}]\n")
-         except Exception as e:
-             print(f"Error writing to log file: {e}")
+    def _matches_filter(self, transaction):
+        return self._tag_filter is None or fold_tag(transaction.tag) == fold_tag(self._tag_filter)
+
+    def _is_loaded_range(self, transaction):
+        """Whether `transaction` sorts within the pages loaded so far (later ones arrive on scroll)."""
+        return not self._has_more_pages or (transaction.date, transaction.id) <= self._page_cursor
+
+    @timed("ui.apply_change")
+    def apply_change(self, change):
+        """
+        Updates transactions_data for a journal Change with per-item removes,
+        replacements and inserts, so the RecycleView only refreshes what moved.
+        The list is in (date, id) order and the paging cursor stays valid.
+        """
+        data = self.transactions_data
+        gone = set(change.removed)
+        updated = {t.id: t for t in change.updated}
+        # Updated rows that no longer match the filter leave the list too
+        gone.update(t_id for t_id, t in updated.items() if not self._matches_filter(t))
+
+        # Delete from the end so earlier indices stay valid
+        for i in range(len(data) - 1, -1, -1):
+            t_id = data[i]["transaction_id"]
+            if t_id in gone:
+                del data[i]
+            elif t_id in updated:
+                data[i] = transaction_list_item(updated.pop(t_id), self.delete_transaction_callback,
+                                                self.select_callback)
+
+        # What remains (new or restored rows, and rows retagged into the filter) is inserted in order
+        keys = [(item["date"], item["transaction_id"]) for item in data]
+        new_rows = [t for t in list(change.inserted) + list(updated.values())
+                    if self._matches_filter(t) and self._is_loaded_range(t) and t.id not in gone]
+        for t in sorted(new_rows, key=lambda t: (t.date, t.id)):
+            i = bisect_left(keys, (t.date, t.id))
+            if i < len(keys) and keys[i] == (t.date, t.id):
+                continue # Already loaded by a page read after it was committed
+            keys.insert(i, (t.date, t.id))
+            if t.id < 0:
+                # Provisional (see add_transaction_callback): not deletable or selectable until committed
+                data.insert(i, transaction_list_item(t))
+            else:
+                data.insert(i, transaction_list_item(t, self.delete_transaction_callback, self.select_callback))
+        count("ui.list_changes", len(change.removed) + len(change.inserted) + len(change.updated))
+
+    def add_recurring_callback(self, amount, description, currency, transaction_type, date, tag, schedule):
+        try:
+            future = create_rule(amount, description, currency, transaction_type, tag, schedule,
+                                 start_date=date, include_start=False, writer=ledger_writer)
+        except ValueError as e:
+            print(f"Error creating recurring rule: {e}")
+            return
+        future.add_done_callback(self._rule_created)
+
+    @mainthread
+    def _rule_created(self, future):
+        """Starts scheduling a new rule once it is committed (on the UI thread, like every scheduler call)."""
+        try:
+            rule = future.result()
+        except Exception as e:
+            print(f"Error creating recurring rule: {e}")
+            return
+        recurring_scheduler.add(rule)
+        trace("Recurring rule %s (%s) next due %s", rule.id, rule.schedule, rule.next_due)
 
     def open_add_popup(self):
-        popup = AddTransactionPopup(add_callback=self.add_transaction_callback)
+        popup = AddTransactionPopup(add_callback=self.add_transaction_callback,
+                                    repeat_callback=self.add_recurring_callback)
         popup.open()
 
     def go_to_analysis(self):
@@ -116,6 +368,6 @@ class MainScreen(Screen):
             self.manager.current = 'analysis'
 
     def on_tag_filter_change(self, spinner_text):
-        print(f"Tag filter changed to: {spinner_text}")
+        trace("Tag filter changed to: %s", spinner_text)
         self.current_tag_filter = spinner_text
         self.load_transactions(tag_filter=self.current_tag_filter)
\ No newline at end of file
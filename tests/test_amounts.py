@@ -0,0 +1,131 @@
+"""
+Exact totals in integer minor units: over a large synthetic ledger, the
+trigger-maintained ledger_totals and ledger_daily, SUM(amount_minor) and the
+int64 LedgerColumns sums all equal the totals computed with Decimal from the
+generated amounts, and stay equal through updates and deletes; each row is
+displayed rounded as it is stored.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from decimal import Decimal, ROUND_HALF_UP
+
+import database
+from benchmarks.ledger import SyntheticLedger
+from utils.currencies import currency_exponent, format_amount, to_minor_units
+from utils.ledger_columns import LedgerColumns
+
+ROWS = 50_000  # Large enough that float sums of these amounts drift
+
+
+def to_minor(amount, currency):
+    quantum = Decimal(1).scaleb(-currency_exponent(currency))
+    return int(Decimal(repr(amount)).quantize(quantum, rounding=ROUND_HALF_UP) / quantum)
+
+
+def expected_totals(rows):
+    """{(currency, type): (count, total_minor)} summed exactly from the rows."""
+    totals = {}
+    for amount, _, currency, t_type, _, _ in rows:
+        count, total = totals.get((currency, t_type), (0, 0))
+        totals[(currency, t_type)] = (count + 1, total + to_minor(amount, currency))
+    return totals
+
+
+class ExactTotalsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        database.close_connections()
+        cls.ledger = SyntheticLedger(ROWS)
+        cls.ledger.write(os.path.join(cls._tmp.name, "ledger.db"))
+
+    @classmethod
+    def tearDownClass(cls):
+        database.close_connections()
+        cls._tmp.cleanup()
+
+    def ledger_file(self):
+        """A fresh copy of the generated ledger for one test."""
+        database.close_connections()
+        target = os.path.join(self._tmp.name, f"{self.id()}.db")
+        with open(os.path.join(self._tmp.name, "ledger.db"), "rb") as source, open(target, "wb") as copy:
+            copy.write(source.read())
+        return target
+
+    def maintained_totals(self):
+        return {(currency, t_type): (count, total) for currency, t_type, count, total in database.get_connection().execute(
+            "SELECT currency, transaction_type, tx_count, total_minor FROM ledger_totals")}
+
+    def summed_totals(self):
+        return {(currency, t_type): (count, total) for currency, t_type, count, total in database.get_connection().execute(
+            "SELECT currency, transaction_type, COUNT(*), SUM(amount_minor) FROM transactions GROUP BY 1, 2")}
+
+    def daily_totals(self):
+        totals = {}
+        for _, currency, t_type, _, count, total in database.get_daily_totals():
+            old_count, old_total = totals.get((currency, t_type), (0, 0))
+            totals[(currency, t_type)] = (old_count + count, old_total + total)
+        return totals
+
+    def column_totals(self, columns):
+        currencies, credits, debits = columns.totals_minor()
+        totals = {}
+        for currency, credit, debit in zip(currencies, credits.tolist(), debits.tolist()):
+            totals[(currency, "credit")], totals[(currency, "debit")] = credit, debit
+        return totals
+
+    def assert_exact(self, expected):
+        self.assertEqual(self.maintained_totals(), expected)
+        self.assertEqual(self.summed_totals(), expected)
+        self.assertEqual(self.daily_totals(), expected)
+        sums = {key: total for key, (_, total) in expected.items()}
+        self.assertEqual(self.column_totals(LedgerColumns.from_transactions()), sums)
+        self.assertEqual(self.column_totals(LedgerColumns.from_daily_totals()), sums)
+        self.assertEqual(database.check_aggregates(), [])
+
+    def test_large_ledger(self):
+        database.DB_FILE = self.ledger_file()
+        expected = expected_totals(self.ledger.iter_rows())
+        self.assertEqual(sum(count for count, _ in expected.values()), ROWS)
+        self.assert_exact(expected)
+
+    def test_after_updates_and_deletes(self):
+        database.DB_FILE = self.ledger_file()
+        rows = {row[0]: row[1:] for row in database.get_connection().execute(
+            "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions")}
+        conn = database.get_connection()
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Every seventh row gets a new amount and every eleventh is deleted
+            for row_id in range(7, ROWS + 1, 7):
+                amount = round(rows[row_id][0] + 0.07, 2)
+                conn.execute("UPDATE transactions SET amount = ? WHERE id = ?", (amount, row_id))
+                rows[row_id] = (amount,) + rows[row_id][1:]
+            conn.commit()
+            self.assertTrue(database.delete_transactions(list(range(11, ROWS + 1, 11))))
+        for row_id in range(11, ROWS + 1, 11):
+            del rows[row_id]
+        self.assert_exact(expected_totals(rows.values()))
+
+    def test_display_matches_stored_amounts(self):
+        database.DB_FILE = self.ledger_file()
+        conn = database.get_connection()
+        # Ties that rounding the float half to even (f"{amount:.2f}") gets wrong
+        with contextlib.redirect_stdout(io.StringIO()):
+            for amount, currency in ((2.675, "INR"), (0.125, "USD"), (1.0005, "KWD"), (-2.5, "JPY")):
+                database.add_transaction(amount, "Tie", currency, "debit", "2024-01-01 00:00:00", "Food")
+        for amount, currency, amount_minor in conn.execute("SELECT amount, currency, amount_minor FROM transactions"):
+            self.assertEqual(to_minor_units(amount, currency), amount_minor)
+        shown = [format_amount(amount, currency) for amount, currency in conn.execute(
+            "SELECT amount, currency FROM transactions WHERE description = 'Tie' ORDER BY id")]
+        self.assertEqual(shown, ["2.68", "0.13", "1.001", "-3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Encryption at rest: after encrypt_ledger, no description is left in plaintext
+in the transactions, the recurring rules or the transaction log and its
+archives, each still reads back with the key, and search finds sealed rows
+through their keyed search tokens.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import base64
+import contextlib
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+import database
+from utils import crypto
+from utils.transaction_log import TransactionLogWriter, iter_log_events
+
+ROWS = [
+    (12.5, "Secret groceries", "INR", "debit", "2024-01-02 18:30:00", "Food"),
+    (40.0, "Secret train", "USD", "debit", "2024-01-03 07:15:00", "Travel"),
+]
+
+
+@unittest.skipUnless(crypto.CIPHER_AVAILABLE, "needs the 'cryptography' package")
+class EncryptionCoverageTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "ledger.db")
+        self.log_path = os.path.join(self._tmp.name, "log.jsonl")
+        database.close_connections()
+        database.set_ledger_cipher(None)
+        database.DB_FILE = self.path
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        self.cipher = crypto.LedgerCipher(os.urandom(32))
+
+    def tearDown(self):
+        database.set_ledger_cipher(None)
+        database.close_connections()
+        self._tmp.cleanup()
+
+    def test_rules_are_sealed(self):
+        database.add_recurring_rule(100, "Secret rent", "INR", "debit", "Rent", "monthly",
+                                    "2024-01-01 00:00:00", "2024-01-01 00:00:00")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(database.encrypt_ledger(self.cipher))
+        database.add_recurring_rule(5, "Secret coffee", "INR", "debit", "Food", "daily",
+                                    "2024-01-01 00:00:00", "2024-01-01 00:00:00")
+        stored = [description for (description,) in database.get_connection().execute(
+            "SELECT description FROM recurring_rules ORDER BY id")]
+        self.assertTrue(all(isinstance(description, bytes) for description in stored))
+        self.assertEqual([rule[2] for rule in database.get_recurring_rules()], ["Secret rent", "Secret coffee"])
+
+        # Without the key, a rule keeps its sealed description for the rows it generates
+        database.set_ledger_cipher(None)
+        self.assertEqual([rule[2] for rule in database.get_recurring_rules()], stored)
+
+    def test_has_sealed_descriptions(self):
+        database.add_transactions_bulk(ROWS)
+        self.assertFalse(database.has_sealed_descriptions())
+        # The first encryption interrupted after its first step
+        database.run_write_steps([database.begin_encryption])
+        self.assertTrue(database.has_sealed_descriptions())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(database.encrypt_ledger(self.cipher))
+        self.assertTrue(database.has_sealed_descriptions())
+
+    def test_search_by_token(self):
+        database.add_transactions_bulk(ROWS)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(database.encrypt_ledger(self.cipher))
+            database.set_ledger_cipher(None)
+            # Written while locked: indexed at the next unlock
+            database.add_transaction(3.0, "Secret groceries refund", "INR", "credit", "2024-01-04 09:00:00", "Food")
+            database.set_ledger_cipher(self.cipher)
+            self.assertTrue(database.encrypt_ledger(self.cipher))
+        pending = database.get_connection().execute(database.COUNT_PENDING_TOKENS_SQL).fetchone()[0]
+        self.assertEqual(pending, 0)
+
+        def found(query):
+            return [t.description for t in database.search_transactions(query)]
+        self.assertEqual(found("groceries"), ["Secret groceries refund", "Secret groceries"])
+        self.assertEqual(found("secret tra"), ["Secret train"])
+        self.assertEqual(found("travel"), ["Secret train"])  # By tag
+        self.assertEqual(found("groc refund"), [])  # Only the last word matches as a prefix
+        self.assertEqual(found("nothing"), [])
+        # Within the list's tag filter, in any case
+        self.assertEqual([t.description for t in database.search_transactions("secret", tag="TRAVEL")], ["Secret train"])
+
+    def test_log_history_is_sealed(self):
+        # Rotated archives and the current file, written before encryption
+        legacy_path = os.path.join(self._tmp.name, "log.txt")
+        with open(legacy_path, "w") as f:
+            f.write("2024-01-01 00:00:00 - Debit: 12.5 INR - Secret groceries\n")
+        log = TransactionLogWriter(path=self.log_path, fsync="never", max_bytes=500, legacy_path=legacy_path)
+        for i, row in enumerate(ROWS * 3, start=1):
+            log.log_add(i, *row)
+            log.flush()
+        log.log_delete(1)
+        log.flush()
+        self.assertTrue(os.path.exists(self.log_path + ".2.gz"))
+
+        self.assertEqual(log.seal_history(self.cipher.seal), len(ROWS) * 3)
+        self.assertFalse(os.path.exists(legacy_path))
+        # The writer carries on after sealing, with descriptions sealed as the app logs them
+        log.log_add(7, ROWS[0][0], self.cipher.seal(ROWS[0][1]), *ROWS[0][2:])
+        log.close()
+
+        for name in os.listdir(self._tmp.name):
+            if name.startswith("log.jsonl"):
+                opener = gzip.open if name.endswith(".gz") else open
+                with opener(os.path.join(self._tmp.name, name), "rt", encoding="utf-8") as f:
+                    self.assertNotIn("Secret", f.read(), name)
+        events = list(iter_log_events(self.log_path))
+        self.assertEqual([event["op"] for event in events], ["add"] * 6 + ["delete", "add"])
+        self.assertEqual([self.cipher.open(base64.b64decode(event["description_sealed"]))
+                          for event in events if event["op"] == "add"], [row[1] for row in ROWS * 3 + ROWS[:1]])
+        self.assertEqual(log.seal_history(self.cipher.seal), 0)  # Nothing left to seal
+        log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Importing bank exports: CSV files with separate debit/credit columns (as
+some banks write them, zero-filled), a signed amount or a type column, and
+OFX statements, read into the same transaction tuples; import_file resumes
+where an interrupted run stopped, and logs the rows it commits.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import database
+from utils import importer, journal
+from utils.importer import ImportStats, import_file, iter_csv_rows, iter_ofx_rows
+from utils.transaction_log import TransactionLogWriter, verify_against_log
+
+ZERO_FILLED_CSV = '''Date,Narration,Withdrawal Amt.,Deposit Amt.
+02/01/2024,Rent,"5,000.00",0.00
+03/01/2024,Salary,0.00,80000.00
+04/01/2024,Refund,,12.50
+05/01/2024,Nothing,0.00,0.00
+'''
+SIGNED_CSV = '''date,description,amount,currency,type,category
+2024-01-02,Coffee,-3.50,usd,,Food
+2024-01-03,Interest,1.25,,,
+2024-01-04,Card payment,40,EUR,DR,Bills
+2024-01-05,Transfer,10,,,
+'''
+OFX = '''OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>EUR<BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240115120000.000[-5:EST]<TRNAMT>-42.10<FITID>1<NAME>Grocer</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240116<TRNAMT>1000<FITID>2<MEMO>Pay</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240117<TRNAMT>0.00<FITID>3<NAME>Zero</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+'''
+
+
+class ImporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        database.close_connections()
+        self._tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self._tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def rows(self, iterator):
+        stats = ImportStats()
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            rows = list(iterator(stats))
+        return rows, stats, output.getvalue()
+
+    def test_zero_filled_debit_and_credit_columns(self):
+        path = self.write("a.csv", ZERO_FILLED_CSV)
+        rows, stats, output = self.rows(lambda stats: iter_csv_rows(path, date_format="%d/%m/%Y", stats=stats))
+        self.assertEqual(rows, [
+            (5000.0, "Rent", "INR", "debit", "2024-01-02 00:00:00", "Uncategorized"),
+            (80000.0, "Salary", "INR", "credit", "2024-01-03 00:00:00", "Uncategorized"),
+            (12.5, "Refund", "INR", "credit", "2024-01-04 00:00:00", "Uncategorized"),
+        ])
+        self.assertEqual((stats.parsed, stats.skipped), (3, 1))
+        self.assertIn("a.csv line 5: zero amount", output)
+
+    def test_signed_amount_and_type_column(self):
+        path = self.write("b.csv", SIGNED_CSV)
+        rows, stats, output = self.rows(lambda stats: iter_csv_rows(path, default_currency="INR", stats=stats))
+        self.assertEqual(rows, [
+            (3.5, "Coffee", "USD", "debit", "2024-01-02 00:00:00", "Food"),
+            (1.25, "Interest", "INR", "credit", "2024-01-03 00:00:00", "Uncategorized"),
+            (40.0, "Card payment", "EUR", "debit", "2024-01-04 00:00:00", "Bills"),
+            (10.0, "Transfer", "INR", "credit", "2024-01-05 00:00:00", "Uncategorized"),
+        ])
+        self.assertEqual(stats.skipped, 0)
+
+    def test_ofx(self):
+        path = self.write("c.ofx", OFX)
+        rows, stats, output = self.rows(lambda stats: iter_ofx_rows(path, stats=stats))
+        self.assertEqual(rows, [
+            (42.1, "Grocer", "EUR", "debit", "2024-01-15 12:00:00", "Uncategorized"),
+            (1000.0, "Pay", "EUR", "credit", "2024-01-16 00:00:00", "Uncategorized"),
+        ])
+        self.assertEqual(stats.skipped, 1)
+        self.assertIn("OFX transaction 3: zero amount", output)
+
+    def test_import_file_resumes(self):
+        database.close_connections()
+        database.DB_FILE = os.path.join(self._tmp.name, "ledger.db")
+        path = self.write("a.csv", ZERO_FILLED_CSV.replace("02/01/2024", "2024-01-02").replace(
+            "03/01/2024", "2024-01-03").replace("04/01/2024", "2024-01-04").replace("05/01/2024", "2024-01-05"))
+        save_progress = importer._save_progress
+        log = TransactionLogWriter(path=os.path.join(self._tmp.name, "log.jsonl"), fsync="never",
+                                   legacy_path=os.path.join(self._tmp.name, "log.txt"))
+        self.addCleanup(log.close)
+
+        def fail_second_chunk(conn, source, path, rows_done, completed=False):
+            if rows_done > 2 and not completed:
+                raise sqlite3.OperationalError("disk I/O error")
+            save_progress(conn, source, path, rows_done, completed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+            # The second chunk fails and is rolled back with its progress
+            with mock.patch.object(journal, "transaction_log", log), mock.patch.object(importer, "transaction_log", log):
+                with mock.patch.object(importer, "_save_progress", fail_second_chunk):
+                    self.assertEqual(import_file(path, chunk_size=2), 2)
+                self.assertEqual(import_file(path, chunk_size=2), 1)
+                self.assertEqual(import_file(path, chunk_size=2), 0)  # Already imported
+        stored = database.get_connection().execute(
+            "SELECT amount, description, transaction_type FROM transactions ORDER BY id").fetchall()
+        self.assertEqual(stored, [(5000.0, "Rent", "debit"), (80000.0, "Salary", "credit"), (12.5, "Refund", "credit")])
+        self.assertEqual(database.check_aggregates(), [])
+        # Only committed chunks were logged, so the log rebuilds the ledger
+        log.flush()
+        self.assertEqual(verify_against_log(database.get_connection(), log.path), (0, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+The ledger writer under load: several threads submit adds, deletes, budget
+changes and failing steps while others read, and afterwards the ledger holds
+exactly the rows whose steps succeeded, in submission order, with aggregates
+that match them.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import unittest
+from decimal import Decimal, ROUND_HALF_UP
+
+import database
+from utils.currencies import currency_exponent
+from utils.ledger_writer import LedgerWriter
+
+PRODUCERS = 6
+STEPS_PER_PRODUCER = 400
+READERS = 3
+CURRENCIES = ("INR", "USD", "EUR", "JPY")
+TAGS = ("Food", "Travel", "Bills", "Rent")
+# One statement, so both counts come from the same snapshot
+CONSISTENT_COUNTS_SQL = "SELECT (SELECT IFNULL(SUM(tx_count), 0) FROM ledger_totals), (SELECT COUNT(*) FROM transactions)"
+
+
+def to_minor(amount, currency):
+    quantum = Decimal(1).scaleb(-currency_exponent(currency))
+    return int(Decimal(repr(amount)).quantize(quantum, rounding=ROUND_HALF_UP) / quantum)
+
+
+def failing_step(cursor):
+    cursor.execute("INSERT INTO transactions (amount) VALUES (1)")  # Violates NOT NULL; rolled back alone
+    raise AssertionError("not reached")
+
+
+class LedgerWriterStressTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        database.close_connections()
+        database.DB_FILE = os.path.join(self._tmp.name, "ledger.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        self.writer = LedgerWriter(max_group=64)
+
+    def tearDown(self):
+        self.writer.close()
+        database.close_connections()
+        self._tmp.cleanup()
+
+    def produce(self, index, submitted):
+        """Submits this producer's steps, recording (kind, args, future) in order."""
+        rng = random.Random(index)
+        live = []  # This producer's added rows not deleted yet
+        for i in range(STEPS_PER_PRODUCER):
+            roll = rng.random()
+            if roll < 0.05:
+                submitted.append(("fail", None, self.writer.submit(failing_step)))
+            elif roll < 0.10:
+                tag, limit = rng.choice(TAGS), rng.randint(100, 1000)
+                submitted.append(("budget", (tag, limit), self.writer.submit(
+                    lambda cursor, tag=tag, limit=limit: database.upsert_budget(cursor, tag, limit))))
+            elif roll < 0.20 and live:
+                # Deletes one of this producer's earlier rows once its add has committed
+                victim = live.pop(rng.randrange(len(live))).result().id
+                submitted.append(("delete", victim, self.writer.submit(
+                    lambda cursor, victim=victim: database.delete_transaction_rows(cursor, [victim]))))
+            else:
+                row = (round(rng.uniform(1, 5000), 2), f"producer {index} row {i}", rng.choice(CURRENCIES),
+                       rng.choice(("credit", "debit")), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+                       rng.choice(TAGS))
+                future = self.writer.submit(lambda cursor, row=row: database.insert_transaction_row(cursor, *row))
+                submitted.append(("add", row, future))
+                live.append(future)
+
+    def read(self, stop, failures):
+        """Reads like the main screen until `stop` is set; the snapshot counts must always agree."""
+        seen = 0
+        try:
+            while not stop.is_set():
+                aggregated, stored = database.get_connection().execute(CONSISTENT_COUNTS_SQL).fetchone()
+                if aggregated != stored or stored < seen:
+                    failures.append(f"inconsistent read: {aggregated} aggregated, {stored} stored, {seen} before")
+                seen = stored
+                database.get_transactions_page(tag=random.choice(TAGS), limit=database.TRANSACTIONS_PAGE_SIZE)
+                database.get_balance_in_base()
+                database.search_transactions("producer")
+        except sqlite3.Error as e:
+            failures.append(f"read failed: {e}")
+
+    def test_concurrent_submits_and_reads(self):
+        submissions = [[] for _ in range(PRODUCERS)]
+        stop = threading.Event()
+        failures = []
+        readers = [threading.Thread(target=self.read, args=(stop, failures)) for _ in range(READERS)]
+        producers = [threading.Thread(target=self.produce, args=(i, submitted))
+                     for i, submitted in enumerate(submissions)]
+        for thread in readers + producers:
+            thread.start()
+        for thread in producers:
+            thread.join()
+        self.assertTrue(self.writer.flush(timeout=30))
+        stop.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(failures, [])
+
+        expected = {}
+        budget_limits = {}
+        for submitted in submissions:
+            last_id = 0
+            for kind, args, future in submitted:
+                self.assertTrue(future.done())
+                if kind == "fail":
+                    self.assertIsInstance(future.exception(), sqlite3.IntegrityError)
+                    continue
+                self.assertIsNone(future.exception())
+                if kind == "add":
+                    transaction = future.result()
+                    # Steps run in submission order, so each producer's ids only grow
+                    self.assertGreater(transaction.id, last_id)
+                    last_id = transaction.id
+                    expected[transaction.id] = args
+                elif kind == "delete":
+                    self.assertEqual([t.id for t in future.result()], [args])
+                    del expected[args]
+                else:
+                    budget_limits.setdefault(args[0], set()).add(args[1])
+        self.assertEqual(self.writer.steps, PRODUCERS * STEPS_PER_PRODUCER)
+        self.assertLess(self.writer.commits, self.writer.steps)  # Some steps were committed together
+
+        stored = {row[0]: tuple(row[1:]) for row in database.get_connection().execute(
+            "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions")}
+        self.assertEqual(stored, expected)
+        self.assertEqual(database.check_aggregates(), [])
+        totals = {}
+        for amount, _, currency, t_type, _, _ in expected.values():
+            count, total = totals.get((currency, t_type), (0, 0))
+            totals[(currency, t_type)] = (count + 1, total + to_minor(amount, currency))
+        self.assertEqual({(currency, t_type): (count, total) for currency, t_type, count, total in
+                          database.get_connection().execute(
+                              "SELECT currency, transaction_type, tx_count, total_minor FROM ledger_totals")}, totals)
+        # Producers race on budgets, so each tag keeps one of the limits submitted for it
+        stored_budgets = {tag: limit for tag, limit, _, _ in database.get_budget_status()}
+        self.assertEqual(set(stored_budgets), set(budget_limits))
+        for tag, limit in stored_budgets.items():
+            self.assertIn(limit, budget_limits[tag])
+
+
+if __name__ == "__main__":
+    unittest.main()
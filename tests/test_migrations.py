@@ -0,0 +1,193 @@
+"""
+init_db upgrades: every schema the app has shipped (the pre-versioning shapes
+and each numbered version since) is brought to SCHEMA_VERSION with its rows
+intact, and a failing migration leaves the file as it was.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import database
+
+# Schemas from before PRAGMA user_version, oldest first.
+NO_DATE_NO_TAG_SQL = '''
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        amount REAL NOT NULL,
+        description TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        transaction_type TEXT NOT NULL CHECK(transaction_type IN ('credit', 'debit'))
+    )
+'''
+DATE_ONLY_SQL = NO_DATE_NO_TAG_SQL.replace("'debit'))", "'debit')),\n        date TEXT NOT NULL")
+TAG_ONLY_SQL = NO_DATE_NO_TAG_SQL.replace("'debit'))", "'debit')),\n        tag TEXT DEFAULT 'Uncategorized'")
+PRE_VERSIONING_SQL = NO_DATE_NO_TAG_SQL.replace(
+    "'debit'))", "'debit')),\n        date TEXT NOT NULL,\n        tag TEXT DEFAULT 'Uncategorized'")
+
+# (amount, description, currency, transaction_type, date, tag); 'food' is a case
+# variant merged into the more used 'Food'.
+ROWS = [
+    (1250.75, "Salary", "INR", "credit", "2024-01-01 09:00:00", "Salary"),
+    (12.34, "Groceries", "USD", "debit", "2024-01-02 18:30:00", "Food"),
+    (0.1, "Snack", "INR", "debit", "2024-01-02 19:00:00", "Food"),
+    (0.2, "Snack", "INR", "debit", "2024-01-03 19:00:00", "food"),
+    (1500, "Train", "JPY", "debit", "2024-02-10 07:15:00", "Travel"),
+    (99.99, "Refund", "EUR", "credit", "2024-02-11 12:00:00", "Shopping"),
+]
+CANONICAL_TAGS = {"food": "Food"}
+LEGACY_DATE = "1970-01-01 00:00:00"
+COLUMNS = {"id", "amount", "description", "currency", "transaction_type", "date", "tag",
+           "date_ts", "amount_minor", "tag_id"}
+TABLES = {"transactions", "import_progress", "exchange_rates", "budgets", "recurring_rules", "tags",
+          "ledger_totals", "ledger_daily", "ledger_rate_periods", "budget_spending"}
+
+
+def expected_balance(rows):
+    """Credits minus debits in INR at the default rates, from the test rows."""
+    return sum(amount * database.DEFAULT_EXCHANGE_RATES[currency] * (1 if t_type == "credit" else -1)
+               for amount, _, currency, t_type, _, _ in rows)
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "ledger.db")
+        database.close_connections()
+        database.DB_FILE = self.path
+
+    def tearDown(self):
+        database.close_connections()
+        self._tmp.cleanup()
+
+    def build(self, schema_sql, rows, columns, version=0):
+        """Writes a database with `schema_sql` (or migrations up to `version`) and `rows` projected on `columns`."""
+        conn = sqlite3.connect(self.path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if schema_sql:
+                conn.execute(schema_sql)
+            for migration in database.MIGRATIONS[:version]:
+                migration(conn.cursor())
+        fields = ("amount", "description", "currency", "transaction_type", "date", "tag")
+        if version >= 11:
+            # Since tags were normalized, the app adds a tag's row before any transaction uses it
+            conn.executemany(database.INSERT_TAG_SQL, [(row[5], database.fold_tag(row[5])) for row in rows])
+        indexes = [fields.index(column) for column in columns]
+        conn.executemany(f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         [tuple(row[i] for i in indexes) for row in rows])
+        conn.execute(f"PRAGMA user_version = {version};")
+        conn.commit()
+        conn.close()
+
+    def init_db(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            database.init_db()
+        return output.getvalue()
+
+    def stored_rows(self):
+        return database.get_connection().execute(
+            "SELECT amount, description, currency, transaction_type, date, tag FROM transactions ORDER BY id"
+        ).fetchall()
+
+    def assert_upgraded(self, expected_rows):
+        conn = database.get_connection()
+        self.assertEqual(database.get_schema_version(conn), database.SCHEMA_VERSION)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions);")}
+        self.assertEqual(columns, COLUMNS)
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue(TABLES <= tables, TABLES - tables)
+        self.assertEqual(self.stored_rows(), expected_rows)
+        self.assertEqual(database.check_aggregates(), [])
+        balance, missing = database.get_balance_in_base()
+        self.assertAlmostEqual(balance, expected_balance(expected_rows), places=6)
+        self.assertEqual(missing, {})
+        # The list, filtered pages and search work on the migrated rows
+        self.assertEqual(len(database.get_transactions_page(limit=100)), len(expected_rows))
+        food = [row for row in expected_rows if row[5] == "Food"]
+        self.assertEqual(len(database.get_transactions_page(tag="FOOD", limit=100)), len(food))
+        self.assertEqual(len(database.search_transactions("snack")), sum(row[1] == "Snack" for row in expected_rows))
+        self.assertEqual(len(database.search_transactions("snack", tag="FOOD")), sum(row[1] == "Snack" for row in food))
+        self.assertEqual(database.search_transactions("snack", tag="Travel"), [])
+
+    def test_fresh_file(self):
+        self.init_db()
+        self.assert_upgraded([])
+        self.assertEqual(database.get_exchange_rates(),
+                         [(currency, database.DEFAULT_RATES_DATE, rate)
+                          for currency, rate in sorted(database.DEFAULT_EXCHANGE_RATES.items())])
+
+    def test_no_date_no_tag(self):
+        self.build(NO_DATE_NO_TAG_SQL, ROWS, ("amount", "description", "currency", "transaction_type"))
+        self.init_db()
+        self.assert_upgraded([row[:4] + (LEGACY_DATE, database.DEFAULT_TAG) for row in ROWS])
+
+    def test_date_only(self):
+        self.build(DATE_ONLY_SQL, ROWS, ("amount", "description", "currency", "transaction_type", "date"))
+        self.init_db()
+        self.assert_upgraded([row[:5] + (database.DEFAULT_TAG,) for row in ROWS])
+
+    def test_tag_only(self):
+        self.build(TAG_ONLY_SQL, ROWS, ("amount", "description", "currency", "transaction_type", "tag"))
+        self.init_db()
+        self.assert_upgraded([row[:4] + (LEGACY_DATE, CANONICAL_TAGS.get(row[5], row[5])) for row in ROWS])
+
+    def test_pre_versioning_schema(self):
+        self.build(PRE_VERSIONING_SQL, ROWS, ("amount", "description", "currency", "transaction_type", "date", "tag"))
+        self.init_db()
+        self.assert_upgraded([row[:5] + (CANONICAL_TAGS.get(row[5], row[5]),) for row in ROWS])
+
+    def test_every_numbered_version(self):
+        for version in range(1, database.SCHEMA_VERSION):
+            with self.subTest(version=version):
+                database.close_connections()
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                # From version 11 on, case variants were merged as they were written
+                rows = ROWS if version < 11 else [row[:5] + (CANONICAL_TAGS.get(row[5], row[5]),) for row in ROWS]
+                self.build(None, rows, ("amount", "description", "currency", "transaction_type", "date", "tag"),
+                           version)
+                self.init_db()
+                self.assert_upgraded([row[:5] + (CANONICAL_TAGS.get(row[5], row[5]),) for row in ROWS])
+
+    def test_up_to_date_is_untouched(self):
+        self.init_db()
+        database.add_transactions_bulk(ROWS)
+        self.assertEqual(self.init_db(), "")
+        self.assertEqual(database.get_schema_version(), database.SCHEMA_VERSION)
+
+    def test_failing_migration_rolls_back(self):
+        self.build(NO_DATE_NO_TAG_SQL, ROWS, ("amount", "description", "currency", "transaction_type"))
+
+        def failing_migration(cursor):
+            raise sqlite3.OperationalError("simulated failure")
+
+        migrations = database.MIGRATIONS + (failing_migration,)
+        with mock.patch.object(database, "MIGRATIONS", migrations), \
+                mock.patch.object(database, "SCHEMA_VERSION", len(migrations)):
+            output = self.init_db()
+        self.assertIn("simulated failure", output)
+        database.close_connections()
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("PRAGMA user_version;").fetchone()[0], 0)
+        self.assertEqual([row[1] for row in conn.execute("PRAGMA table_info(transactions);")],
+                         ["id", "amount", "description", "currency", "transaction_type"])
+        self.assertEqual({name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")},
+                         {"transactions", "sqlite_sequence"})
+        self.assertEqual(conn.execute("SELECT amount, description, currency, transaction_type FROM transactions "
+                                      "ORDER BY id").fetchall(), [row[:4] for row in ROWS])
+        conn.close()
+
+        # The real migrations still run afterwards
+        self.init_db()
+        self.assert_upgraded([row[:4] + (LEGACY_DATE, database.DEFAULT_TAG) for row in ROWS])
+
+
+if __name__ == "__main__":
+    unittest.main()
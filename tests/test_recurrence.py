@@ -0,0 +1,156 @@
+"""
+Recurring rules: cron expressions and interval schedules give the right
+occurrences (monthly ones clamped to short months), and catching up after an
+absence stores every missed occurrence in date order, skips ahead past
+MAX_CATCH_UP, and sets aside a rule whose schedule can't be parsed.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import database
+from utils import recurrence
+from utils.recurrence import CronSchedule, RecurringScheduler, create_rule, parse_schedule
+
+
+def at(text):
+    return datetime.strptime(text, recurrence.DATE_FORMAT)
+
+
+def occurrences(schedule, start, count):
+    found = [schedule.first(at(start))]
+    while len(found) < count:
+        found.append(schedule.next_after(found[-1]))
+    return [due.strftime(recurrence.DATE_FORMAT) for due in found]
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def test_cron_fields(self):
+        cron = CronSchedule("0,30 9-17/4 * * *")
+        self.assertEqual(cron.minutes, {0, 30})
+        self.assertEqual(cron.hours, {9, 13, 17})
+        self.assertEqual(CronSchedule("5/20 * * * *").minutes, {5, 25, 45})
+        self.assertEqual(CronSchedule("0 0 * * 7").weekdays, {0})  # Sunday is 0 or 7
+        for expression in ("* * * *", "60 * * * *", "* * 0 * *", "5-1 * * * *", "*/0 * * * *", "a * * * *"):
+            with self.subTest(expression=expression), self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+    def test_cron_occurrences(self):
+        # Weekdays at 9:00, from a Friday afternoon
+        self.assertEqual(occurrences(CronSchedule("0 9 * * 1-5"), "2024-03-01 10:00:00", 3),
+                         ["2024-03-04 09:00:00", "2024-03-05 09:00:00", "2024-03-06 09:00:00"])
+        # Both day fields restricted: the 1st of the month or any Sunday
+        self.assertEqual(occurrences(CronSchedule("30 8 1 * 0"), "2024-03-01 00:00:00", 3),
+                         ["2024-03-01 08:30:00", "2024-03-03 08:30:00", "2024-03-10 08:30:00"])
+        # first() includes the start when it matches
+        self.assertEqual(occurrences(CronSchedule("*/15 * * * *"), "2024-03-01 10:15:00", 2),
+                         ["2024-03-01 10:15:00", "2024-03-01 10:30:00"])
+        self.assertIsNone(CronSchedule("0 0 30 2 *").first(at("2024-01-01 00:00:00")))
+
+    def test_monthly_clamps_to_month_end(self):
+        start = "2024-01-31 12:00:00"
+        self.assertEqual(occurrences(parse_schedule("monthly", at(start)), start, 4),
+                         ["2024-01-31 12:00:00", "2024-02-29 12:00:00", "2024-03-31 12:00:00", "2024-04-30 12:00:00"])
+        start = "2024-02-29 00:00:00"
+        self.assertEqual(occurrences(parse_schedule("yearly", at(start)), start, 3),
+                         ["2024-02-29 00:00:00", "2025-02-28 00:00:00", "2026-02-28 00:00:00"])
+        start = "2023-11-30 00:00:00"
+        self.assertEqual(occurrences(parse_schedule("Every 3 months", at(start)), start, 3),
+                         ["2023-11-30 00:00:00", "2024-02-29 00:00:00", "2024-05-30 00:00:00"])
+
+    def test_intervals(self):
+        start = "2024-03-01 08:00:00"
+        self.assertEqual(occurrences(parse_schedule("every 2 weeks", at(start)), start, 2),
+                         ["2024-03-01 08:00:00", "2024-03-15 08:00:00"])
+        with self.assertRaises(ValueError):
+            parse_schedule("every 0 days", at(start))
+
+
+class CatchUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        database.close_connections()
+        database.DB_FILE = os.path.join(self._tmp.name, "ledger.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        # Occurrences are logged after they are written; keep them out of the app's log
+        patcher = mock.patch.object(recurrence, "transaction_log")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = RecurringScheduler()
+
+    def tearDown(self):
+        database.close_connections()
+        self._tmp.cleanup()
+
+    def add_rule(self, description, schedule, start, end_date=None):
+        return create_rule(1.0, description, "INR", "debit", "Bills", schedule, start, end_date).result().id
+
+    def run_due(self, now):
+        self.scheduler.load()
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            added = self.scheduler.run_due(at(now)).result()
+        return added, output.getvalue()
+
+    def stored(self):
+        return database.get_connection().execute(
+            "SELECT description, date FROM transactions ORDER BY id").fetchall()
+
+    def test_occurrences_in_date_order(self):
+        self.add_rule("Coffee", "daily", "2024-03-01 09:00:00")
+        self.add_rule("Lunch", "0 12 * * *", "2024-03-01 00:00:00")
+        self.add_rule("Rent", "monthly", "2024-03-02 00:00:00", end_date="2024-03-31 00:00:00")
+        added, _ = self.run_due("2024-03-03 10:00:00")
+        self.assertEqual(len(added), 6)
+        self.assertEqual(self.stored(), [
+            ("Coffee", "2024-03-01 09:00:00"),
+            ("Lunch", "2024-03-01 12:00:00"),
+            ("Rent", "2024-03-02 00:00:00"),
+            ("Coffee", "2024-03-02 09:00:00"),
+            ("Lunch", "2024-03-02 12:00:00"),
+            ("Coffee", "2024-03-03 09:00:00"),
+        ])
+        # Rent is past its end date and done; the others come due next
+        self.assertEqual(sorted((rule[2], rule[8]) for rule in database.get_recurring_rules()),
+                         [("Coffee", "2024-03-04 09:00:00"), ("Lunch", "2024-03-03 12:00:00")])
+        self.assertEqual(self.scheduler.next_due(), "2024-03-03 12:00:00")
+
+    def test_max_catch_up_skips_ahead(self):
+        self.add_rule("Tick", "every 1 days", "2024-01-01 00:00:00")
+        with mock.patch.object(recurrence, "MAX_CATCH_UP", 3):
+            added, output = self.run_due("2024-02-01 12:00:00")
+        self.assertEqual(len(added), 3)
+        self.assertEqual([date for _, date in self.stored()],
+                         ["2024-01-01 00:00:00", "2024-01-02 00:00:00", "2024-01-03 00:00:00"])
+        self.assertIn("more than 3 occurrences behind", output)
+        self.assertEqual(database.get_recurring_rules()[0][8], "2024-02-02 00:00:00")
+
+    def test_unparsable_rule_is_set_aside(self):
+        # Stored by an older version or edited by hand; create_rule would refuse it
+        broken_id = database.add_recurring_rule(1.0, "Broken", "INR", "debit", "Bills", "every other day",
+                                                "2024-03-01 00:00:00", "2024-03-01 00:00:00")
+        self.add_rule("Coffee", "daily", "2024-03-01 09:00:00")
+        added, output = self.run_due("2024-03-01 10:00:00")
+        self.assertEqual(self.stored(), [("Coffee", "2024-03-01 09:00:00")])
+        self.assertIn(f"recurring rule {broken_id} can't be scheduled", output)
+        self.assertEqual(list(self.scheduler.broken), [broken_id])
+        # Left as stored, so a corrected rule catches up from there
+        self.assertEqual(database.get_recurring_rules()[0][8], "2024-03-01 00:00:00")
+        database.get_connection().execute("UPDATE recurring_rules SET schedule = 'daily' WHERE id = ?", (broken_id,))
+        database.get_connection().commit()
+        added, _ = self.run_due("2024-03-01 10:00:00")
+        self.assertEqual(len(added), 1)
+        self.assertEqual(self.scheduler.broken, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,68 +1,79 @@
-from kivy_garden.graph import Graph, MeshLinePlot, BarPlot
-from kivy.metrics import dp
-from kivy.graphics.texture import Texture
-from kivy.core.image import Image as CoreImage
-from kivy.clock import Clock
-from database import get_transactions
+from database import get_ledger_version, BASE_CURRENCY
+from utils.cache import VersionedLRUCache
+from utils.ledger_columns import LedgerColumns
+from utils.timeseries import build_time_series
+from utils.rates import get_rate_table
+from utils.instrumentation import timed, span
 import os
-import io
 
 # Ensure assets directory exists for the plot
 PLOT_DIR = "assets"
 PLOT_FILENAME = os.path.join(PLOT_DIR, "analysis_plot.png")
 
-# --- Define Exchange Rates ---
-# Base currency is INR. All amounts will be converted to INR for analysis.
-EXCHANGE_RATES_TO_INR = {
-    "INR": 1.0,
-    "USD": 83.0,  # 1 USD = 83 INR (approx)
-    "EUR": 90.0,  # 1 EUR = 90 INR (approx)
-    "GBP": 105.0,  # 1 GBP = 105 INR (approx)
-    "JPY": 0.55,  # 1 JPY = 0.55 INR (approx)
-}
-BASE_CURRENCY_ANALYSIS = "INR"
-
-def convert_to_base_currency(amount, currency):
-    """Converts an amount from a given currency to the base currency (INR)."""
-    rate = EXCHANGE_RATES_TO_INR.get(currency.upper(), None)
-    if rate is None:
-        print(f"Warning: Exchange rate for {currency} not found. Using 1.0 (no conversion).")
-        return amount
-    return amount * rate
-
-def generate_analysis_plot():
+# --- Exchange Rates ---
+# Base currency is INR. All amounts will be converted to INR for analysis, at the
+# rate effective on each transaction's date (see the exchange_rates table and
+# utils/rates.py).
+BASE_CURRENCY_ANALYSIS = BASE_CURRENCY
+
+# Results of generate_analysis_plot per filter combination, valid until the next
+# write to the ledger.
+ANALYSIS_CACHE_SIZE = 8
+analysis_cache = VersionedLRUCache(get_ledger_version, max_entries=ANALYSIS_CACHE_SIZE)
+
+class AnalysisCancelled(Exception):
+    """Raised inside generate_analysis_plot when its cancel_event is set."""
+
+
+@timed("analysis.generate_analysis_plot")
+def generate_analysis_plot(progress_callback=None, cancel_event=None, tag=None, start_date=None, end_date=None):
     """
     Generates income vs expense bar graph and calculates financial statistics,
     converting all amounts to a base currency (INR).
+
+    Safe to call from a worker thread. `progress_callback(fraction, stats)` is
+    called after each stage (stats is None until the summary is ready), and
+    AnalysisCancelled is raised between stages once `cancel_event` is set.
+    Results are memoized in `analysis_cache` per (tag, start_date, end_date)
+    until the ledger changes; dates are 'YYYY-MM-DD', end exclusive.
     """
-    transactions = get_transactions()
-    if not transactions:
+    def checkpoint(fraction, partial_stats=None):
+        if cancel_event is not None and cancel_event.is_set():
+            raise AnalysisCancelled()
+        if progress_callback:
+            progress_callback(fraction, partial_stats)
+
+    result = analysis_cache.get_or_compute(
+        (tag, start_date, end_date),
+        lambda: _compute_analysis(checkpoint, tag, start_date, end_date),
+    )
+    checkpoint(1.0, result[1])
+    return result
+
+
+@timed("analysis.compute")
+def _compute_analysis(checkpoint, tag, start_date, end_date):
+    """Uncached body of generate_analysis_plot."""
+    checkpoint(0.0)
+    # Columnar snapshot of the per-day aggregates; every figure below is a
+    # vectorized reduction over it rather than a loop over transactions.
+    with span("analysis.load_columns"):
+        columns = LedgerColumns.from_daily_totals(tag=tag, start_date=start_date, end_date=end_date)
+    if not len(columns):
         print("No transactions found for analysis.")
         return None, None, None
+    checkpoint(0.4)
 
-    # Process transaction data
-    credits_in_base = 0
-    debits_in_base = 0
-    credit_transactions = []
-    debit_transactions = []
-
-    for transaction in transactions:
-        # Unpack transaction tuple
-        _, amount, _, currency, t_type, date, tag = transaction
-        amount_in_base = convert_to_base_currency(float(amount), currency)
-        
-        if t_type == 'credit':
-            credits_in_base += amount_in_base
-            credit_transactions.append(transaction)
-        elif t_type == 'debit':
-            debits_in_base += amount_in_base
-            debit_transactions.append(transaction)
+    rates = get_rate_table()
+    summary = columns.summary(rates)
+    credits_in_base = summary["credits"]
+    debits_in_base = summary["debits"]
+    num_credits = summary["num_credits"]
+    num_debits = summary["num_debits"]
 
     # Basic Stats
-    total_transactions = len(transactions)
-    num_credits = len(credit_transactions)
-    num_debits = len(debit_transactions)
-    
+    total_transactions = num_credits + num_debits
+
     avg_credit_in_base = credits_in_base / num_credits if num_credits > 0 else 0
     avg_debit_in_base = debits_in_base / num_debits if num_debits > 0 else 0
     balance_in_base = credits_in_base - debits_in_base
@@ -75,6 +86,7 @@ def generate_analysis_plot():
         "Average Income Transaction": f"{avg_credit_in_base:.2f}",
         "Average Expense Transaction": f"{avg_debit_in_base:.2f}",
     }
+    checkpoint(0.6, stats)
 
     # Create and save visualization
     try:
@@ -85,11 +97,24 @@ def generate_analysis_plot():
         chart_data = {
             'categories': ['Income', 'Expenses'],
             'values': [credits_in_base, debits_in_base],
-            'colors': [(0.3, 0.8, 0.3, 1), (0.8, 0.3, 0.3, 1)]  # Green for income, Red for expenses
+            'colors': [(0.3, 0.8, 0.3, 1), (0.8, 0.3, 0.3, 1)],  # Green for income, Red for expenses
         }
-        
+        # Breakdowns as {'labels': [...], 'income': [...], 'expense': [...]} in base currency
+        breakdowns = (('by_tag', columns.by_tag), ('by_currency', columns.by_currency), ('by_month', columns.by_month))
+        for i, (key, breakdown) in enumerate(breakdowns, start=1):
+            labels, income, expense = breakdown(rates)
+            chart_data[key] = {'labels': labels, 'income': income.tolist(), 'expense': expense.tolist()}
+            checkpoint(0.6 + 0.3 * i / len(breakdowns), stats)
+
+        # Daily/weekly/monthly series, rolling averages and cumulative balance
+        with span("analysis.time_series"):
+            chart_data['time_series'] = build_time_series(columns, rates)
+        rates.report_missing()
+
         return PLOT_FILENAME, stats, chart_data
-        
+
+    except AnalysisCancelled:
+        raise
     except Exception as e:
         print(f"Error generating analysis data: {e}")
         return None, None, None
\ No newline at end of file
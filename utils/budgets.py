@@ -0,0 +1,66 @@
+from collections import namedtuple
+from datetime import datetime
+
+from database import get_budget_status
+
+# Alert levels, in increasing order of severity.
+BUDGET_OK = 0
+BUDGET_WARNING = 1   # At or above the budget's alert threshold
+BUDGET_EXCEEDED = 2  # At or above the limit
+
+
+class BudgetStatus(namedtuple("BudgetStatus", "tag month limit threshold spent")):
+    """One budget's spending in one month, in the base currency."""
+
+    @property
+    def fraction(self):
+        return self.spent / self.limit
+
+    @property
+    def level(self):
+        if self.spent >= self.limit:
+            return BUDGET_EXCEEDED
+        if self.spent >= self.limit * self.threshold:
+            return BUDGET_WARNING
+        return BUDGET_OK
+
+
+def budget_statuses(month=None, tags=None):
+    """BudgetStatus for every budget (or those for `tags`) in `month` ('YYYY-MM', default this month)."""
+    month = month or datetime.now().strftime("%Y-%m")
+    return [BudgetStatus(tag, month, limit, threshold, spent)
+            for tag, limit, threshold, spent in get_budget_status(month, tags)]
+
+
+class BudgetMonitor:
+    """
+    Tracks the alert level of each (tag, month) budget so an alert fires once,
+    when spending crosses the threshold or the limit, rather than on every
+    transaction after that.
+
+    check() only looks up the budgets the given transactions touched; their
+    spending comes from the trigger-maintained budget_spending totals.
+    """
+
+    def __init__(self):
+        self._levels = {}  # (tag, month) -> last seen level
+
+    def prime(self, month=None):
+        """Records the current levels without alerting (e.g. at startup, or after deletes)."""
+        for status in budget_statuses(month):
+            self._levels[(status.tag, status.month)] = status.level
+
+    def check(self, transactions):
+        """Returns a BudgetStatus for each budget whose level went up since last seen, given changed transactions."""
+        touched = {}
+        for t in transactions:
+            if t.transaction_type == "debit":
+                touched.setdefault(t.date[:7], set()).add(t.tag)
+        alerts = []
+        for month, tags in touched.items():
+            for status in budget_statuses(month, tags):
+                key = (status.tag, month)
+                if status.level > self._levels.get(key, BUDGET_OK):
+                    alerts.append(status)
+                self._levels[key] = status.level
+        return alerts
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """
+    Bounded LRU cache whose entries are only valid for one data version.
+
+    `version_func()` is called on every lookup. When its value differs from the
+    version the entries were computed for, every entry is dropped, so a write to
+    the ledger invalidates exactly once and nothing stale is ever served.
+    Different keys (e.g. filter combinations) share the `max_entries` budget and
+    the least recently used one is evicted first.
+    """
+
+    def __init__(self, version_func, max_entries=8):
+        self.version_func = version_func
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for `key`, calling `compute()` to fill it on a miss."""
+        version = self.version_func()
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                    self._entries.clear()
+                self._version = version
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        # Computed outside the lock; if the version moved meanwhile the value is
+        # still returned but not stored.
+        value = compute()
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import os
+import time
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Optional: without it the password is still hashed, but the ledger stays unencrypted
+    AESGCM = None
+
+# --- Master password ---
+# scrypt, tuned on the device when the password is set (calibrate_scrypt): n
+# doubles while one derivation fits in UNLOCK_BUDGET seconds and its memory
+# (128 * n * r bytes) in SCRYPT_MAX_MEMORY, then spare time goes to parallel
+# passes (p), which cost time but no memory. The parameters are stored with
+# the salt, so unlocking takes about UNLOCK_BUDGET on the device that set them.
+UNLOCK_BUDGET = 0.5
+SCRYPT_MIN_N = 2 ** 14        # Floor even on devices too slow to meet the budget
+SCRYPT_R = 8
+SCRYPT_MAX_P = 16
+SCRYPT_MAX_MEMORY = 64 * 1024 * 1024
+SALT_BYTES = 16
+
+# --- Ledger encryption ---
+# Sealed values are FORMAT_AESGCM, a random 96-bit nonce, then the AES-256-GCM
+# ciphertext and tag. The leading byte leaves room for other formats later.
+CIPHER_AVAILABLE = AESGCM is not None
+CIPHER_NAME = "aes-256-gcm"
+FORMAT_AESGCM = b"\x01"
+NONCE_BYTES = 12
+_CIPHERTEXT_START = len(FORMAT_AESGCM) + NONCE_BYTES
+# Search tokens are HMAC-SHA256 under a key of their own, derived from the
+# ledger key, truncated to this many bytes: collisions only add candidates
+# that the search then rejects after opening them.
+SEARCH_TOKEN_BYTES = 4
+_SEARCH_TOKEN_LABEL = b"moneytracker search tokens"
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL needs 128 * r * (n + p + 2) bytes; give it that plus slack
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=64)
+
+
+def calibrate_scrypt(budget=UNLOCK_BUDGET):
+    """Returns scrypt parameters {"n", "r", "p"} whose derivation takes about `budget` seconds here."""
+    n, r = SCRYPT_MIN_N, SCRYPT_R
+    start = time.perf_counter()
+    _scrypt("calibration", b"\0" * SALT_BYTES, n, r, 1)
+    elapsed = time.perf_counter() - start
+    # scrypt's time is linear in n and in p, so one measurement is enough
+    while elapsed * 2 <= budget and 128 * (n * 2) * r <= SCRYPT_MAX_MEMORY:
+        n *= 2
+        elapsed *= 2
+    p = max(1, min(SCRYPT_MAX_P, int(budget // elapsed)))
+    return {"n": n, "r": r, "p": p}
+
+
+def _derive(password, salt, params):
+    """(verifier, ledger_key): the stored verifier is a hash of one half of the output, the key is the other half."""
+    okm = _scrypt(password, salt, params["n"], params["r"], params["p"])
+    return hashlib.sha256(okm[:32]).digest(), okm[32:]
+
+
+def create_password_record(password, params=None):
+    """
+    Hashes `password` for user_data.json. Returns (record, ledger_key): the
+    record holds the salt, the scrypt parameters and a verifier, never the
+    password, and ledger_key is the 32-byte key for LedgerCipher.
+    """
+    params = params or calibrate_scrypt()
+    salt = os.urandom(SALT_BYTES)
+    verifier, ledger_key = _derive(password, salt, params)
+    record = {"kdf": "scrypt", "salt": salt.hex(), "n": params["n"], "r": params["r"], "p": params["p"],
+              "verifier": verifier.hex()}
+    return record, ledger_key
+
+
+def unlock(record, password):
+    """Checks `password` against a record from create_password_record. Returns the ledger key, or None if wrong."""
+    verifier, ledger_key = _derive(password, bytes.fromhex(record["salt"]), record)
+    if hmac.compare_digest(verifier, bytes.fromhex(record["verifier"])):
+        return ledger_key
+    return None
+
+
+def check_legacy_password(stored, password):
+    """Compares `password` with a plaintext master_password saved before hashing, in constant time."""
+    return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+
+
+class LedgerCipher:
+    """
+    Seals and opens ledger text with AES-256-GCM under the key from unlock().
+    Each value gets a fresh random nonce, so equal descriptions don't look
+    equal on disk. Needs the optional `cryptography` package (CIPHER_AVAILABLE).
+    """
+
+    def __init__(self, key):
+        if AESGCM is None:
+            raise RuntimeError("The 'cryptography' package is needed to encrypt the ledger.")
+        self._aead = AESGCM(key)
+        self._token_key = hmac.digest(key, _SEARCH_TOKEN_LABEL, "sha256")
+
+    def seal(self, text):
+        nonce = os.urandom(NONCE_BYTES)
+        return FORMAT_AESGCM + nonce + self._aead.encrypt(nonce, text.encode("utf-8"), None)
+
+    def search_token(self, text):
+        """
+        Keyed hash of `text` as a hex string, for finding sealed rows by word:
+        equal texts give equal tokens, but without the key a token can't be
+        computed or turned back into its text.
+        """
+        return hmac.digest(self._token_key, text.encode("utf-8"), "sha256")[:SEARCH_TOKEN_BYTES].hex()
+
+    def open(self, sealed):
+        """Returns the text of a sealed value; raises ValueError for a wrong key or a damaged value."""
+        if sealed[:1] != FORMAT_AESGCM:
+            raise ValueError("unknown sealed value format")
+        try:
+            return self._aead.decrypt(sealed[1:_CIPHERTEXT_START], sealed[_CIPHERTEXT_START:], None).decode("utf-8")
+        except InvalidTag:
+            raise ValueError("wrong key or damaged value") from None
@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+# Amounts are summed as integers in each currency's minor unit (paise, cents),
+# 10 ** exponent of them to one unit. ISO 4217 exponents that differ from the
+# usual 2; every other code uses DEFAULT_EXPONENT. database.py encodes stored
+# amounts with these, so changing an entry needs a migration re-encoding that
+# currency's rows.
+CURRENCY_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "ISK": 0, "JPY": 0, "KRW": 0, "PYG": 0, "UGX": 0, "VND": 0, "XAF": 0, "XOF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+DEFAULT_EXPONENT = 2
+
+
+def currency_exponent(currency):
+    """Number of decimal places of `currency` (case-insensitive)."""
+    return CURRENCY_EXPONENTS.get(currency.upper(), DEFAULT_EXPONENT)
+
+
+def minor_unit_scale(currency):
+    """Minor units per unit of `currency`: 100 for INR, 1 for JPY."""
+    return 10 ** currency_exponent(currency)
+
+
+def from_minor_units(amount_minor, currency):
+    """Converts an integer minor-unit amount to a float in units, for display."""
+    return amount_minor / minor_unit_scale(currency)
+
+
+def to_minor_units(amount, currency):
+    """
+    `amount` (a float in units) as an integer number of minor units, rounded
+    half away from zero exactly as database.AMOUNT_MINOR_SQL rounds it.
+    """
+    scaled = amount * minor_unit_scale(currency)
+    return int(scaled - 0.5 if scaled < 0 else scaled + 0.5)
+
+
+def format_amount(amount, currency):
+    """
+    `amount` (in units) with the currency's number of decimal places: '12.50',
+    '1250', '1.250'. It is rounded through to_minor_units, so a row shows the
+    amount the totals add up.
+    """
+    return f"{Decimal(to_minor_units(amount, currency)).scaleb(-currency_exponent(currency)):f}"
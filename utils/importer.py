@@ -0,0 +1,319 @@
+import csv
+import hashlib
+import os
+import re
+import time
+from datetime import datetime
+from itertools import islice
+
+from database import insert_transaction_rows, get_connection, optimize_search_index, BULK_CHUNK_SIZE
+from utils.journal import Change, log_change
+from utils.ledger_writer import run_now
+from utils.transaction_log import transaction_log
+
+# Dates are stored in the same format AddTransactionPopup uses.
+DB_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Tried in order when no --date-format is given. The first one that matches is
+# remembered and tried first for the following rows.
+CSV_DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%d/%m/%y",
+    "%m/%d/%Y",
+    "%d %b %Y",
+]
+
+# Header names accepted for each field (compared case-insensitively).
+CSV_COLUMN_ALIASES = {
+    "date": ("date", "transaction date", "posted", "value date", "txn date"),
+    "amount": ("amount", "amt", "value"),
+    "description": ("description", "desc", "narration", "memo", "note", "details", "name"),
+    "currency": ("currency", "ccy"),
+    "type": ("type", "transaction_type", "transaction type", "dr/cr"),
+    "tag": ("tag", "category", "label"),
+    "debit": ("debit", "withdrawal", "withdrawal amt.", "debit amount"),
+    "credit": ("credit", "deposit", "deposit amt.", "credit amount"),
+}
+
+# Bytes read per block when tokenizing OFX, which is often a single long line.
+OFX_BLOCK_SIZE = 64 * 1024
+OFX_TAG_RE = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+# Bytes hashed to recognize a file again when resuming an import.
+FINGERPRINT_BYTES = 64 * 1024
+
+
+class ImportStats:
+    """Counters shared by the parsing pipeline and the import report."""
+
+    def __init__(self):
+        self.parsed = 0
+        self.skipped = 0
+
+
+def _parse_amount(text):
+    """Parses '1,234.50', '(12.00)' or '-12' into a float."""
+    text = text.strip().replace(",", "")
+    if text.startswith("(") and text.endswith(")"):
+        text = "-" + text[1:-1]
+    return float(text)
+
+
+class _DateParser:
+    """Parses dates with a fixed format, or auto-detects one from CSV_DATE_FORMATS."""
+
+    def __init__(self, date_format=None):
+        self.formats = [date_format] if date_format else list(CSV_DATE_FORMATS)
+
+    def __call__(self, text):
+        text = text.strip()
+        for i, fmt in enumerate(self.formats):
+            try:
+                parsed = datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            if i:
+                # Move the matching format to the front for the next rows
+                self.formats.insert(0, self.formats.pop(i))
+            return parsed.strftime(DB_DATE_FORMAT)
+        raise ValueError(f"Unrecognized date: {text!r}")
+
+
+def _map_csv_columns(header):
+    """Maps field names from CSV_COLUMN_ALIASES to column indexes in `header`."""
+    normalized = [h.strip().lower() for h in header]
+    columns = {}
+    for field, aliases in CSV_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+    if "date" not in columns or not ("amount" in columns or "debit" in columns or "credit" in columns):
+        raise ValueError(f"CSV header needs a date column and an amount (or debit/credit) column: {header}")
+    return columns
+
+
+def iter_csv_rows(path, default_currency="INR", date_format=None, stats=None):
+    """
+    Yields transaction tuples from a CSV file with a header row, one line at a time.
+
+    A row's type comes from separate debit/credit columns (an empty or zero one
+    is ignored) if present, otherwise from its type column, otherwise from the
+    sign of the amount.
+    """
+    stats = stats or ImportStats()
+    parse_date = _DateParser(date_format)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = _map_csv_columns(header)
+
+        def field(row, name, default=""):
+            index = columns.get(name)
+            if index is None or index >= len(row):
+                return default
+            return row[index].strip()
+
+        for line_number, row in enumerate(reader, start=2):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            try:
+                date = parse_date(field(row, "date"))
+                t_type = field(row, "type").lower()
+                # Bank exports often fill the unused one of the two columns with 0.00
+                debit = _parse_amount(field(row, "debit") or "0")
+                credit = _parse_amount(field(row, "credit") or "0")
+                if debit:
+                    amount, t_type = debit, "debit"
+                elif credit:
+                    amount, t_type = credit, "credit"
+                else:
+                    amount = _parse_amount(field(row, "amount", "0"))
+                if t_type in ("dr", "withdrawal"):
+                    t_type = "debit"
+                elif t_type in ("cr", "deposit"):
+                    t_type = "credit"
+                elif t_type not in ("credit", "debit"):
+                    t_type = "debit" if amount < 0 else "credit"
+                amount = abs(amount)
+                if amount == 0:
+                    raise ValueError("zero amount")
+            except ValueError as e:
+                stats.skipped += 1
+                print(f"Skipping {os.path.basename(path)} line {line_number}: {e}")
+                continue
+            stats.parsed += 1
+            yield (
+                amount,
+                field(row, "description") or "Imported transaction",
+                (field(row, "currency") or default_currency).upper(),
+                t_type,
+                date,
+                field(row, "tag") or "Uncategorized",
+            )
+
+
+def _iter_ofx_tokens(path):
+    """Yields (is_closing, tag, value) tokens from an OFX file, reading it in fixed-size blocks."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        pending = ""
+        while True:
+            block = f.read(OFX_BLOCK_SIZE)
+            if not block:
+                break
+            pending += block
+            # Keep everything from the last '<' for the next round; it may be a cut-off tag.
+            cut = pending.rfind("<")
+            complete, pending = (pending[:cut], pending[cut:]) if cut > 0 else ("", pending)
+            for match in OFX_TAG_RE.finditer(complete):
+                yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+        for match in OFX_TAG_RE.finditer(pending):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+
+
+def _parse_ofx_date(text):
+    """Parses OFX dates such as 20240115, 20240115120000 or 20240115120000.000[-5:EST]."""
+    digits = re.match(r"\d+", text)
+    if not digits or len(digits.group()) < 8:
+        raise ValueError(f"Unrecognized OFX date: {text!r}")
+    digits = digits.group()[:14].ljust(14, "0")
+    return datetime.strptime(digits, "%Y%m%d%H%M%S").strftime(DB_DATE_FORMAT)
+
+
+def iter_ofx_rows(path, default_currency="INR", stats=None):
+    """Yields transaction tuples from the <STMTTRN> records of an OFX (SGML or XML) file."""
+    stats = stats or ImportStats()
+    currency = default_currency
+    record = None
+    for is_closing, tag, value in _iter_ofx_tokens(path):
+        if tag == "CURDEF" and not is_closing and value:
+            currency = value.upper()
+        elif tag == "STMTTRN":
+            if not is_closing:
+                record = {}
+                continue
+            if record is None:
+                continue
+            try:
+                amount = _parse_amount(record.get("TRNAMT", ""))
+                if amount == 0:
+                    raise ValueError("zero amount")
+                row = (
+                    abs(amount),
+                    record.get("NAME") or record.get("MEMO") or "Imported transaction",
+                    currency,
+                    "debit" if amount < 0 else "credit",
+                    _parse_ofx_date(record.get("DTPOSTED", "")),
+                    "Uncategorized",
+                )
+            except ValueError as e:
+                stats.skipped += 1
+                print(f"Skipping OFX transaction {record.get('FITID', '?')}: {e}")
+            else:
+                stats.parsed += 1
+                yield row
+            record = None
+        elif record is not None and not is_closing and value:
+            record[tag] = value
+
+
+def file_fingerprint(path):
+    """Identifies a file by its size and leading bytes, so a renamed copy still resumes."""
+    digest = hashlib.sha1()
+    digest.update(str(os.path.getsize(path)).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def _load_progress(source):
+    row = get_connection().execute(
+        "SELECT rows_done, completed FROM import_progress WHERE source = ?", (source,)
+    ).fetchone()
+    return row if row else (0, 0)
+
+
+def _save_progress(conn, source, path, rows_done, completed=False):
+    conn.execute(
+        """
+        INSERT INTO import_progress (source, path, rows_done, completed, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(source) DO UPDATE SET
+            path = excluded.path,
+            rows_done = excluded.rows_done,
+            completed = excluded.completed,
+            updated_at = excluded.updated_at
+        """,
+        (source, path, rows_done, int(completed), datetime.now().strftime(DB_DATE_FORMAT)),
+    )
+
+
+def import_file(path, file_format=None, default_currency="INR", date_format=None,
+                chunk_size=BULK_CHUNK_SIZE, restart=False):
+    """
+    Streams transactions from a CSV or OFX file into the database.
+
+    Rows are committed in chunks together with the number of rows done so far,
+    so an interrupted import picks up after the last committed chunk when run
+    again on the same file. Each chunk is a write step whose rows go to the
+    transaction log like the journal's, so the log replays imports too. Returns
+    the number of rows inserted by this run.
+    """
+    file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+    if file_format not in ("csv", "ofx", "qfx"):
+        raise ValueError(f"Unsupported import format: {file_format!r} (expected csv or ofx)")
+
+    source = file_fingerprint(path)
+    already_done, completed = (0, 0) if restart else _load_progress(source)
+    if completed:
+        print(f"{path} was already imported ({already_done} rows). Use --restart to import it again.")
+        return 0
+    if already_done:
+        print(f"Resuming import of {path} after {already_done} rows.")
+
+    stats = ImportStats()
+    if file_format == "csv":
+        rows = iter_csv_rows(path, default_currency, date_format, stats)
+    else:
+        rows = iter_ofx_rows(path, default_currency, stats)
+    # Rows committed by an earlier run come first in the same order, so skip them.
+    rows = islice(rows, already_done, None)
+    start = time.perf_counter()
+    inserted = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        def step(cursor, chunk=chunk, rows_done=already_done + inserted + len(chunk)):
+            added = insert_transaction_rows(cursor, chunk)
+            _save_progress(cursor, source, os.path.abspath(path), rows_done)
+            return Change((), added, (), ())
+        future = run_now(step)
+        future.add_done_callback(log_change)
+        if future.exception() is not None:
+            print(f"!!! Database Error importing rows after {already_done + inserted}: {future.exception()}")
+            print(f"Import of {path} stopped after {already_done + inserted} rows. Run it again to resume.")
+            return inserted
+        inserted += len(chunk)
+        # Let the log catch up: a chunk fits in its queue, several might not
+        transaction_log.flush()
+        elapsed = time.perf_counter() - start
+        rate = inserted / elapsed if elapsed > 0 else 0
+        print(f"Imported {already_done + inserted} rows ({rate:,.0f} rows/s)")
+    elapsed = time.perf_counter() - start
+    with get_connection() as conn:
+        _save_progress(conn, source, os.path.abspath(path), already_done + inserted, completed=True)
+    # Row-at-a-time trigger inserts leave the search index in many small segments
+    optimize_search_index()
+
+    rate = inserted / elapsed if elapsed > 0 else 0
+    print(f"Import finished: {inserted} rows in {elapsed:.2f}s ({rate:,.0f} rows/s), "
+          f"{stats.skipped} invalid rows skipped.")
+    return inserted
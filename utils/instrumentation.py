@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# Hot-path instrumentation: timing spans and counters around DB calls, analysis,
+# list data builds and chart redraws, plus optional cProfile/tracemalloc capture.
+#
+#   MONEYTRACKER_INSTRUMENT=1        record spans and counters; report on exit
+#   MONEYTRACKER_INSTRUMENT_REPORT=f also write the report to file f as JSON
+#   MONEYTRACKER_PROFILE=cprofile    profile the UI thread into moneytracker.prof
+#   MONEYTRACKER_PROFILE=tracemalloc write the top allocation sites on exit
+#   MONEYTRACKER_TRACE=1             print per-call trace messages (see trace())
+#
+# Everything is off by default. @timed functions are then left undecorated and
+# span() returns a shared no-op context manager, so the cost is one attribute
+# lookup and call. The settings are read when this module is first imported;
+# enable() must run before the instrumented modules are imported to time them.
+INSTRUMENT_ENV = "MONEYTRACKER_INSTRUMENT"
+REPORT_ENV = "MONEYTRACKER_INSTRUMENT_REPORT"
+PROFILE_ENV = "MONEYTRACKER_PROFILE"
+TRACE_ENV = "MONEYTRACKER_TRACE"
+PROFILE_FILE = "moneytracker.prof"
+TRACEMALLOC_FILE = "moneytracker_tracemalloc.txt"
+# Latest samples kept per span name for the percentiles.
+SAMPLE_WINDOW = 2048
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").strip().lower() not in ("", "0", "false", "no")
+
+
+enabled = _env_flag(INSTRUMENT_ENV)
+tracing = _env_flag(TRACE_ENV)
+
+_lock = threading.Lock()
+_samples = {}   # span name -> deque of durations in seconds
+_calls = {}     # span name -> total number of calls
+_counters = {}  # counter name -> value
+_profiler = None
+_tracemalloc_started = False
+
+
+def enable(trace=None):
+    """Turns recording on (and tracing, if `trace` is given) for the rest of the process."""
+    global enabled, tracing
+    enabled = True
+    if trace is not None:
+        tracing = trace
+
+
+def record(name, duration):
+    """Adds one `duration` (seconds) sample to span `name`."""
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=SAMPLE_WINDOW)
+            _calls[name] = 0
+        samples.append(duration)
+        _calls[name] += 1
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing the enclosed block as `name` (a no-op unless enabled)."""
+    return _Span(name) if enabled else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator timing every call as `name`; returns the function unchanged when disabled."""
+    def decorate(func):
+        if not enabled:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Adds `n` to counter `name` (a no-op unless enabled)."""
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def trace(message, *args):
+    """Prints a per-call trace message when tracing; `message % args` is only formatted then."""
+    if tracing:
+        print(message % args if args else message)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def stats():
+    """Returns {'spans': {name: {...} in ms}, 'counters': {name: value}} for what was recorded."""
+    with _lock:
+        snapshot = {name: (sorted(samples), _calls[name]) for name, samples in _samples.items()}
+        counters = dict(_counters)
+    spans = {}
+    for name, (ordered, calls) in sorted(snapshot.items()):
+        spans[name] = {
+            "calls": calls,
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+            "total_ms": round(sum(ordered) * 1000, 1),
+        }
+    return {"spans": spans, "counters": dict(sorted(counters.items()))}
+
+
+def report(path=None):
+    """Prints the per-operation latencies and counters; also writes them as JSON to `path` if given."""
+    result = stats()
+    print(f"{'operation':<36}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, span_stats in result["spans"].items():
+        print(f"{name:<36}{span_stats['calls']:>8}{span_stats['p50_ms']:>10.3f}"
+              f"{span_stats['p95_ms']:>10.3f}{span_stats['max_ms']:>10.3f}")
+    for name, value in result["counters"].items():
+        print(f"{name:<36}{value:>8}")
+    if path:
+        try:
+            with open(path, "w") as f:
+                json.dump(dict(result, time=time.strftime("%Y-%m-%d %H:%M:%S")), f, indent=2)
+            print(f"Instrumentation report written to {path}")
+        except OSError as e:
+            print(f"Error writing instrumentation report: {e}")
+    return result
+
+
+def reset():
+    """Drops every recorded sample and counter."""
+    with _lock:
+        _samples.clear()
+        _calls.clear()
+        _counters.clear()
+
+
+# --- Profiling capture ---
+
+def start_capture(kinds=None):
+    """
+    Starts the captures named in `kinds` (default: $MONEYTRACKER_PROFILE, comma
+    separated): 'cprofile' profiles the calling thread, 'tracemalloc' traces
+    Python allocations. Both slow the app down noticeably while running.
+    """
+    global _profiler, _tracemalloc_started
+    if kinds is None:
+        kinds = os.environ.get(PROFILE_ENV, "")
+    kinds = {kind.strip().lower() for kind in kinds.split(",") if kind.strip()}
+    if "cprofile" in kinds and _profiler is None:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if "tracemalloc" in kinds and not _tracemalloc_started:
+        import tracemalloc
+        tracemalloc.start(10)
+        _tracemalloc_started = True
+    unknown = kinds - {"cprofile", "tracemalloc"}
+    if unknown:
+        print(f"Warning: unknown profile capture {', '.join(sorted(unknown))} (use cprofile or tracemalloc).")
+
+
+def stop_capture(top=25):
+    """Stops running captures and writes their results (PROFILE_FILE, TRACEMALLOC_FILE)."""
+    global _profiler, _tracemalloc_started
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_FILE)
+        _profiler = None
+        print(f"cProfile data written to {PROFILE_FILE} (view with: python -m pstats {PROFILE_FILE})")
+    if _tracemalloc_started:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        _tracemalloc_started = False
+        try:
+            with open(TRACEMALLOC_FILE, "w") as f:
+                f.write(f"Traced memory: {current / 1024:.0f} KiB current, {peak / 1024:.0f} KiB peak\n")
+                for statistic in snapshot.statistics("lineno")[:top]:
+                    f.write(f"{statistic}\n")
+            print(f"Allocation sites written to {TRACEMALLOC_FILE}")
+        except OSError as e:
+            print(f"Error writing allocation report: {e}")
+
+
+def finish():
+    """Stops captures and, if recording, prints (and optionally exports) the report. Called on exit."""
+    stop_capture()
+    if enabled:
+        report(os.environ.get(REPORT_ENV))
@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+from database import (insert_transaction_row, delete_transaction_rows, restore_transaction_rows, update_transaction_tags,
+                      seal_description)
+from utils.ledger_writer import run_now
+from utils.transaction_log import transaction_log
+
+# Undo history kept per session (oldest operations are forgotten first).
+JOURNAL_LIMIT = 100
+
+# What an operation changed, for updating the UI in place: ids of removed rows,
+# rows that appeared and rows whose fields changed (models.Transaction), and
+# the removed and changed rows as they were before.
+Change = namedtuple("Change", "removed inserted updated before")
+
+
+def log_change(future):
+    """
+    Writes a committed Change to the transaction log (on whichever thread
+    completed `future`); a done callback for the Future of any step returning one.
+    """
+    if future.cancelled() or future.exception() is not None or future.result() is None:
+        return
+    change = future.result()
+    for transaction_id in change.removed:
+        transaction_log.log_delete(transaction_id)
+    for t in list(change.inserted) + list(change.updated):
+        transaction_log.log_add(t.id, t.amount, seal_description(t.description), t.currency, t.transaction_type,
+                                t.date, t.tag)
+
+
+class AddOperation:
+    """Adds one transaction; undo deletes it, redo restores it with the same id."""
+
+    def __init__(self, amount, description, currency, transaction_type, date, tag):
+        self.fields = (amount, description, currency, transaction_type, date, tag)
+        self.transaction = None
+        self.label = f"add '{description}'"
+
+    def apply(self, cursor):
+        if self.transaction is not None:
+            restore_transaction_rows(cursor, [self.transaction])
+        else:
+            self.transaction = insert_transaction_row(cursor, *self.fields)
+        return Change((), [self.transaction], (), ())
+
+    def revert(self, cursor):
+        deleted = delete_transaction_rows(cursor, [self.transaction.id]) if self.transaction else []
+        return Change([t.id for t in deleted], (), (), deleted) if deleted else None
+
+
+class DeleteOperation:
+    """Deletes transactions by id in one SQL transaction; undo restores them."""
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+        self.deleted = None
+        self.label = f"delete {len(self.ids)} transaction{'s' if len(self.ids) != 1 else ''}"
+
+    def apply(self, cursor):
+        deleted = delete_transaction_rows(cursor, self.ids if self.deleted is None else [t.id for t in self.deleted])
+        if not deleted:
+            return None
+        self.deleted = deleted
+        return Change([t.id for t in deleted], (), (), deleted)
+
+    def revert(self, cursor):
+        if not self.deleted:
+            return None
+        restore_transaction_rows(cursor, self.deleted)
+        return Change((), self.deleted, (), ())
+
+
+class RetagOperation:
+    """Sets the tag of transactions by id in one SQL transaction; undo puts the old tags back."""
+
+    def __init__(self, ids, tag):
+        self.ids = list(ids)
+        self.tag = tag
+        self.before = None
+        self.label = f"tag {len(self.ids)} transaction{'s' if len(self.ids) != 1 else ''} '{tag}'"
+
+    def apply(self, cursor):
+        before, after = update_transaction_tags(cursor, [(transaction_id, self.tag) for transaction_id in self.ids])
+        if not before:
+            return None
+        self.before = before
+        return Change((), (), after, before)
+
+    def revert(self, cursor):
+        if not self.before:
+            return None
+        before, after = update_transaction_tags(cursor, [(t.id, t.tag) for t in self.before])
+        return Change((), (), after, before) if after else None
+
+
+class OperationJournal:
+    """
+    Undo/redo history of ledger operations.
+
+    An operation has apply() and revert(), write steps (see
+    database.run_write_steps) each returning a Change, or None if there was
+    nothing to do. do() queues a new operation and clears the redo history;
+    undo() and redo() move the latest one between the two stacks. Each returns
+    the operation and a Future of its step's Change, and the history moves at
+    once, without waiting for it: `writer` (a utils.ledger_writer.LedgerWriter) runs the steps
+    in submission order, so an undo always follows what it undoes. With no
+    writer each step runs immediately on the calling thread. Every step is one
+    SQL transaction (or part of one group commit), and its Change is written to
+    the transaction log once committed, so the log still replays to the same
+    ledger. The caller discard()s an operation whose step failed or did nothing.
+    """
+
+    def __init__(self, limit=JOURNAL_LIMIT, writer=None):
+        self.limit = limit
+        self.writer = writer
+        self._done = []
+        self._undone = []
+
+    @property
+    def can_undo(self):
+        return bool(self._done)
+
+    @property
+    def can_redo(self):
+        return bool(self._undone)
+
+    def _submit(self, operation, step):
+        future = self.writer.submit(step) if self.writer is not None else run_now(step)
+        future.add_done_callback(log_change)
+        return operation, future
+
+    def do(self, operation):
+        self._done.append(operation)
+        del self._done[:-self.limit]
+        self._undone.clear()
+        return self._submit(operation, operation.apply)
+
+    def undo(self):
+        if not self._done:
+            return None
+        operation = self._done.pop()
+        self._undone.append(operation)
+        return self._submit(operation, operation.revert)
+
+    def redo(self):
+        if not self._undone:
+            return None
+        operation = self._undone.pop()
+        self._done.append(operation)
+        return self._submit(operation, operation.apply)
+
+    def discard(self, operation):
+        """
+        Forgets `operation` after its step failed or did nothing (e.g. its rows
+        changed under us). The redo history no longer matches the ledger either,
+        so it is dropped too.
+        """
+        if operation in self._done:
+            self._done.remove(operation)
+        self._undone.clear()
@@ -0,0 +1,197 @@
+import numpy as np
+
+from database import get_connection, DATE_TS_SQL
+from utils.currencies import minor_unit_scale
+
+# Transactions are loaded straight from the cursor into this record layout, so no
+# per-row Python objects are kept around.
+COLUMN_DTYPE = np.dtype([
+    ("amount", np.int64),   # Minor units of the row's currency
+    ("count", np.int64),
+    ("currency", np.int32),
+    ("is_credit", np.bool_),
+    ("day", np.int32),   # Days since 1970-01-01
+    ("tag", np.int32),
+])
+
+# Days since the Unix epoch for a 'YYYY-MM-DD...' date string.
+_DAY_SQL = "IFNULL(CAST(julianday(substr({column}, 1, 10)) - 2440587.5 AS INTEGER), 0)"
+
+
+def _build_filters(tag, start_date, end_date, date_filter):
+    clauses = []
+    params = []
+    if tag:
+        clauses.append("src.tag = ?")
+        params.append(tag)
+    if start_date:
+        clauses.append(date_filter.format(op=">="))
+        params.append(start_date)
+    if end_date:
+        clauses.append(date_filter.format(op="<"))
+        params.append(end_date)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+def _load_codes(conn, currencies, tags):
+    """Fills the connection's temp lookup table that maps currency/tag names to array codes."""
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS column_codes ("
+        "kind TEXT NOT NULL, name TEXT NOT NULL, code INTEGER NOT NULL, PRIMARY KEY (kind, name)"
+        ") WITHOUT ROWID"
+    )
+    with conn:
+        conn.execute("DELETE FROM temp.column_codes")
+        conn.executemany(
+            "INSERT INTO temp.column_codes (kind, name, code) VALUES (?, ?, ?)",
+            [("currency", name, code) for code, name in enumerate(currencies)]
+            + [("tag", name, code) for code, name in enumerate(tags)],
+        )
+
+
+class LedgerColumns:
+    """
+    Column-oriented snapshot of the ledger held in typed NumPy arrays.
+
+    Currencies and tags are dictionary-encoded: `currencies[code]` and
+    `tags[code]` give the names for the integer codes stored per row. Rows may be
+    raw transactions (count 1 each) or pre-aggregated daily totals (from
+    ledger_daily); every computation weights by `counts`, so both give the same
+    results. Amounts are int64 minor units of each row's currency, so sums that
+    stay within one currency are exact; they become floats only when converted to
+    the base currency. Methods taking `rates` expect a utils.rates.RateTable.
+    """
+
+    def __init__(self, records, currencies, tags):
+        self.amounts = records["amount"]
+        self.scales = np.array([minor_unit_scale(currency) for currency in currencies], dtype=np.float64)
+        self.counts = records["count"]
+        self.currency_codes = records["currency"]
+        self.is_credit = records["is_credit"]
+        self.days = records["day"]
+        self.tag_codes = records["tag"]
+        self.currencies = currencies
+        self.tags = tags
+        self._base_cache = (None, None)
+        self._months = None
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def _load(cls, table, value_columns, date_column, date_filter, tag, start_date, end_date):
+        conn = get_connection()
+        currencies = [row[0] for row in conn.execute(
+            "SELECT DISTINCT currency FROM ledger_totals ORDER BY currency")]
+        tags = [row[0] for row in conn.execute(
+            "SELECT DISTINCT tag FROM ledger_daily ORDER BY tag")]
+        _load_codes(conn, currencies, tags)
+
+        where, params = _build_filters(tag, start_date, end_date, date_filter)
+        cursor = conn.execute(
+            f"""
+            SELECT {value_columns}, cur.code, src.transaction_type = 'credit',
+                   {_DAY_SQL.format(column='src.' + date_column)}, tg.code
+            FROM {table} AS src
+            JOIN temp.column_codes AS cur ON cur.kind = 'currency' AND cur.name = src.currency
+            JOIN temp.column_codes AS tg ON tg.kind = 'tag' AND tg.name = IFNULL(src.tag, '')
+            {where}
+            """,
+            params,
+        )
+        records = np.fromiter(cursor, dtype=COLUMN_DTYPE)
+        return cls(records, currencies, tags)
+
+    @classmethod
+    def from_transactions(cls, tag=None, start_date=None, end_date=None):
+        """Loads one row per transaction. Dates filter as in get_transactions_page."""
+        date_filter = f"src.date_ts {{op}} {DATE_TS_SQL.format('?')}"  # Uses the date_ts indexes
+        return cls._load("transactions", "src.amount_minor, 1", "date", date_filter, tag, start_date, end_date)
+
+    @classmethod
+    def from_daily_totals(cls, tag=None, start_date=None, end_date=None):
+        """Loads one row per (day, currency, type, tag) from the maintained aggregates."""
+        return cls._load("ledger_daily", "src.total_minor, src.tx_count", "day", "src.day {op} ?", tag, start_date, end_date)
+
+    def amounts_in_base(self, rates):
+        """
+        Converts every amount to the base currency with a RateTable, at the rate
+        effective on each row's day. Cached per table, so the breakdowns of one
+        analysis convert only once.
+        """
+        cached_rates, base = self._base_cache
+        if cached_rates is rates:
+            return base
+        if not len(self):
+            base = np.zeros(0, dtype=np.float64)
+        else:
+            rows_rates = rates.rates_for_rows(self.currencies, self.currency_codes, self.days, self.counts)
+            base = self.amounts * (rows_rates / self.scales[self.currency_codes])
+        self._base_cache = (rates, base)
+        return base
+
+    def totals_minor(self):
+        """
+        Returns (currencies, credits, debits): exact per-currency totals as int64
+        minor units, summed without any conversion.
+        """
+        sums = np.zeros(len(self.currencies) * 2, dtype=np.int64)
+        np.add.at(sums, self.currency_codes.astype(np.int64) * 2 + self.is_credit, self.amounts)
+        sums = sums.reshape(len(self.currencies), 2)
+        return list(self.currencies), sums[:, 1], sums[:, 0]
+
+    def summary(self, rates):
+        """Returns total and count of credits and debits in the base currency."""
+        # One pass each: bin 0 collects debits and bin 1 credits
+        totals = np.bincount(self.is_credit, weights=self.amounts_in_base(rates), minlength=2)
+        counts = np.bincount(self.is_credit, weights=self.counts, minlength=2)
+        return {
+            "credits": float(totals[1]),
+            "debits": float(totals[0]),
+            "num_credits": int(counts[1]),
+            "num_debits": int(counts[0]),
+        }
+
+    def _split_by(self, codes, size, rates):
+        """Sums base amounts per (code, type) in a single bincount; returns (income, expense) arrays."""
+        keys = codes.astype(np.int64) * 2 + self.is_credit
+        sums = np.bincount(keys, weights=self.amounts_in_base(rates), minlength=size * 2).reshape(size, 2)
+        return sums[:, 1], sums[:, 0]
+
+    def by_tag(self, rates):
+        """Returns (tags, income, expense) with per-tag base-currency totals."""
+        income, expense = self._split_by(self.tag_codes, len(self.tags), rates)
+        return list(self.tags), income, expense
+
+    def by_currency(self, rates):
+        """Returns (currencies, income, expense) with per-currency totals converted to base."""
+        income, expense = self._split_by(self.currency_codes, len(self.currencies), rates)
+        return list(self.currencies), income, expense
+
+    def by_day(self, rates):
+        """Returns (first_day, income, expense) for every day from the first to the last row.
+
+        Days are counted since 1970-01-01; index i of the arrays is day first_day + i.
+        """
+        if not len(self):
+            return 0, np.zeros(0), np.zeros(0)
+        first = int(self.days.min())
+        income, expense = self._split_by(self.days - first, int(self.days.max()) - first + 1, rates)
+        return first, income, expense
+
+    @property
+    def months(self):
+        """Months since 1970-01 for every row, computed once."""
+        if self._months is None:
+            self._months = self.days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        return self._months
+
+    def by_month(self, rates):
+        """Returns (['YYYY-MM', ...], income, expense) for every month from the first to the last row."""
+        if not len(self):
+            return [], np.zeros(0), np.zeros(0)
+        months = self.months
+        first = int(months.min())
+        income, expense = self._split_by(months - first, int(months.max()) - first + 1, rates)
+        labels = np.arange(first, first + len(income)).astype("datetime64[M]").astype(str).tolist()
+        return labels, income, expense
@@ -0,0 +1,127 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from database import run_write_steps
+from utils.instrumentation import count
+
+# Steps committed together at most; more stay queued for the next commit.
+MAX_GROUP_SIZE = 500
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def _resolve(future, result, error):
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+
+
+def run_now(step):
+    """Runs one write step on the calling thread, in its own transaction. Returns a completed Future."""
+    future = Future()
+    future.set_running_or_notify_cancel()
+    (result, error), = run_write_steps([step])
+    _resolve(future, result, error)
+    return future
+
+
+class LedgerWriter:
+    """
+    Single thread that owns writes to the ledger database.
+
+    `submit()` only enqueues a write step (a callable taking a cursor, see
+    database.run_write_steps) and returns a concurrent.futures.Future for its
+    result, so the UI thread never waits on SQLite. Steps run in the order they
+    were submitted. Whatever queued up while the previous commit ran is applied
+    in one SQL transaction (group commit), up to `max_group` steps, and the
+    futures complete after that commit. A step that raises fails only its own
+    future. Unlike the transaction log, the queue is unbounded: writes are never
+    dropped.
+    """
+
+    def __init__(self, max_group=MAX_GROUP_SIZE):
+        self.max_group = max_group
+        self.commits = 0
+        self.steps = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # --- Producer side (any thread) ---
+
+    def submit(self, step):
+        """Enqueues `step`; returns a Future of what it returns (or raises)."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((step, future))
+        return future
+
+    def flush(self, timeout=5.0):
+        """Blocks until every step submitted so far is committed (or failed)."""
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Commits pending steps and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                    self._thread.start()
+
+    # --- Writer thread ---
+
+    def _run(self):
+        while True:
+            group = []
+            control = None
+            item = self._queue.get()
+            while True:
+                if item is _STOP or isinstance(item, _FlushRequest):
+                    control = item
+                    break
+                step, future = item
+                if future.set_running_or_notify_cancel():
+                    group.append((step, future))
+                if len(group) >= self.max_group:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if group:
+                self._commit(group)
+            if control is _STOP:
+                return
+            if control is not None:
+                control.done.set()
+
+    def _commit(self, group):
+        outcomes = run_write_steps([step for step, _ in group])
+        self.commits += 1
+        self.steps += len(group)
+        count("writer.group_size", len(group))
+        for (_, future), (result, error) in zip(group, outcomes):
+            _resolve(future, result, error)
+
+
+# Shared writer used by the app screens.
+ledger_writer = LedgerWriter()
@@ -0,0 +1,188 @@
+import csv
+import sqlite3
+import threading
+from bisect import bisect_right
+from collections import Counter
+from datetime import date as date_type
+
+import numpy as np
+
+from database import (get_exchange_rates, upsert_exchange_rates, get_ledger_version,
+                      DEFAULT_EXCHANGE_RATES, DEFAULT_RATES_DATE)
+from utils.ledger_writer import ledger_writer
+
+# Column names accepted in a rates CSV (case-insensitive).
+RATES_CSV_COLUMNS = {
+    "currency": ("currency", "code", "ccy"),
+    "date": ("date", "effective_date", "day"),
+    "rate": ("rate", "rate_to_inr", "rate_to_base", "value"),
+}
+
+
+class RateTable:
+    """
+    Exchange rates to the base currency, indexed per currency by effective date.
+
+    `rate(currency, day)` finds the rate in effect on `day` ('YYYY-MM-DD...')
+    with a bisect over that currency's sorted dates and memoizes it per
+    (currency, 'YYYY-MM-DD'), so timestamped days share an entry. Currencies without any rate convert at 1.0 and are counted
+    in `missing` instead of warning per row; `report_missing()` prints one line.
+    """
+
+    def __init__(self, rows):
+        """`rows` are (currency, effective_date, rate) sorted by currency, then date."""
+        self._dates = {}
+        self._rates = {}
+        for currency, effective_date, rate in rows:
+            self._dates.setdefault(currency, []).append(effective_date[:10])
+            self._rates.setdefault(currency, []).append(rate)
+        self._memo = {}
+        self._day_index = {}
+        self.missing = Counter()
+
+    @classmethod
+    def from_mapping(cls, rates, effective_date=DEFAULT_RATES_DATE):
+        """A table with one constant rate per currency, e.g. {'USD': 83.0}."""
+        return cls((currency.upper(), effective_date, rate) for currency, rate in sorted(rates.items()))
+
+    @classmethod
+    def from_database(cls):
+        return cls(get_exchange_rates())
+
+    @property
+    def currencies(self):
+        return list(self._dates)
+
+    def rate(self, currency, day):
+        """Rate to base for `currency` on `day`, or None if the currency has no rates."""
+        day = day[:10]
+        key = (currency, day)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        code = currency.upper()
+        dates = self._dates.get(code)
+        if dates is None:
+            rate = None
+        else:
+            # Before the first effective date, the first rate applies
+            rate = self._rates[code][max(bisect_right(dates, day) - 1, 0)]
+        self._memo[key] = rate
+        return rate
+
+    def convert(self, amount, currency, day):
+        """Converts `amount` to base at the rate effective on `day` (unconverted if unknown)."""
+        rate = self.rate(currency, day)
+        if rate is None:
+            self.missing[currency] += 1
+            return amount
+        return amount * rate
+
+    def rates_for_rows(self, currencies, currency_codes, days, counts=None):
+        """
+        Vectorized lookup for LedgerColumns: returns the rate for every row given
+        dictionary-encoded currencies and days since 1970-01-01. Each currency is
+        resolved with one searchsorted over its effective dates.
+        """
+        result = np.ones(len(currency_codes), dtype=np.float64)
+        for code, currency in enumerate(currencies):
+            rows = np.flatnonzero(currency_codes == code)
+            if not len(rows):
+                continue
+            index = self._numpy_index(currency.upper())
+            if index is None:
+                self.missing[currency] += int(counts[rows].sum()) if counts is not None else len(rows)
+                continue
+            effective_days, rates = index
+            positions = np.searchsorted(effective_days, days[rows], side="right") - 1
+            result[rows] = rates[np.maximum(positions, 0)]
+        return result
+
+    def _numpy_index(self, code):
+        if code not in self._dates:
+            return None
+        index = self._day_index.get(code)
+        if index is None:
+            effective_days = np.array(self._dates[code], dtype="datetime64[D]").astype(np.int64)
+            index = (effective_days, np.array(self._rates[code], dtype=np.float64))
+            self._day_index[code] = index
+        return index
+
+    def report_missing(self):
+        """Prints one warning summarizing rows converted without a rate, then resets the count."""
+        if self.missing:
+            details = ", ".join(f"{currency} ({count} rows)" for currency, count in sorted(self.missing.items()))
+            print(f"Warning: Exchange rates not found for {details}. Used 1.0 (no conversion).")
+            self.missing.clear()
+
+
+# --- Shared table ---
+# Reloaded from the database whenever the ledger version changes (rate imports
+# bump it), so conversions always see the current rates.
+_shared_lock = threading.Lock()
+_shared = (None, None)
+
+
+def get_rate_table():
+    """Returns the shared RateTable for the current database contents."""
+    global _shared
+    version = get_ledger_version()
+    with _shared_lock:
+        cached_version, table = _shared
+        if table is None or cached_version != version:
+            rows = get_exchange_rates()
+            table = RateTable(rows) if rows else RateTable.from_mapping(DEFAULT_EXCHANGE_RATES)
+            _shared = (version, table)
+        return table
+
+
+# --- Import ---
+
+def _map_columns(header):
+    normalized = [name.strip().lower() for name in header]
+    mapping = {}
+    for field, aliases in RATES_CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized.index(alias)
+                break
+        else:
+            raise ValueError(f"Rates file has no {field} column (expected one of {', '.join(aliases)})")
+    return mapping
+
+
+def iter_rates_csv(path):
+    """Yields (currency, 'YYYY-MM-DD', rate) from a CSV with currency, date and rate columns."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        columns = _map_columns(next(reader))
+        for line_number, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            try:
+                currency = row[columns["currency"]].strip().upper()
+                effective_date = date_type.fromisoformat(row[columns["date"]].strip()[:10]).isoformat()
+                rate = float(row[columns["rate"]])
+            except (IndexError, ValueError) as e:
+                print(f"Skipping rates line {line_number}: {e}")
+                continue
+            if rate <= 0 or not currency:
+                print(f"Skipping rates line {line_number}: invalid currency or rate")
+                continue
+            yield currency, effective_date, rate
+
+
+def import_rates_file(path, writer=ledger_writer):
+    """
+    Loads every rate in `path` into the exchange_rates table through `writer`
+    and waits for the commit. Returns the count (0 on error).
+    """
+    rows = list(iter_rates_csv(path))
+    try:
+        written = writer.submit(lambda cursor: upsert_exchange_rates(cursor, rows)).result()
+    except sqlite3.Error as e:
+        print(f"!!! Database Error saving exchange rates: {e}")
+        return 0
+    print(f"Exchange rates saved: {written}")
+    return written
@@ -0,0 +1,324 @@
+import calendar
+import heapq
+import re
+from collections import namedtuple
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from database import (insert_recurring_rule, get_recurring_rules, insert_recurring_occurrences, canonical_tag,
+                      seal_description)
+from utils.ledger_writer import ledger_writer, run_now
+from utils.transaction_log import transaction_log
+from utils.instrumentation import timed, trace
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Occurrences generated per rule in one catch-up. A rule that is further behind
+# (say, every minute for a year) skips ahead to its next occurrence after now.
+MAX_CATCH_UP = 5000
+# A cron expression with no match within this many years (e.g. "0 0 30 2 *") never fires.
+CRON_SEARCH_YEARS = 8
+
+RecurringRule = namedtuple("RecurringRule", "id amount description currency transaction_type tag "
+                                            "schedule start_date next_due end_date")
+
+
+# --- Schedules ---
+# Each schedule has next_after(previous), the first occurrence strictly after the
+# datetime `previous` (None if there is none), and first(start), the first
+# occurrence at or after `start`.
+
+class IntervalSchedule:
+    """Every `step` (a timedelta) from the start: 'daily', 'weekly', 'every 3 days'."""
+
+    def __init__(self, step):
+        self.step = step
+
+    def first(self, start):
+        return start
+
+    def next_after(self, previous):
+        return previous + self.step
+
+
+class MonthlySchedule:
+    """
+    Every `months` months on the start's day of month, or the month's last day
+    when it is shorter (Jan 31 -> Feb 28 -> Mar 31): 'monthly', 'yearly'.
+    """
+
+    def __init__(self, months, start):
+        self.months = months
+        self.start = start
+
+    def first(self, start):
+        return start
+
+    def next_after(self, previous):
+        index = (previous.year - self.start.year) * 12 + previous.month - self.start.month + self.months
+        year, month = self.start.year + (self.start.month - 1 + index) // 12, (self.start.month - 1 + index) % 12 + 1
+        day = min(self.start.day, calendar.monthrange(year, month)[1])
+        return self.start.replace(year=year, month=month, day=day)
+
+
+class CronSchedule:
+    """
+    Standard five-field cron expression: minute, hour, day of month, month, day
+    of week (0-7, Sunday is 0 or 7). Fields accept *, lists (1,15), ranges
+    (1-5) and steps (*/2, 9-17/4). As in cron, when both day fields are
+    restricted a day matching either one is used.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields, got {len(parts)}: {expression!r}")
+        (self.minutes, self.hours, self.days, self.months, weekdays) = (
+            self._parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELDS))
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for item in field.split(","):
+            match = re.fullmatch(r"(\*|\d+(?:-\d+)?)(?:/(\d+))?", item)
+            if not match:
+                raise ValueError(f"invalid cron field {field!r}")
+            span, step = match.group(1), int(match.group(2) or 1)
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(value) for value in span.split("-"))
+            else:
+                start = end = int(span)
+                if match.group(2):
+                    end = high  # "5/10" means from 5 to the end, every 10
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"cron field {field!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays  # cron counts from Sunday
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def first(self, start):
+        return self.next_after(start.replace(second=0) - timedelta(minutes=1))
+
+    def next_after(self, previous):
+        t = previous.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = t.year + CRON_SEARCH_YEARS
+        while t.year <= last_year:
+            if t.month not in self.months:
+                t = t.replace(year=t.year + t.month // 12, month=t.month % 12 + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                later = [minute for minute in self.minutes if minute > t.minute]
+                t = t.replace(minute=min(later)) if later else t.replace(minute=0) + timedelta(hours=1)
+            else:
+                return t
+        return None
+
+
+_EVERY_RE = re.compile(r"every\s+(\d+)\s+(day|week|month|year)s?")
+
+
+def parse_schedule(spec, start):
+    """
+    Returns the schedule for `spec`: 'daily', 'weekly', 'monthly', 'yearly',
+    'every N days|weeks|months|years', or a cron expression. `start` (a
+    datetime) anchors the interval schedules. Raises ValueError if invalid.
+    """
+    text = spec.strip().lower()
+    named = {"daily": (1, "day"), "weekly": (1, "week"), "monthly": (1, "month"), "yearly": (1, "year")}
+    if text in named:
+        n, unit = named[text]
+    else:
+        match = _EVERY_RE.fullmatch(text)
+        if not match:
+            return CronSchedule(text)
+        n, unit = int(match.group(1)), match.group(2)
+        if n < 1:
+            raise ValueError(f"invalid interval in {spec!r}")
+    if unit == "day":
+        return IntervalSchedule(timedelta(days=n))
+    if unit == "week":
+        return IntervalSchedule(timedelta(weeks=n))
+    return MonthlySchedule(n * 12 if unit == "year" else n, start)
+
+
+def create_rule(amount, description, currency, transaction_type, tag, schedule, start_date=None, end_date=None,
+                include_start=True, writer=None):
+    """
+    Validates `schedule` and stores a new rule starting at `start_date` ('YYYY-MM-DD
+    HH:MM:SS', default now). With include_start=False the occurrence at the start
+    is skipped (e.g. because it was just entered by hand). The write goes through
+    `writer` (a utils.ledger_writer.LedgerWriter) or, without one, runs at once.
+    Returns a Future of the stored rule (it raises the database error if the rule
+    couldn't be saved). Raises ValueError for an invalid schedule.
+    """
+    start = datetime.strptime(start_date, DATE_FORMAT) if start_date else datetime.now().replace(microsecond=0)
+    parsed = parse_schedule(schedule, start)
+    first = parsed.first(start)
+    if first is not None and not include_start and first == start:
+        first = parsed.next_after(start)
+    if first is None:
+        raise ValueError(f"schedule {schedule!r} never occurs")
+    next_due = first.strftime(DATE_FORMAT)
+    rule = RecurringRule(None, amount, description, currency, transaction_type, canonical_tag(tag),
+                         schedule, start.strftime(DATE_FORMAT), next_due, end_date)
+
+    def step(cursor):
+        return rule._replace(id=insert_recurring_rule(cursor, *rule[1:]))
+    return writer.submit(step) if writer is not None else run_now(step)
+
+
+class RecurringScheduler:
+    """
+    Materializes due occurrences of the recurring rules.
+
+    Rules sit in a min-heap keyed on next_due, so finding the next due rule is
+    O(1) and taking k due rules is O(k log n); rules that aren't due are never
+    looked at. run_due() catches every due rule up to now in one SQL transaction
+    (all the missed occurrences of a long absence included) and puts each rule
+    back with its new next_due. The occurrences are stored in date order across
+    rules, so ids follow dates. The write goes through `writer` (a
+    utils.ledger_writer.LedgerWriter) without waiting for it; with no writer it
+    runs immediately on the calling thread. A rule whose stored schedule or
+    next_due can't be parsed is left as stored and set aside in `broken` (rule
+    id -> error) until the next load().
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self._heap = []       # (next_due, rule id)
+        self._rules = {}      # rule id -> RecurringRule
+        self._schedules = {}  # rule id -> parsed schedule, filled when the rule first comes due
+        self.broken = {}      # rule id -> why it can't be scheduled
+        self._stale = False   # A write failed; the heap is ahead of the stored rules
+
+    def load(self):
+        """(Re)reads the active rules from the database."""
+        self._stale = False
+        rules = [RecurringRule(*row) for row in get_recurring_rules()]
+        self._rules = {rule.id: rule for rule in rules}
+        self._schedules = {}
+        self.broken = {}
+        self._heap = [(rule.next_due, rule.id) for rule in rules]
+        heapq.heapify(self._heap)
+
+    def add(self, rule):
+        """Starts scheduling a rule created after load()."""
+        self._rules[rule.id] = rule
+        heapq.heappush(self._heap, (rule.next_due, rule.id))
+
+    def _schedule(self, rule):
+        schedule = self._schedules.get(rule.id)
+        if schedule is None:
+            schedule = self._schedules[rule.id] = parse_schedule(
+                rule.schedule, datetime.strptime(rule.start_date, DATE_FORMAT))
+        return schedule
+
+    def __len__(self):
+        return len(self._heap)
+
+    def next_due(self):
+        """Date string of the earliest pending occurrence, or None without rules."""
+        return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self, now=None):
+        due = self.next_due()
+        if due is None:
+            return None
+        now = now or datetime.now()
+        return max(0.0, (datetime.strptime(due, DATE_FORMAT) - now).total_seconds())
+
+    @timed("recurring.run_due")
+    def run_due(self, now=None):
+        """
+        Queues every occurrence due by `now` (default: the current time). Returns
+        a Future of the new transaction ids. The rules move on at once; if the
+        write fails, the next run starts again from the stored rules.
+        """
+        if self._stale:
+            self.load()
+        now = now or datetime.now()
+        now_str = now.strftime(DATE_FORMAT)
+        rows = []
+        next_dues = []
+        requeue = []
+        while self._heap and self._heap[0][0] <= now_str:
+            due_str, rule_id = heapq.heappop(self._heap)
+            rule = self._rules[rule_id]
+            try:
+                schedule = self._schedule(rule)
+                due = datetime.strptime(due_str, DATE_FORMAT)
+            except ValueError as e:
+                # Its stored next_due is kept, so once the rule is fixed the next load() catches it up
+                print(f"Warning: recurring rule {rule_id} can't be scheduled ({rule.schedule!r}, next due "
+                      f"{due_str!r}): {e}; it is paused until the rules are reloaded.")
+                self.broken[rule_id] = str(e)
+                del self._rules[rule_id]
+                continue
+            generated = 0
+            while due is not None and due <= now and (rule.end_date is None or due.strftime(DATE_FORMAT) <= rule.end_date):
+                if generated == MAX_CATCH_UP:
+                    print(f"Warning: recurring rule {rule_id} is more than {MAX_CATCH_UP} occurrences behind; skipping ahead.")
+                    while due is not None and due <= now:
+                        due = schedule.next_after(due)
+                    break
+                rows.append((rule.amount, rule.description, rule.currency, rule.transaction_type,
+                             due.strftime(DATE_FORMAT), rule.tag))
+                generated += 1
+                due = schedule.next_after(due)
+            next_due = due.strftime(DATE_FORMAT) if due is not None else None
+            if next_due is not None and rule.end_date is not None and next_due > rule.end_date:
+                next_due = None
+            next_dues.append((next_due, rule_id))
+            if next_due is not None:
+                requeue.append((next_due, rule_id))
+                self._rules[rule_id] = rule._replace(next_due=next_due)
+            else:
+                del self._rules[rule_id]
+                self._schedules.pop(rule_id, None)
+        if not next_dues:
+            future = Future()
+            future.set_result([])
+            return future
+
+        for next_due, rule_id in requeue:
+            heapq.heappush(self._heap, (next_due, rule_id))
+        # Each rule was caught up in turn; store the occurrences in date order, as if the app had been running
+        rows.sort(key=lambda row: row[4])
+
+        def step(cursor):
+            return insert_recurring_occurrences(cursor, rows, next_dues)
+        future = self.writer.submit(step) if self.writer is not None else run_now(step)
+        future.add_done_callback(lambda future: self._written(future, rows, len(next_dues)))
+        return future
+
+    def _written(self, future, rows, rule_count):
+        """Logs the committed occurrences; after a failure, marks the rules for reloading (runs on the writer thread)."""
+        error = future.exception()
+        if error is not None:
+            print(f"!!! Database Error adding recurring transactions: {error}")
+            self._stale = True
+            return
+        for transaction_id, (amount, description, *rest) in zip(future.result(), rows):
+            transaction_log.log_add(transaction_id, amount, seal_description(description), *rest)
+        trace("Recurring rules: %d transactions added from %d rules", len(rows), rule_count)
+
+
+# Shared by the app (startup catch-up and periodic checks) and the main screen (new rules).
+recurring_scheduler = RecurringScheduler(writer=ledger_writer)
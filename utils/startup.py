@@ -0,0 +1,69 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Startup timing. main.py imports this module before anything else, so times are
+# measured from (roughly) interpreter start. Set MONEYTRACKER_STARTUP_LOG to a
+# file path to append each launch's report as one JSON line, e.g. to compare
+# buildozer builds on a device. For a per-module import breakdown run with
+# PYTHONPROFILEIMPORTTIME=1 (or python -X importtime main.py).
+STARTUP_LOG_ENV = "MONEYTRACKER_STARTUP_LOG"
+
+_start = time.perf_counter()
+_phases = []        # (label, duration in seconds)
+_first_frame = None  # Seconds from start to the first rendered frame
+
+
+def elapsed():
+    """Seconds since this module was first imported."""
+    return time.perf_counter() - _start
+
+
+@contextmanager
+def phase(label):
+    """Times the enclosed block and records it under `label` (printed directly after startup)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        _phases.append((label, duration))
+        if _first_frame is not None:
+            print(f"{label}: {duration * 1000:.1f} ms")
+
+
+def watch_first_frame(on_first_frame=None):
+    """Records the time of the first frame drawn, then prints the report and calls `on_first_frame`."""
+    from kivy.core.window import Window
+
+    def on_flip(*args):
+        global _first_frame
+        Window.unbind(on_flip=on_flip)
+        _first_frame = elapsed()
+        report()
+        if on_first_frame:
+            on_first_frame()
+
+    Window.bind(on_flip=on_flip)
+
+
+def report():
+    """Prints the recorded phases (and appends them to $MONEYTRACKER_STARTUP_LOG if set)."""
+    if _first_frame is not None:
+        print(f"Startup: first frame after {_first_frame * 1000:.1f} ms")
+    for label, duration in _phases:
+        print(f"  {label:<32}{duration * 1000:>9.1f} ms")
+
+    path = os.environ.get(STARTUP_LOG_ENV)
+    if path:
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "first_frame_ms": round(_first_frame * 1000, 1) if _first_frame is not None else None,
+            "phases_ms": {label: round(duration * 1000, 1) for label, duration in _phases},
+        }
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing startup log: {e}")
@@ -0,0 +1,67 @@
+from bisect import bisect_left
+
+from database import get_tag_counts, fold_tag
+
+
+class TagSet:
+    """
+    The tags in use and how many transactions carry each, for the tag filter.
+
+    load() reads them once from the tags table; apply() then adjusts the counts
+    by what a journal Change added and removed, so adds, deletes and retags
+    never query the database. Tags are matched case-insensitively (fold_tag)
+    and listed in folded order, which is kept sorted as tags come and go.
+    """
+
+    def __init__(self):
+        self._counts = {}  # folded tag -> transactions carrying it
+        self._names = {}   # folded tag -> canonical spelling
+        self._order = []   # folded tags, sorted
+
+    def load(self):
+        self._counts.clear()
+        self._names.clear()
+        for name, tx_count in get_tag_counts():
+            folded = fold_tag(name)
+            self._counts[folded] = tx_count
+            self._names[folded] = name
+        self._order = sorted(self._counts)
+
+    def names(self):
+        """Canonical spellings of the tags in use, ordered case-insensitively."""
+        return [self._names[folded] for folded in self._order]
+
+    def __contains__(self, tag):
+        return fold_tag(tag) in self._counts
+
+    def add(self, tag, n=1):
+        """Counts `n` more transactions tagged `tag`. Returns True if the tag is new."""
+        folded = fold_tag(tag)
+        if folded in self._counts:
+            self._counts[folded] += n
+            return False
+        self._counts[folded] = n
+        self._names[folded] = tag
+        self._order.insert(bisect_left(self._order, folded), folded)
+        return True
+
+    def discard(self, tag, n=1):
+        """Counts `n` fewer transactions tagged `tag`. Returns True if it is no longer in use."""
+        folded = fold_tag(tag)
+        if folded not in self._counts:
+            return False
+        self._counts[folded] -= n
+        if self._counts[folded] > 0:
+            return False
+        del self._counts[folded], self._names[folded]
+        del self._order[bisect_left(self._order, folded)]
+        return True
+
+    def apply(self, change):
+        """Updates the counts for a journal Change. Returns True if the list of tags changed."""
+        changed = False
+        for t in change.before:
+            changed |= self.discard(t.tag)
+        for t in list(change.inserted) + list(change.updated):
+            changed |= self.add(t.tag)
+        return changed
@@ -0,0 +1,79 @@
+import numpy as np
+
+# Window lengths (in days) for the rolling averages.
+ROLLING_WINDOWS = (30, 90)
+# 1970-01-01 was a Thursday; adding this before dividing by 7 makes weeks start on Monday.
+_WEEK_OFFSET = 3
+
+
+def _day_labels(days):
+    return days.astype("datetime64[D]").astype(str).tolist()
+
+
+def _rebin(income, expense, bucket_of_day):
+    """Sums daily arrays into buckets; bucket_of_day must be non-decreasing and start at 0."""
+    size = int(bucket_of_day[-1]) + 1
+    return (np.bincount(bucket_of_day, weights=income, minlength=size),
+            np.bincount(bucket_of_day, weights=expense, minlength=size))
+
+
+def _series(labels, income, expense):
+    return {
+        'labels': labels,
+        'income': income.tolist(),
+        'expense': expense.tolist(),
+        'net': (income - expense).tolist(),
+    }
+
+
+def rolling_mean(values, window):
+    """
+    Mean of each value and the window - 1 before it, via one cumulative sum.
+    The first window - 1 entries average over the days available so far.
+    """
+    sums = np.cumsum(values, dtype=np.float64)
+    means = np.empty_like(sums)
+    head = min(window, len(values))
+    means[:head] = sums[:head] / np.arange(1, head + 1)
+    if len(values) > window:
+        means[window:] = (sums[window:] - sums[:-window]) / window
+    return means
+
+
+def build_time_series(columns, rates):
+    """
+    Builds daily, weekly and monthly income/expense/net series, rolling averages
+    of daily figures and the cumulative balance from a LedgerColumns snapshot.
+
+    Every day between the first and last transaction is present (zero if empty),
+    so rolling windows are measured in calendar days. Weeks are labelled by
+    their Monday, months as 'YYYY-MM'.
+    """
+    first_day, income, expense = columns.by_day(rates)
+    if not len(income):
+        return None
+
+    days = np.arange(first_day, first_day + len(income))
+    weeks = (days + _WEEK_OFFSET) // 7
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    week_income, week_expense = _rebin(income, expense, weeks - weeks[0])
+    month_income, month_expense = _rebin(income, expense, months - months[0])
+
+    week_starts = np.arange(weeks[0], weeks[0] + len(week_income)) * 7 - _WEEK_OFFSET
+    month_labels = np.arange(months[0], months[0] + len(month_income)).astype("datetime64[M]").astype(str).tolist()
+
+    net = income - expense
+    return {
+        'daily': _series(_day_labels(days), income, expense),
+        'weekly': _series(_day_labels(week_starts), week_income, week_expense),
+        'monthly': _series(month_labels, month_income, month_expense),
+        'rolling': {
+            window: {
+                'income': rolling_mean(income, window).tolist(),
+                'expense': rolling_mean(expense, window).tolist(),
+                'net': rolling_mean(net, window).tolist(),
+            }
+            for window in ROLLING_WINDOWS
+        },
+        'balance': np.cumsum(net).tolist(),
+    }
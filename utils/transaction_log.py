@@ -0,0 +1,385 @@
+import base64
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Structured (JSON lines) journal of every add and delete made from the app.
+LOG_FILE = "transaction_logs.jsonl"
+# Plain-text log written by older versions; nothing reads it.
+LEGACY_LOG_FILE = "transaction_logs.txt"
+
+# fsync policies: "always" syncs after every batch written, "interval" at most
+# once per fsync_interval seconds, "never" leaves it to the OS.
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# Operations applied per executemany call when replaying.
+REPLAY_BATCH_SIZE = 5000
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class _SealRequest(_FlushRequest):
+    def __init__(self, seal):
+        super().__init__()
+        self.seal = seal
+        self.sealed = None
+
+
+class TransactionLogWriter:
+    """
+    Buffered, rotating JSON-lines writer that runs on its own thread.
+
+    `log()` only enqueues the event, so callers on the UI thread never touch the
+    file. The writer thread serializes and writes events in batches, once
+    `flush_size` events are pending or `flush_interval` seconds have passed.
+    When the file would exceed `max_bytes` it is gzip-compressed to
+    `<path>.1.gz` (older archives shift up to `backups`) and a new one started.
+    If the bounded queue is full the event is dropped and counted in `dropped`
+    rather than blocking the caller. The next batch written starts with a
+    "dropped" marker event holding the count, so replay_log and
+    verify_against_log can tell that the log is incomplete.
+    """
+
+    def __init__(self, path=LOG_FILE, max_queue=10000, flush_size=64, flush_interval=1.0,
+                 fsync="interval", fsync_interval=5.0, max_bytes=1024 * 1024, backups=5, legacy_path=LEGACY_LOG_FILE):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.legacy_path = legacy_path
+        self.written = 0
+        self.dropped = 0
+        self._unlogged_drops = 0  # Dropped since the last marker was written
+        self._drops_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_fsync = 0.0
+
+    # --- Producer side (any thread) ---
+
+    def log(self, op, **fields):
+        """Enqueues one event; returns False if it was dropped because the queue is full."""
+        self._ensure_started()
+        event = {"ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "op": op}
+        event.update(fields)
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            with self._drops_lock:
+                self.dropped += 1
+                self._unlogged_drops += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"Warning: transaction log queue full, {self.dropped} events dropped so far.")
+            return False
+
+    def log_add(self, transaction_id, amount, description, currency, transaction_type, date, tag):
+        if isinstance(description, bytes):
+            # Sealed (database.seal_description): logged as base64 and replayed as the same BLOB
+            fields = {"description_sealed": base64.b64encode(description).decode("ascii")}
+        else:
+            fields = {"description": description}
+        return self.log("add", id=transaction_id, amount=amount, currency=currency,
+                        transaction_type=transaction_type, date=date, tag=tag if tag else 'Uncategorized', **fields)
+
+    def log_delete(self, transaction_id):
+        return self.log("delete", id=transaction_id)
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything enqueued so far is written (and synced unless fsync='never')."""
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def seal_history(self, seal, timeout=60.0):
+        """
+        Rewrites the log and its archives with every plaintext description
+        replaced by `seal(description)` (e.g. utils.crypto.LedgerCipher.seal),
+        on the writer thread between batches, and removes the legacy
+        plain-text log (`legacy_path`).
+        Returns the number of events sealed, or None if it failed or timed out.
+        """
+        self._ensure_started()
+        request = _SealRequest(seal)
+        self._queue.put(request)
+        if not request.done.wait(timeout) or request.sealed is None:
+            return None
+        try:
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                os.remove(self.legacy_path)
+        except OSError as e:
+            print(f"Error removing {self.legacy_path}: {e}")
+            return None
+        return request.sealed
+
+    def close(self, timeout=5.0):
+        """Writes pending events and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="transaction-log", daemon=True)
+                    self._thread.start()
+
+    # --- Writer thread ---
+
+    def _run(self):
+        pending = []
+        last_write = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_write)) if pending else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP or isinstance(item, _FlushRequest):
+                self._write(pending, sync=self.fsync != "never")
+                pending = []
+                last_write = time.monotonic()
+                if item is _STOP:
+                    self._close_file()
+                    return
+                if isinstance(item, _SealRequest):
+                    self._close_file()  # Reopened by the next write
+                    try:
+                        item.sealed = seal_log_files(self.path, item.seal)
+                    except OSError as e:
+                        print(f"Error sealing the transaction log: {e}")
+                item.done.set()
+                continue
+            if item is not None:
+                pending.append(item)
+
+            if len(pending) >= self.flush_size or (pending and time.monotonic() - last_write >= self.flush_interval):
+                self._write(pending)
+                pending = []
+                last_write = time.monotonic()
+
+    def _write(self, events, sync=False):
+        with self._drops_lock:
+            drops, self._unlogged_drops = self._unlogged_drops, 0
+        if drops:
+            events = [{"ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "op": "dropped", "count": drops}] + events
+        if not events:
+            return
+        data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode("utf-8")
+        try:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self.written += len(events) - (1 if drops else 0)  # Not counting the marker
+            now = time.monotonic()
+            if sync or self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+        except OSError as e:
+            if drops:
+                with self._drops_lock:
+                    self._unlogged_drops += drops  # Marker not written; retry with the next batch
+            print(f"Error writing to transaction log: {e}")
+
+    def _rotate(self):
+        """Compresses the current file to <path>.1.gz, shifting older archives up."""
+        self._close_file()
+        oldest = f"{self.path}.{self.backups}.gz"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}.gz"):
+                os.replace(f"{self.path}.{n}.gz", f"{self.path}.{n + 1}.gz")
+        with open(self.path, "rb") as src, gzip.open(f"{self.path}.1.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+        self._file = open(self.path, "ab")
+
+    def _close_file(self):
+        if self._file is not None:
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+# Shared writer used by the app screens.
+transaction_log = TransactionLogWriter()
+
+
+# --- Replay ---
+
+def log_files(path=LOG_FILE):
+    """Returns the archives and current log for `path`, oldest first."""
+    archives = []
+    for name in glob.glob(glob.escape(path) + ".*.gz"):
+        match = re.search(r"\.(\d+)\.gz$", name)
+        if match:
+            archives.append((int(match.group(1)), name))
+    files = [name for _, name in sorted(archives, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _seal_event_line(line, seal):
+    """`line` with its plaintext description sealed (as log_add writes it), or None if it has none."""
+    if '"description":' not in line:
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None
+    if "description" not in event:
+        return None
+    event["description_sealed"] = base64.b64encode(seal(event.pop("description"))).decode("ascii")
+    return json.dumps(event, separators=(",", ":")) + "\n"
+
+
+def seal_log_files(path, seal):
+    """
+    Seals the plaintext descriptions in every file of the log at `path` with
+    `seal`. A file is rewritten to a temporary file and moved into place, and
+    only if it has any. Returns the number of events sealed.
+    """
+    sealed = 0
+    for name in log_files(path):
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(name, "rt", encoding="utf-8") as f:
+            lines = f.readlines()
+        changed = 0
+        for i, line in enumerate(lines):
+            sealed_line = _seal_event_line(line, seal)
+            if sealed_line is not None:
+                lines[i] = sealed_line
+                changed += 1
+        if not changed:
+            continue
+        with opener(name + ".tmp", "wt", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(name + ".tmp", name)
+        sealed += changed
+    return sealed
+
+
+def iter_log_events(path=LOG_FILE):
+    """Yields events from every file of the log in order, skipping malformed lines."""
+    for name in log_files(path):
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(name, "rt", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print(f"Skipping malformed log line {name}:{line_number}")
+
+
+def replay_log(conn, path=LOG_FILE, batch_size=REPLAY_BATCH_SIZE):
+    """
+    Applies every logged add and delete to `conn`, keeping the logged ids.
+
+    Consecutive operations of the same kind are applied with one executemany,
+    committed every `batch_size` operations. Returns (adds, deletes, dropped):
+    the operations applied, and how many events the writer dropped (recorded
+    by its "dropped" markers), which the log can't bring back.
+    """
+    adds = deletes = dropped = 0
+    batch_op = None
+    batch = []
+
+    def apply(op, rows):
+        if op == "add":
+            conn.executemany(
+                "INSERT INTO transactions (id, amount, description, currency, transaction_type, date, tag) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET amount = excluded.amount, "
+                "description = excluded.description, currency = excluded.currency, "
+                "transaction_type = excluded.transaction_type, date = excluded.date, tag = excluded.tag", rows)
+        else:
+            conn.executemany("DELETE FROM transactions WHERE id = ?", rows)
+
+    with conn:
+        for count, event in enumerate(iter_log_events(path), start=1):
+            op = event.get("op")
+            if op == "add":
+                description = (base64.b64decode(event["description_sealed"]) if "description_sealed" in event
+                               else event["description"])
+                row = (event["id"], event["amount"], description, event["currency"],
+                       event["transaction_type"], event["date"], event["tag"])
+                adds += 1
+            elif op == "delete":
+                row = (event["id"],)
+                deletes += 1
+            else:
+                if op == "dropped":
+                    dropped += event.get("count", 0)
+                continue
+            if op != batch_op or len(batch) >= batch_size:
+                if batch:
+                    apply(batch_op, batch)
+                batch_op, batch = op, []
+            batch.append(row)
+            if count % batch_size == 0:
+                conn.commit()
+        if batch:
+            apply(batch_op, batch)
+    return adds, deletes, dropped
+
+
+def _same_row(actual, logged):
+    """Compares a row with its logged state. A sealed description can't be read here, so it isn't compared."""
+    if actual is None or actual[:2] != logged[:2] or actual[3:] != logged[3:]:
+        return False
+    return isinstance(actual[2], bytes) or isinstance(logged[2], bytes) or actual[2] == logged[2]
+
+
+def verify_against_log(conn, path=LOG_FILE):
+    """
+    Rebuilds the ledger from the log in an in-memory database and compares it with
+    `conn`'s transactions. Returns (missing_or_different, not_in_log, dropped):
+    row counts, and the events the writer dropped. With dropped > 0 the log is
+    incomplete, so rows not in it are expected. Sealed descriptions (an
+    encrypted ledger) are not compared.
+    """
+    scratch = sqlite3.connect(":memory:")
+    scratch.execute(
+        "CREATE TABLE transactions (id INTEGER PRIMARY KEY, amount REAL, description TEXT, currency TEXT, "
+        "transaction_type TEXT, date TEXT, tag TEXT)")
+    _, _, dropped = replay_log(scratch, path)
+    logged = {row[0]: row for row in scratch.execute("SELECT * FROM transactions")}
+    scratch.close()
+
+    actual = {row[0]: row for row in conn.execute(
+        "SELECT id, amount, description, currency, transaction_type, date, tag FROM transactions")}
+    missing = sum(1 for transaction_id, row in logged.items() if not _same_row(actual.get(transaction_id), row))
+    not_in_log = sum(1 for transaction_id in actual if transaction_id not in logged)
+    return missing, not_in_log, dropped
@@ -1,9 +1,11 @@
 from kivy.uix.modalview import ModalView
 from kivy.properties import ObjectProperty, StringProperty
 from datetime import datetime
+from utils.currencies import currency_exponent
 
 class AddTransactionPopup(ModalView):
     add_callback = ObjectProperty(None) # Callback function
+    repeat_callback = ObjectProperty(None) # Called with the same fields plus the schedule when Repeat is set
     error_message = StringProperty("")
 
     def submit_transaction(self):
@@ -12,6 +14,7 @@ class AddTransactionPopup(ModalView):
         currency = self.ids.currency_spinner.text
         transaction_type = self.ids.type_spinner.text
         tag = self.ids.tag_input.text.strip() # Get tag input
+        repeat = self.ids.repeat_spinner.text if 'repeat_spinner' in self.ids else "Never"
 
         # Basic Validation
         if not amount_str:
@@ -29,6 +32,12 @@ class AddTransactionPopup(ModalView):
         except ValueError:
             self.error_message = "Amount must be a valid number."
             return
+        # Amounts are stored in whole minor units (cents, paise)
+        exponent = currency_exponent(currency)
+        if round(amount, exponent) != amount:
+            self.error_message = (f"{currency} amounts must be whole numbers." if exponent == 0
+                                  else f"{currency} amounts can have at most {exponent} decimal places.")
+            return
 
         if transaction_type.lower() not in ['credit', 'debit']:
              self.error_message = "Invalid transaction type selected."
@@ -40,4 +49,7 @@ class AddTransactionPopup(ModalView):
         if self.add_callback:
             # Pass data to the callback provided by MainScreen
             self.add_callback(amount, description, currency, transaction_type.lower(), date, tag)
+        if repeat != "Never" and self.repeat_callback:
+            # This occurrence was just added; the rule takes over from the next one
+            self.repeat_callback(amount, description, currency, transaction_type.lower(), date, tag, repeat.lower())
         self.dismiss() # Close the popup
\ No newline at end of file
@@ -0,0 +1,56 @@
+import math
+
+from kivy.uix.modalview import ModalView
+from kivy.properties import ListProperty, StringProperty
+from kivy.clock import mainthread
+from database import upsert_budget, delete_budget_row, BASE_CURRENCY
+from utils.budgets import budget_statuses, BUDGET_EXCEEDED, BUDGET_WARNING
+from utils.ledger_writer import ledger_writer
+
+
+class BudgetPopup(ModalView):
+    """Shows this month's spending against each tag's budget and sets or removes budgets."""
+    tags = ListProperty([]) # Tags offered in the spinner
+    status_lines = ListProperty([]) # One line of text per budget
+    error_message = StringProperty("")
+
+    def on_open(self):
+        self.refresh()
+
+    def refresh(self):
+        lines = []
+        for status in budget_statuses():
+            marker = "  OVER" if status.level == BUDGET_EXCEEDED else ("  !" if status.level == BUDGET_WARNING else "")
+            lines.append(f"{status.tag}: {status.spent:.2f} of {status.limit:.2f} {BASE_CURRENCY} "
+                         f"({100 * status.fraction:.0f}%){marker}")
+        self.status_lines = lines or ["No budgets yet."]
+
+    def save_budget(self, tag, limit_str):
+        if not tag or tag not in self.tags:
+            self.error_message = "Choose a tag."
+            return
+        try:
+            limit = float(limit_str)
+        except ValueError:
+            self.error_message = "Limit must be a valid number."
+            return
+        if not math.isfinite(limit):
+            self.error_message = "Limit must be a valid number."  # float() also accepts 'inf' and 'nan'
+            return
+        if limit <= 0:
+            self.error_message = "Limit must be positive."
+            return
+        self.error_message = ""
+        ledger_writer.submit(lambda cursor: upsert_budget(cursor, tag, limit)).add_done_callback(self._written)
+
+    def remove_budget(self, tag):
+        if tag in self.tags:
+            ledger_writer.submit(lambda cursor: delete_budget_row(cursor, tag)).add_done_callback(self._written)
+
+    @mainthread
+    def _written(self, future):
+        """Shows the new budgets once the ledger writer has committed the change."""
+        error = future.exception()
+        if error is not None:
+            self.error_message = f"Could not save the budget: {error}"
+        self.refresh()
@@ -1,152 +1,210 @@
 from kivy.uix.widget import Widget
-from kivy.properties import ListProperty, NumericProperty, StringProperty, ListProperty
+from kivy.properties import ListProperty, NumericProperty, StringProperty
 from kivy.graphics import Color, Ellipse, Line, Rectangle
 from kivy.metrics import dp
-from math import pi, cos, sin
 from kivy.app import App
 from utils.theme import get_color
-from kivy.graphics import PushMatrix, PopMatrix, Translate, Scale
 from kivy.core.text import Label as CoreLabel
+from collections import OrderedDict
+from utils.instrumentation import timed, count
+
+# Label textures are rendered once in white and tinted with a Color instruction,
+# so the same texture serves both themes. Keyed by (text, font_size).
+_LABEL_TEXTURE_CACHE = OrderedDict()
+LABEL_TEXTURE_CACHE_SIZE = 256
+
+OTHER_LABEL = "Other"
+OTHER_COLOR = (0.6, 0.6, 0.6, 1)
+
+
+def get_label_texture(text, font_size):
+    """Returns a cached white texture for `text`, rendering it on first use."""
+    key = (text, font_size)
+    texture = _LABEL_TEXTURE_CACHE.get(key)
+    if texture is None:
+        count("chart.label_renders")
+        label = CoreLabel(text=text, font_size=font_size, color=(1, 1, 1, 1))
+        label.refresh()
+        texture = label.texture
+        _LABEL_TEXTURE_CACHE[key] = texture
+        if len(_LABEL_TEXTURE_CACHE) > LABEL_TEXTURE_CACHE_SIZE:
+            _LABEL_TEXTURE_CACHE.popitem(last=False)
+    else:
+        _LABEL_TEXTURE_CACHE.move_to_end(key)
+    return texture
+
+
+def default_segment_color(i):
+    """Color cycle for segments without an explicit color."""
+    return ((i * 0.5 + 0.2) % 1.0, (i * 0.3 + 0.7) % 1.0, (i * 0.8 + 0.4) % 1.0, 1)
+
 
 class PieChart(Widget):
     data_values = ListProperty([])  # Values to chart (e.g., [100, 200])
     data_labels = ListProperty([])  # Labels for segments (e.g., ["Income", "Expenses"])
     data_colors = ListProperty([])  # Colors for segments
     inner_radius_ratio = NumericProperty(0.0)  # For donut chart if > 0
+    max_segments = NumericProperty(8)  # Smaller segments beyond this are merged into "Other"
     title = StringProperty('')
-    
+
     def __init__(self, **kwargs):
         super(PieChart, self).__init__(**kwargs)
+        self._segments = []      # (value, label, color) actually drawn
+        self._total = 0
+        self._pie = []           # [(Color, Ellipse)] per segment
+        self._inner = None       # (Color, Ellipse) donut hole
+        self._legend = []        # [(box Color, box Rectangle, text Color, text Rectangle)]
+        self._title = None       # (text Color, text Rectangle)
+        self._empty = None       # (background Rectangle, border Line)
+        self._bound_app = None
         self.bind(
-            pos=self.update_chart,
-            size=self.update_chart,
+            pos=self._update_geometry,
+            size=self._update_geometry,
             data_values=self.update_chart,
-            data_colors=self.update_chart
+            data_labels=self.update_chart,
+            data_colors=self.update_chart,
+            max_segments=self.update_chart,
+            inner_radius_ratio=self.update_chart,
+            title=self._update_geometry,
         )
-    
+
+    def _visible_segments(self):
+        """Pairs values with labels/colors, keeping the largest and merging the rest into "Other"."""
+        segments = []
+        for i, value in enumerate(self.data_values):
+            if value <= 0:
+                continue
+            label = self.data_labels[i] if i < len(self.data_labels) else ""
+            color = tuple(self.data_colors[i]) if i < len(self.data_colors) else default_segment_color(i)
+            segments.append((value, label, color))
+        limit = int(self.max_segments)
+        if limit > 0 and len(segments) > limit:
+            segments.sort(key=lambda segment: segment[0], reverse=True)
+            other = sum(value for value, _, _ in segments[limit - 1:])
+            segments = segments[:limit - 1] + [(other, OTHER_LABEL, OTHER_COLOR)]
+        return segments
+
+    def _text_color(self):
+        """Theme text color, looked up once per redraw (not once per legend entry)."""
+        app = App.get_running_app()
+        if app and hasattr(app, 'theme'):
+            if self._bound_app is not app:
+                # Re-tint the cached textures when the theme changes
+                app.bind(theme=self._update_text_color)
+                self._bound_app = app
+            return get_color(app.theme, "text_color")
+        return (0.9, 0.9, 0.9, 1) if self._is_dark_background() else (0.1, 0.1, 0.1, 1)
+
+    @timed("chart.update_chart")
     def update_chart(self, *args):
+        """Applies new data, rebuilding canvas instructions only if the segment layout changed."""
+        segments = self._visible_segments()
+        same_layout = (
+            segments and len(segments) == len(self._pie)
+            and bool(self._inner) == (self.inner_radius_ratio > 0)
+            and bool(self._legend) == bool(self.data_labels)
+        )
+        self._segments = segments
+        self._total = sum(value for value, _, _ in segments)
+        if same_layout:
+            for (_, _, color), (pie_color, _) in zip(segments, self._pie):
+                pie_color.rgba = color
+            for (_, _, color), (box_color, _, _, _) in zip(segments, self._legend):
+                box_color.rgba = color
+            self._update_geometry()
+            return
+
+        count("chart.rebuilds")
         self.canvas.clear()
-        
-        if not self.data_values or sum(self.data_values) == 0:
-            # Draw empty state or message
+        self._pie = []
+        self._legend = []
+        self._inner = None
+        self._title = None
+        self._empty = None
+
+        if not self._segments:
+            # Draw empty state
             with self.canvas:
                 Color(0.7, 0.7, 0.7, 1)
-                Rectangle(pos=self.pos, size=self.size)
+                background = Rectangle()
                 Color(0.3, 0.3, 0.3, 1)
-                Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
+                border = Line(width=1)
+            self._empty = (background, border)
+            self._update_geometry()
+            return
+
+        text_color = self._text_color()
+        with self.canvas:
+            for _, _, color in self._segments:
+                self._pie.append((Color(*color), Ellipse()))
+            if self.inner_radius_ratio > 0:
+                self._inner = (Color(1, 1, 1, 1), Ellipse())  # Donut hole
+            if self.data_labels:
+                for _, _, color in self._segments:
+                    self._legend.append((Color(*color), Rectangle(), Color(*text_color), Rectangle()))
+            self._title = (Color(*text_color), Rectangle())
+        self._update_geometry()
+
+    @timed("chart.update_geometry")
+    def _update_geometry(self, *args):
+        """Moves and resizes the existing instructions; nothing is reallocated."""
+        if self._empty:
+            background, border = self._empty
+            background.pos = self.pos
+            background.size = self.size
+            border.rectangle = (self.x, self.y, self.width, self.height)
+            return
+        if not self._segments:
             return
 
         # Calculate chart dimensions
-        center_x = self.center_x
-        center_y = self.center_y
         radius = min(self.width, self.height) / 2.5
-        inner_radius = radius * self.inner_radius_ratio
-        
-        # Calculate total for percentages
-        total = sum(self.data_values)
-        
-        # Draw pie segments
+        pie_pos = (self.center_x - radius, self.center_y - radius)
         start_angle = 0
-        for i, value in enumerate(self.data_values):
-            if value <= 0:
-                continue
-                
-            # Calculate angles
-            angle = 360 * (value / total)
-            end_angle = start_angle + angle
-            
-            # Draw segment
-            with self.canvas:
-                # Use provided color or default
-                if i < len(self.data_colors):
-                    Color(*self.data_colors[i])
-                else:
-                    # Default color cycle
-                    Color(
-                        (i * 0.5 + 0.2) % 1.0, 
-                        (i * 0.3 + 0.7) % 1.0, 
-                        (i * 0.8 + 0.4) % 1.0, 
-                        1
-                    )
-                
-                # Draw segment
-                Ellipse(
-                    pos=(center_x - radius, center_y - radius),
-                    size=(radius * 2, radius * 2),
-                    angle_start=start_angle,
-                    angle_end=end_angle
-                )
-                
-                # Draw inner circle for donut if needed
-                if self.inner_radius_ratio > 0:
-                    Color(1, 1, 1, 1)  # Inner circle color
-                    Ellipse(
-                        pos=(center_x - inner_radius, center_y - inner_radius),
-                        size=(inner_radius * 2, inner_radius * 2)
-                    )
-            
-            # Add percentage text at middle of segment
-            mid_angle = start_angle + angle / 2
-            text_radius = radius * 0.7
-            text_x = center_x + text_radius * cos(mid_angle * pi / 180)
-            text_y = center_y + text_radius * sin(mid_angle * pi / 180)
-            
-            # Update angle for next segment
+        for (value, _, _), (_, ellipse) in zip(self._segments, self._pie):
+            end_angle = start_angle + 360 * (value / self._total)
+            ellipse.pos = pie_pos
+            ellipse.size = (radius * 2, radius * 2)
+            ellipse.angle_start = start_angle
+            ellipse.angle_end = end_angle
             start_angle = end_angle
-            
-        # Draw legends if labels are provided
-        if self.data_labels:
-            legend_y = self.y + self.height - dp(20)
-            square_size = dp(15)
-            
-            for i, label in enumerate(self.data_labels):
-                if i >= len(self.data_values) or self.data_values[i] <= 0:
-                    continue
-                    
-                with self.canvas:
-                    # Legend color box
-                    if i < len(self.data_colors):
-                        Color(*self.data_colors[i])
-                    else:
-                        Color((i * 0.5 + 0.2) % 1.0, (i * 0.3 + 0.7) % 1.0, (i * 0.8 + 0.4) % 1.0, 1)
-                        
-                    Rectangle(
-                        pos=(self.x + dp(10), legend_y - square_size),
-                        size=(square_size, square_size)
-                    )
-                    
-                    # Calculate percentage for label
-                    percentage = 100 * self.data_values[i] / total
-                    
-                    # Add label with percentage - Theme aware text color
-                    label_text = f"{label}: {percentage:.1f}%"
-                    label = CoreLabel(text=label_text, font_size=dp(14))
-                    label.refresh()
-                    texture = label.texture
-                    
-                    # Use theme-aware text color instead of fixed black
-                    try:
-                        app = App.get_running_app()
-                        if app and hasattr(app, 'theme'):
-                            text_color = get_color(app.theme, "text_color")
-                            Color(*text_color)
-                        else:
-                            # Fallback if app or theme not available
-                            Color(0.9, 0.9, 0.9, 1) if self._is_dark_background() else Color(0.1, 0.1, 0.1, 1)
-                    except Exception as e:
-                        # Final fallback
-                        print(f"Error getting theme color: {e}")
-                        Color(0.9, 0.9, 0.9, 1)
-                    
-                    Rectangle(
-                        pos=(self.x + dp(10) + square_size + dp(5), legend_y - square_size + (square_size - texture.height) / 2),
-                        size=texture.size,
-                        texture=texture
-                    )
-                
-                # Move to next legend item position
-                legend_y -= square_size + dp(10)
-    
+
+        if self._inner:
+            inner_radius = radius * self.inner_radius_ratio
+            self._inner[1].pos = (self.center_x - inner_radius, self.center_y - inner_radius)
+            self._inner[1].size = (inner_radius * 2, inner_radius * 2)
+
+        # Legend entries stacked from the top-left corner
+        legend_y = self.y + self.height - dp(20)
+        square_size = dp(15)
+        font_size = dp(14)
+        for (value, label, _), (_, box, _, text) in zip(self._segments, self._legend):
+            box.pos = (self.x + dp(10), legend_y - square_size)
+            box.size = (square_size, square_size)
+            texture = get_label_texture(f"{label}: {100 * value / self._total:.1f}%", font_size)
+            text.texture = texture
+            text.size = texture.size
+            text.pos = (self.x + dp(10) + square_size + dp(5), legend_y - square_size + (square_size - texture.height) / 2)
+            # Move to next legend item position
+            legend_y -= square_size + dp(10)
+
+        # Title centered along the top; an empty one is drawn with no size
+        title = self._title[1]
+        if self.title:
+            texture = get_label_texture(self.title, dp(16))
+            title.texture = texture
+            title.size = texture.size
+            title.pos = (self.center_x - texture.width / 2, self.y + self.height - dp(30))
+        else:
+            title.size = (0, 0)
+
+    def _update_text_color(self, *args):
+        text_color = self._text_color()
+        for _, _, color, _ in self._legend:
+            color.rgba = text_color
+        if self._title:
+            self._title[0].rgba = text_color
+
     def _is_dark_background(self):
         """Try to detect if we're on a dark background to decide text color"""
         try:
@@ -159,32 +217,3 @@ class PieChart(Widget):
         except:
             pass
         return False
-        
-    def add_title(self):
-        """Add title to the chart if set"""
-        if not self.title:
-            return
-            
-        with self.canvas:
-            # Use theme-aware text color
-            try:
-                app = App.get_running_app()
-                if app and hasattr(app, 'theme'):
-                    text_color = get_color(app.theme, "text_color")
-                    Color(*text_color)
-                else:
-                    # Fallback if app or theme not available
-                    Color(0.9, 0.9, 0.9, 1) if self._is_dark_background() else Color(0.1, 0.1, 0.1, 1)
-            except:
-                # Final fallback
-                Color(0.1, 0.1, 0.1, 1)
-                
-            title_label = CoreLabel(text=self.title, font_size=dp(16))
-            title_label.refresh()
-            title_texture = title_label.texture
-            
-            Rectangle(
-                pos=(self.center_x - title_texture.width / 2, self.y + self.height - dp(30)),
-                size=title_texture.size,
-                texture=title_texture
-            )
\ No newline at end of file
@@ -0,0 +1,15 @@
+from kivy.uix.modalview import ModalView
+from kivy.properties import ObjectProperty, NumericProperty, ListProperty
+
+
+class TagEditPopup(ModalView):
+    """Asks for the tag to give the selected transactions."""
+    apply_callback = ObjectProperty(None) # Called with the new tag
+    count = NumericProperty(0) # Number of transactions being tagged
+    suggestions = ListProperty([]) # Existing tags, offered as shortcuts
+
+    def submit_tag(self, tag):
+        tag = tag.strip()
+        if self.apply_callback:
+            self.apply_callback(tag or "Uncategorized")
+        self.dismiss()
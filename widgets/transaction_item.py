@@ -1,5 +1,5 @@
 from kivy.uix.boxlayout import BoxLayout
-from kivy.properties import NumericProperty, StringProperty, ObjectProperty
+from kivy.properties import NumericProperty, StringProperty, ObjectProperty, BooleanProperty
 
 class TransactionItem(BoxLayout):
     transaction_id = NumericProperty()
@@ -10,7 +10,13 @@ class TransactionItem(BoxLayout):
     date = StringProperty()
     tag = StringProperty("Uncategorized") # New property for tag
     delete_callback = ObjectProperty(None)
+    selected = BooleanProperty(False) # Ticked for a bulk action
+    select_callback = ObjectProperty(None)
 
     def trigger_delete(self):
         if self.delete_callback:
-            self.delete_callback(self.transaction_id)
\ No newline at end of file
+            self.delete_callback(self.transaction_id)
+
+    def trigger_select(self, selected):
+        if self.select_callback:
+            self.select_callback(self.transaction_id, selected)